@@ -116,12 +116,80 @@ fragSignedColorTexMask1D = '''
         gl_FragColor.rgb = (textureFrag.rgb* (gl_Color.rgb*2.0-1.0)+1.0)/2.0;
     }
     '''
+#PatchStim textures and masks that can be computed for each pixel rather than read from
+#a texture (0 means use the texture). Keep these codes in line with visual._proceduralTex/Masks
+fragProcedural = '''
+    // Fragment program
+    uniform sampler2D texture, mask;
+    uniform int texType, maskType;//1:sin 2:sqr 3:sinXsin 4:sqrXsqr 5:noise 6:binaryNoise 7:gaussNoise, 1:circle 2:gauss 3:radRamp 4:raisedCos
+    uniform float fringeWidth, noiseRes, noiseSeed;
+    void main() {
+        vec4 textureFrag, maskFrag;
+        vec2 st = gl_TexCoord[0].st;
+        float val;
+        if (texType==0) textureFrag = texture2D(texture,st);
+        else {
+            if (texType==1 || texType==2) val = -cos(6.28318531*st.s);
+            else if (texType==3 || texType==4) val = cos(6.28318531*st.s)*cos(6.28318531*st.t);
+            else {//a random value for each of the noiseRes x noiseRes elements in one cycle
+                vec2 cell = floor(st*noiseRes);
+                val = fract(sin(dot(cell, vec2(12.9898,78.233))+noiseSeed)*43758.5453);//uniform 0:1
+                if (texType==5) val = val*2.0-1.0;
+                else if (texType==6) val = sign(val-0.5);
+                else {//Box-Muller with a second uniform value, sd=1/3 and clipped to -1:1
+                    float val2 = fract(sin(dot(cell, vec2(39.3468,11.1353))+noiseSeed)*43758.5453);
+                    val = clamp(sqrt(-2.0*log(max(val, 1.0e-6)))*cos(6.28318531*val2)/3.0, -1.0, 1.0);
+                }
+            }
+            if (texType==2 || texType==4) val = clamp(val/fwidth(val), -1.0, 1.0);//antialiased edges
+            textureFrag = vec4(val, val, val, 1.0);
+        }
+        if (maskType==0) maskFrag = texture2D(mask,gl_TexCoord[1].st);
+        else {
+            float radius = length(gl_TexCoord[1].st*2.0-1.0);
+            if (maskType==1) val = clamp((1.0-radius)/fwidth(radius)+0.5, 0.0, 1.0);
+            else if (maskType==2) val = exp(-radius*radius*4.5);//sd=1/3
+            else if (maskType==3) val = max(1.0-radius, 0.0);
+            else if (radius<1.0-fringeWidth) val = 1.0;
+            else if (radius>1.0) val = 0.0;
+            else val = 0.5+0.5*cos(3.14159265*(radius-1.0+fringeWidth)/fringeWidth);
+            maskFrag = vec4(1.0, 1.0, 1.0, val);
+        }
+        gl_FragColor.a = gl_Color.a*maskFrag.a*textureFrag.a;
+        //
+        gl_FragColor.rgb = (textureFrag.rgb* (gl_Color.rgb*2.0-1.0)+1.0)/2.0;
+    }
+    '''
+#RadialStim computes its polar texture coords for each pixel, from xy in -1:1
+#(gl_TexCoord[0]) across a single quad. Angles go clockwise from the top (+y)
+fragRadial = '''
+    // Fragment program
+    uniform sampler2D texture;
+    uniform sampler1D mask;
+    uniform float angularCycles, angularPhase, radialCycles, radialPhase, maskRadialPhase;
+    uniform vec2 wedge;//start and end of the visible wedge (radians)
+    void main() {
+        vec2 xy = gl_TexCoord[0].st;
+        float radius = length(xy);
+        float angle = atan(xy.x, xy.y);
+        if (angle<0.0) angle += 6.28318531;
+        if (radius>1.0 || angle<wedge.x || angle>wedge.y) discard;
+        vec2 texCoord = vec2(angle*angularCycles/6.28318531 + angularPhase,
+                             0.25 + radius*radialCycles - radialPhase);
+        vec4 textureFrag = texture2D(texture,texCoord);
+        vec4 maskFrag = texture1D(mask,radius+maskRadialPhase);
+        gl_FragColor.a = gl_Color.a*maskFrag.a*textureFrag.a;
+        //
+        gl_FragColor.rgb = (textureFrag.rgb* (gl_Color.rgb*2.0-1.0)+1.0)/2.0;
+    }
+    '''
+#the texture matrices are identity unless a stim uses them (e.g. PatchStim phase and sf)
 vertSimple = """
     void main() {
             gl_FrontColor = gl_Color;
-            gl_TexCoord[0] = gl_MultiTexCoord0;
-            gl_TexCoord[1] = gl_MultiTexCoord1;
-            gl_TexCoord[2] = gl_MultiTexCoord2;
+            gl_TexCoord[0] = gl_TextureMatrix[0] * gl_MultiTexCoord0;
+            gl_TexCoord[1] = gl_TextureMatrix[1] * gl_MultiTexCoord1;
+            gl_TexCoord[2] = gl_TextureMatrix[2] * gl_MultiTexCoord2;
             gl_Position =  ftransform();
     }
     """
@@ -9,11 +9,13 @@ import psychopy
 import cPickle, string, sys, platform, os, time, copy, csv
 import numpy
 from scipy import optimize, special
-from matplotlib import mlab    #used for importing csv files
 from contrib.quest import *    #used for QuestHandler
 import inspect #so that Handlers can find the script that called them
 import codecs, locale
 import weakref
+import threading, Queue, atexit
+import zipfile, struct
+import ast, hashlib, glob #for importConditions
 
 try:
     import openpyxl
@@ -44,7 +46,10 @@ class ExperimentHandler(object):
                 originPath=None,
                 savePickle=True,
                 saveWideText=True,
-                dataFileName=''):
+                dataFileName='',
+                streamWideText=False,
+                flushRows=10,
+                flushSecs=1.0):
         """
         :parameters:
 
@@ -73,6 +78,20 @@ class ExperimentHandler(object):
                 The handler will attempt to populate the file even in the
                 event of a (not too serious) crash!
 
+            streamWideText : True or **False**
+                If True (and a dataFileName was given) then each entry is
+                written to the wide-format text file (dataFileName+'.csv')
+                by a background thread as soon as nextEntry() is called,
+                rather than being kept in memory until the end of the run.
+                The file is flushed every `flushRows` entries or `flushSecs`
+                seconds (whichever comes first) and synced to disk whenever
+                a loop ends, so a crash loses at most the last few trials.
+                New columns can appear at any point: the full, ordered list
+                of columns is kept in a sidecar file (dataFileName+'.csv.columns')
+                until the handler is closed, when the header of the csv file
+                is completed. Entries aren't kept in `self.entries`, so memory
+                use doesn't grow with the length of the session.
+
         """
         self.loops=[]
         self.loopsUnfinished=[]
@@ -88,18 +107,66 @@ class ExperimentHandler(object):
         self.saveWideText=saveWideText
         self.dataFileName=dataFileName
         self.thisEntry = {}
-        self.entries=[]#chronological list of entries
+        self._store=_EntryStore()#the entries, stored by column (see `entries`)
         self._paramNamesSoFar=[]
+        self._paramNamesSet=set()#for quick membership tests
+        self._loopAttrNames={}#id(loop):[(attr, attrName)...] for _getLoopInfo
         self.dataNames=[]#names of all the data (eg. resp.keys)
+        self._streamWriter=None
         if dataFileName in ['', None]:
             logging.warning('ExperimentHandler created with no dataFileName parameter. No data will be saved in the event of a crash')
+        elif streamWideText:
+            self._streamWriter = _StreamWriter(dataFileName+'.csv', flushRows=flushRows, flushSecs=flushSecs)
+            self.saveWideText=False#the entries are already in the file
     def __del__(self):
         if self.dataFileName not in ['', None]:
             logging.debug('Saving data for %s ExperimentHandler' %self.name)
+            self.closeStream()
             if self.savePickle==True:
                 self.saveAsPickle(self.dataFileName)
             if self.saveWideText==True:
                 self.saveAsWideText(self.dataFileName)
+    def __getstate__(self):
+        #the stream writer (a thread and open file) can't be pickled
+        state = self.__dict__.copy()
+        state['_streamWriter'] = None
+        return state
+    def __setstate__(self, state):
+        entries = state.pop('entries', [])
+        self.__dict__.update(state)
+        if '_store' not in state:#pickled by an older version (with a list of entries)
+            self._store=_EntryStore()
+            for entry in entries:
+                self._store.append(entry)
+            self._paramNamesSet=set(self._paramNamesSoFar)
+            self._loopAttrNames={}
+            self._streamWriter=None
+    @property
+    def entries(self):
+        """A chronological list of the entries so far, each a dict of name:value.
+
+        The entries are stored by column, so this list is a copy created when
+        asked for: changing it (or the dicts in it) doesn't change the stored
+        entries. To change them, assign a whole new list, e.g.::
+
+            entries = exp.entries
+            entries.append({'note':'extra row'})
+            exp.entries = entries
+        """
+        return [self._store.getEntry(rowN) for rowN in range(self._store.nRows)]
+    @entries.setter
+    def entries(self, entries):
+        self._store=_EntryStore()
+        for entry in entries:
+            self._store.append(entry)
+    def closeStream(self):
+        """Finish writing the entries streamed to file (if streamWideText=True),
+        completing the header of the file. Called automatically when the
+        handler is deleted.
+        """
+        if self._streamWriter is not None:
+            writer, self._streamWriter = self._streamWriter, None
+            writer.close()
     def addLoop(self, loopHandler):
         """Add a loop such as a `~psychopy.data.TrialHandler` or `~psychopy.data.StairHandler`
         Data from this loop will be included in the resulting data files.
@@ -117,6 +184,8 @@ class ExperimentHandler(object):
         """
         if loopHandler in self.loopsUnfinished:
             self.loopsUnfinished.remove(loopHandler)
+        if self._streamWriter is not None:
+            self._streamWriter.sync()#a good moment to make sure it's on disk
     def _getAllParamNames(self):
         """Returns the attribute names of loop parameters (trialN etc)
         that the current set of loops contain, ready to build a wide-format
@@ -144,25 +213,28 @@ class ExperimentHandler(object):
         Does not return data inputs from the subject, only info relating to the trial
         execution.
         """
-        names=[]
-        vals=[]
         name = loop.name
-        #standard attributes
-        for attr in ['thisRepN', 'thisTrialN', 'thisN','thisIndex', 'stepSizeCurrent']:
-            if hasattr(loop, attr):
-                if attr=='stepSizeCurrent':
-                    attrName=name+'.stepSize'
-                else:
-                    attrName = name+'.'+attr
-                #append the attribute name and the current value
-                names.append(attrName)
-                vals.append(getattr(loop,attr))
+        #standard attributes (which a loop either has or hasn't, so the names are worked out once)
+        attrNames = self._loopAttrNames.get(id(loop))
+        if attrNames is None:
+            attrNames = self._loopAttrNames[id(loop)] = []
+            for attr in ['thisRepN', 'thisTrialN', 'thisN','thisIndex', 'stepSizeCurrent']:
+                if hasattr(loop, attr):
+                    if attr=='stepSizeCurrent':
+                        attrName=name+'.stepSize'
+                    else:
+                        attrName = name+'.'+attr
+                    attrNames.append((attr, attrName))
+        names=[attrName for attr, attrName in attrNames]
+        vals=[getattr(loop, attr) for attr, attrName in attrNames]
 
         trial = loop.thisTrial
         paramNames=[]
         if hasattr(trial,'items'):#is a TrialList object or a simple dict
             for attr,val in trial.items():
-                if attr not in self._paramNamesSoFar: self._paramNamesSoFar.append(attr)
+                if attr not in self._paramNamesSet:
+                    self._paramNamesSoFar.append(attr)
+                    self._paramNamesSet.add(attr)
                 paramNames.append(attr)
                 vals.append(val)
         elif trial==[]:#we haven't had 1st trial yet? Not actually sure why this occasionally happens (JWP)
@@ -208,10 +280,15 @@ class ExperimentHandler(object):
             names, vals = self._getLoopInfo(thisLoop)
             for n, name in enumerate(names):
                 this[name]=vals[n]
-        #add the extraInfo dict to the data
-        if type(self.extraInfo)==dict:
-            this.update(self.extraInfo)#NB update() really means mergeFrom()
-        self.entries.append(this)
+        if self._streamWriter is not None:
+            #add the extraInfo dict to the data
+            if type(self.extraInfo)==dict:
+                this.update(self.extraInfo)#NB update() really means mergeFrom()
+            self._streamWriter.write(this)
+        elif type(self.extraInfo)==dict:
+            self._store.append(this, constants=self.extraInfo)#extraInfo is stored once, not per entry
+        else:
+            self._store.append(this)
         #then create new empty entry for n
         self.thisEntry = {}
     def saveAsWideText(self, fileName, delim=',',
@@ -249,16 +326,43 @@ class ExperimentHandler(object):
             for heading in names:
                 f.write(u'%s%s' %(heading,delim))
             f.write('\n')
-        #write the data for each entry
-        for entry in self.entries:
-            for name in names:
-                if name in entry.keys():
-                    f.write(u'%s%s' %(entry[name],delim))
-                else:
-                    f.write(delim)
-            f.write('\n')
+        #write the data, converting each column to text in one go
+        columns={}
+        for name in names:
+            if name not in columns:
+                columns[name]=self._store.getStrings(name)
+        columns = [columns[name] for name in names]
+        nRows = self._store.nRows
+        for start in range(0, nRows, 10000):#a block of lines at a time
+            if columns:
+                lines = [delim.join(fields) for fields in zip(*[col[start:start+10000] for col in columns])]
+                f.write((delim+'\n').join(lines)+delim+'\n')
+            else:
+                f.write('\n'*min(10000, nRows-start))
         f.close()
         self.saveWideText=False
+    def saveAsColumns(self, fileName, compressed=False, fileCollisionMethod='rename'):
+        """Save the entries column-wise in a binary file (a numpy .npz file),
+        which is much smaller and quicker to save and load than text or a pickle.
+
+        The columns are those of :meth:`~ExperimentHandler.saveAsWideText`. Ints
+        and floats keep their type, other values are saved as text. Use
+        :func:`~psychopy.data.loadColumns` to read the file (or selected
+        columns from many such files) back in.
+
+        :Parameters:
+
+            compressed: True or **False**
+                Compress each column (smaller files, but the columns can't then
+                be memory-mapped when they're loaded)
+
+            fileCollisionMethod: Collision method passed to ~psychopy.misc._handleFileCollision
+        """
+        names = self._getAllParamNames()
+        names.extend(self.dataNames)
+        names.extend(self._getExtraInfo()[0])
+        _saveColumns(fileName, self._store, names, compressed=compressed,
+            fileCollisionMethod=fileCollisionMethod)
     def saveAsPickle(self,fileName, fileCollisionMethod = 'rename'):
         """Basically just saves a copy of self (with data) to a pickle file.
 
@@ -286,10 +390,397 @@ class ExperimentHandler(object):
 
         Experiment handler will attempt automatically to save data (even in the event of a crash if possible).
         So if you quit your script early you may want to tell the Handler not to save out the data files for this run.
-        This is the method that allows you to do that.
+        This is the method that allows you to do that. (Entries that have
+        already been streamed to file with streamWideText=True are kept.)
         """
         self.savePickle=False
         self.saveWideText=False
+        self.closeStream()
+
+class _StreamWriter:
+    """Appends entries (dicts) to a wide-format text file from a background
+    thread, for ExperimentHandler(streamWideText=True).
+
+    Columns are in the order that they first appear. The header line holds the
+    columns known at the first entry and `fileName+'.columns'` always holds the
+    full list (rewritten whenever a new column appears), so the file can be
+    read after a crash. close() rewrites the file with the full header if
+    columns were added after the first entry.
+
+    An error in the background thread (e.g. a value that can't be written) is
+    raised again by the next call to write(), sync() or close().
+    """
+    def __init__(self, fileName, delim=',', flushRows=10, flushSecs=1.0):
+        self.fileName=fileName
+        self.delim=delim
+        self.flushRows=flushRows
+        self.flushSecs=flushSecs
+        self.columns=[]
+        self._columnSet=set()
+        self._headerColumns=None#the columns in the header line
+        self._widths=[]#(rowN, nColumns) each time the number of columns changed
+        self._nRows=0
+        self._closed=False
+        self._error=None#sys.exc_info() of an error in the thread, to raise in the caller's
+        if os.path.exists(fileName):
+            logging.warning('Data file, %s, will be overwritten' %fileName)
+        self._file=codecs.open(fileName, 'w', encoding='utf-8')
+        self._queue=Queue.Queue()
+        self._thread=threading.Thread(target=self._run, name='ExperimentHandler writer')
+        self._thread.daemon=True
+        self._thread.start()
+        atexit.register(self.close)#daemon threads don't get to finish on their own
+    def write(self, entry):
+        """Queue an entry (a dict) to be written"""
+        self._raiseError()
+        self._queue.put(entry)
+    def sync(self):
+        """Wait until everything queued so far is written and on disk"""
+        done = threading.Event()
+        self._queue.put(done)
+        while not done.wait(0.5):
+            if not self._thread.is_alive():
+                break
+        self._raiseError()
+        if not done.isSet():
+            raise IOError, 'The thread writing %s has stopped' %self.fileName
+    def close(self):
+        if self._closed:
+            return
+        self._closed=True
+        self._queue.put(None)
+        self._thread.join()
+        self._raiseError()
+    def _raiseError(self):
+        if self._error is not None:
+            excType, excValue, excTraceback = self._error
+            self._error=None#only raise it once
+            raise excType, excValue, excTraceback
+    def _run(self):
+        nUnflushed=0
+        lastFlush=time.time()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flushSecs)
+            except Queue.Empty:
+                item = 'timeout'
+            try:
+                if isinstance(item, dict):
+                    nUnflushed+=1
+                    self._writeEntry(item)
+                elif item is None:
+                    self._file.close()
+                    self._finalise()
+                elif isinstance(item, threading._Event):
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    nUnflushed=0; lastFlush=time.time()
+                if nUnflushed and (nUnflushed>=self.flushRows or time.time()-lastFlush>=self.flushSecs):
+                    self._file.flush()
+                    nUnflushed=0; lastFlush=time.time()
+            except Exception:
+                #keep the thread going (so sync() and close() return) and
+                #hand the error to the caller
+                logging.error('Failed to write data to %s' %self.fileName)
+                if self._error is None:
+                    self._error=sys.exc_info()
+            if isinstance(item, threading._Event):
+                item.set()
+            if item is None:
+                break
+    def _writeEntry(self, entry):
+        newNames = [name for name in entry if name not in self._columnSet]
+        if newNames:
+            newNames.sort()#dicts have no order, so at least make it repeatable
+            self.columns.extend(newNames)
+            self._columnSet.update(newNames)
+            self._writeColumns()
+            self._widths.append((self._nRows, len(self.columns)))
+        delim=self.delim
+        if self._headerColumns is None:
+            self._headerColumns=list(self.columns)
+            self._file.write(u''.join([u'%s%s' %(name,delim) for name in self.columns])+u'\n')
+        line = [(_unicode(entry[name])+delim) if name in entry else delim for name in self.columns]
+        self._file.write(u''.join(line)+u'\n')
+        self._nRows+=1
+    def _writeColumns(self):
+        #write to a temp file and rename, so a crash can't leave half a list
+        tmpName = self.fileName+'.columns.tmp'
+        f = codecs.open(tmpName, 'w', encoding='utf-8')
+        f.write(u'\n'.join([u'%s' %name for name in self.columns])+u'\n')
+        f.close()
+        if os.path.exists(self.fileName+'.columns'):
+            os.remove(self.fileName+'.columns')#needed on windows
+        os.rename(tmpName, self.fileName+'.columns')
+    def _finalise(self):
+        """Give the file the full header (padding the early rows), if needed,
+        after which the columns file isn't needed
+        """
+        if os.path.exists(self.fileName+'.columns'):
+            os.remove(self.fileName+'.columns')
+        if self._headerColumns is None or len(self._headerColumns)==len(self.columns):
+            return
+        tmpName = self.fileName+'.tmp'
+        src = codecs.open(self.fileName, 'r', encoding='utf-8')
+        dst = codecs.open(tmpName, 'w', encoding='utf-8')
+        src.readline()#the old header
+        dst.write(u''.join([u'%s%s' %(name,self.delim) for name in self.columns])+u'\n')
+        widths = self._widths+[(self._nRows, None)]
+        for (startRow, nColumns), (endRow, nextN) in zip(widths[:-1], widths[1:]):
+            padding = self.delim*(len(self.columns)-nColumns)
+            for rowN in range(startRow, endRow):
+                dst.write(src.readline().rstrip(u'\r\n')+padding+u'\n')
+        src.close(); dst.close()
+        os.remove(self.fileName)
+        os.rename(tmpName, self.fileName)
+
+class _Column:
+    """One column of an _EntryStore. Ints or floats are kept in a numpy array,
+    other hashable values (e.g. strings) as codes into a table of the unique
+    values, and anything else in a list. `present` is False for missing rows.
+    """
+    def __init__(self, capacity):
+        self.kind=None#'i', 'f', 's' (codes into self.table), 'O' or None (no values yet)
+        self.data=None
+        self.present=numpy.zeros(capacity, bool)
+    def resize(self, capacity):
+        self.present=_resized(self.present, capacity)
+        if self.kind=='O':
+            self.data.extend([None]*(capacity-len(self.data)))
+        elif self.kind is not None:
+            self.data=_resized(self.data, capacity)
+    def set(self, row, val):
+        kind=_columnKind(val)
+        if kind!=self.kind and self.kind!='O':
+            self._convert(kind)
+        if self.kind=='s':
+            code = self._codes.get(val)
+            if code is None:
+                code = self._codes[val] = len(self.table)
+                self.table.append(val)
+            self.data[row]=code
+        else:
+            self.data[row]=val
+        self.present[row]=True
+    def get(self, row):
+        if self.kind=='s':
+            return self.table[self.data[row]]
+        elif self.kind=='O':
+            return self.data[row]
+        return self.data[row].item()#as a python int/float
+    def _convert(self, kind):
+        capacity=len(self.present)
+        if self.kind is None and kind=='s':
+            self.data=numpy.zeros(capacity, numpy.int32)
+            self.table=[]
+            self._codes={}
+        elif self.kind is None and kind in ['i','f']:
+            self.data=numpy.zeros(capacity, {'i':numpy.int64, 'f':numpy.float64}[kind])
+        else:#mixed types (e.g. ints and floats, which would print differently) need a list
+            if self.kind is None: old=[None]*capacity
+            elif self.kind=='s': old=[self.table[code] for code in self.data]
+            else: old=self.data.tolist()
+            self.data=old
+            self.table=self._codes=None
+            kind='O'
+        self.kind=kind
+    def strings(self, nRows):
+        """The values of the first nRows as unicode, u'' where missing"""
+        if self.kind is None:
+            return [u'']*nRows
+        if self.kind=='s':
+            #the table of unique values only needs converting once, u'' for missing (code -1)
+            table = numpy.array([_unicode(val) for val in self.table]+[u''], 'O')
+            codes = numpy.where(self.present[:nRows], self.data[:nRows], -1)
+            return table[codes].tolist()
+        if self.kind=='O':
+            vals = numpy.empty(nRows, 'O')
+            vals[:] = [_unicode(val) for val in self.data[:nRows]]
+        else:
+            vals = numpy.array(map(unicode, self.data[:nRows].tolist()), 'O')
+        vals[~self.present[:nRows]] = u''
+        return vals.tolist()
+
+def _columnKind(val):
+    thisType=type(val)
+    if thisType in [int, long] and -2**63<=val<2**63: return 'i'#(not bool, which prints differently)
+    if thisType==float: return 'f'
+    try:
+        hash(val)
+    except TypeError:
+        return 'O'
+    return 's'
+
+def _resized(arr, capacity):
+    new = numpy.zeros(capacity, arr.dtype)
+    new[:len(arr)] = arr[:capacity]
+    return new
+
+class _EntryStore:
+    """Column-wise storage for the entries of an ExperimentHandler: one
+    _Column per name, grown by doubling, rather than a dict per entry.
+    Values that are the same for every entry (the extraInfo) are kept once,
+    as `constants`, along with the row from which they apply.
+    """
+    def __init__(self):
+        self.nRows=0
+        self._capacity=0
+        self.columns={}
+        self.constants={}#name:(value, firstRow)
+    def append(self, entry, constants=None):
+        if self.nRows==self._capacity:
+            self._capacity = max(64, self._capacity*2)
+            for column in self.columns.values():
+                column.resize(self._capacity)
+        if constants is not None:
+            self.setConstants(constants)
+        row=self.nRows
+        for name, val in entry.iteritems():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = _Column(self._capacity)
+            column.set(row, val)
+        self.nRows+=1
+    def setConstants(self, constants):
+        """Values applying to all rows from now on. If one changes, its old
+        value is copied into an ordinary column for the rows it applied to
+        """
+        for name, (val, firstRow) in self.constants.items():
+            if name in constants and _same(constants[name], val):
+                continue
+            if name not in self.columns:
+                self.columns[name] = _Column(self._capacity)
+            for row in range(firstRow, self.nRows):
+                self.columns[name].set(row, val)
+            del self.constants[name]
+        for name, val in constants.iteritems():
+            if name not in self.constants:
+                self.constants[name] = (val, self.nRows)
+    def getEntry(self, row):
+        entry={}
+        for name, column in self.columns.iteritems():
+            if column.present[row]:
+                entry[name] = column.get(row)
+        for name, (val, firstRow) in self.constants.iteritems():
+            if row>=firstRow:
+                entry[name] = val
+        return entry
+    def getStrings(self, name):
+        """The values for `name` in every row, as unicode (u'' where missing)"""
+        if name in self.columns:
+            strings = self.columns[name].strings(self.nRows)
+        else:
+            strings = [u'']*self.nRows
+        if name in self.constants:
+            val, firstRow = self.constants[name]
+            strings[firstRow:] = [_unicode(val)]*(self.nRows-firstRow)
+        return strings
+
+    def getArrays(self, name):
+        """The values for `name` as typed numpy arrays: {'values':, 'mask':} (mask
+        is True where missing) for ints, floats and other values (as text) or
+        {'codes':, 'table':} for repeated values such as strings, where
+        table[codes] gives the values as text and codes are -1 where missing.
+        """
+        nRows = self.nRows
+        column = self.columns.get(name)
+        if name in self.constants:
+            val, firstRow = self.constants[name]
+            if column is None:
+                codes = numpy.where(numpy.arange(nRows)>=firstRow, 0, -1).astype(numpy.int32)
+                return {'codes':codes, 'table':_textArray([val])}
+            mask = ~column.present[:nRows]
+            mask[firstRow:] = False
+            return {'values':_textArray(self.getStrings(name)), 'mask':mask}
+        if column is None or column.kind is None:
+            return {'values':numpy.zeros(nRows), 'mask':numpy.ones(nRows, bool)}
+        mask = ~column.present[:nRows]
+        if column.kind=='s':
+            return {'codes':numpy.where(mask, -1, column.data[:nRows]).astype(numpy.int32),
+                'table':_textArray(column.table)}
+        elif column.kind=='O':
+            return {'values':_textArray(column.strings(nRows)), 'mask':mask}
+        return {'values':column.data[:nRows].copy(), 'mask':mask}
+
+def _textArray(vals):
+    """A numpy unicode array of the values as text"""
+    if not len(vals):
+        return numpy.zeros(0, 'U1')
+    return numpy.array([_unicode(val) for val in vals], 'U')
+
+def _unicode(val):
+    """The value as unicode text, decoding byte strings as utf-8"""
+    if isinstance(val, str):
+        return val.decode('utf-8', 'replace')
+    return unicode(val)
+
+def _same(a, b):
+    try:
+        return bool(a==b)
+    except Exception:#e.g. numpy arrays
+        return a is b
+
+def _saveColumns(fileName, store, names, compressed=False, fileCollisionMethod='rename'):
+    """Save the named columns of an _EntryStore to a .npz file.
+
+    '_names' holds the column names and '_nRows' the number of rows. Column i
+    is stored as 'col<i>.values' and 'col<i>.mask' (True where an entry had no
+    value) or, for repeated values such as strings, as 'col<i>.codes' and
+    'col<i>.table' (the values are table[codes], and codes are -1 where missing).
+    Each array is a separate member of the file, so a column can be read (or
+    memory-mapped) without reading the others.
+    """
+    if not fileName.endswith('.npz'):
+        fileName+='.npz'
+    if os.path.exists(fileName):
+        fileName = misc._handleFileCollision(fileName, fileCollisionMethod)
+    uniqueNames=[]
+    for name in names:
+        if name not in uniqueNames: uniqueNames.append(name)
+    arrays = {'_names':_textArray(uniqueNames), '_nRows':numpy.array(store.nRows)}
+    for colN, name in enumerate(uniqueNames):
+        for key, arr in store.getArrays(name).items():
+            arrays['col%i.%s' %(colN, key)] = arr
+    if compressed:
+        numpy.savez_compressed(fileName, **arrays)
+    else:
+        numpy.savez(fileName, **arrays)
+    logging.info('saved data columns to %s' %fileName)
+
+def _readNpzArray(npz, fileName, key, mmap=True):
+    """Read one array from an open .npz file, memory-mapped if possible (if
+    it was stored without compression and isn't an object array)
+    """
+    info = npz.zip.getinfo(key+'.npy')
+    if mmap and info.compress_type==zipfile.ZIP_STORED:
+        f = open(fileName, 'rb')
+        #the array data follows the zip entry's local header and the .npy header
+        f.seek(info.header_offset)
+        nameLen, extraLen = struct.unpack('<HH', f.read(30)[26:30])
+        f.seek(info.header_offset+30+nameLen+extraLen)
+        version = numpy.lib.format.read_magic(f)
+        if version==(1,0):
+            shape, fortranOrder, dtype = numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortranOrder, dtype = numpy.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        f.close()
+        if not dtype.hasobject and numpy.prod(shape)>0:
+            return numpy.memmap(fileName, dtype=dtype, mode='r', offset=offset,
+                shape=shape, order={True:'F', False:'C'}[fortranOrder])
+    return npz[key]
+
+def _readColumn(npz, fileName, colN, mmap=True):
+    """Read column colN of a file from saveAsColumns as a masked array"""
+    prefix = 'col%i.' %colN
+    if prefix+'codes' in npz.files:
+        codes = _readNpzArray(npz, fileName, prefix+'codes', mmap)
+        table = npz[prefix+'table']
+        table = numpy.concatenate([table, numpy.zeros(1, table.dtype)])#so that code -1 is blank
+        return numpy.ma.MaskedArray(table[codes], mask=(codes==-1))
+    values = _readNpzArray(npz, fileName, prefix+'values', mmap)
+    mask = _readNpzArray(npz, fileName, prefix+'mask', mmap)
+    return numpy.ma.MaskedArray(values, mask=mask, copy=False)
 
 class TrialType(dict):
     """This is just like a dict, except that you can access keys with obj.key
@@ -427,6 +918,8 @@ class TrialHandler(_BaseTrialHandler):
 
             trialList: a simple list (or flat array) of dictionaries specifying conditions
                 This can be imported from an excel/csv file using :func:`~psychopy.data.importConditions`
+                or, for very long lists, can be a :class:`~psychopy.data.ConditionsSource`
+                (which reads each condition from its file only when it's needed)
 
             nReps: number of repeats for all conditions
 
@@ -487,9 +980,11 @@ class TrialHandler(_BaseTrialHandler):
         else:
             self.trialList =trialList
         #convert any entry in the TrialList into a TrialType object (with obj.key or obj[key] access)
-        for n, entry in enumerate(trialList):
-            if type(entry)==dict:
-                trialList[n]=TrialType(entry)
+        #(a ConditionsSource creates its TrialTypes as they're needed)
+        if not isinstance(self.trialList, ConditionsSource):
+            for n, entry in enumerate(self.trialList):
+                if type(entry)==dict:
+                    self.trialList[n]=TrialType(entry)
         self.nReps = int(nReps)
         self.nTotal = self.nReps*len(self.trialList)
         self.nRemaining =self.nTotal #subtract 1 each trial
@@ -584,7 +1079,10 @@ class TrialHandler(_BaseTrialHandler):
         specify sequential order; any order is possible this way.
         """
         # create indices for a single rep
-        indices = numpy.asarray(self._makeIndices(self.trialList), dtype=int)
+        if isinstance(self.trialList, ConditionsSource):
+            indices = numpy.arange(len(self.trialList)).reshape(-1,1)#(as _makeIndices would give)
+        else:
+            indices = numpy.asarray(self._makeIndices(self.trialList), dtype=int)
 
         if self.method == 'random':
             sequenceIndices = []
@@ -612,26 +1110,27 @@ class TrialHandler(_BaseTrialHandler):
 
         Useful for shuffling and then using as a reference.
         """
-        inputArray  = numpy.asarray(inputArray, 'O')#make sure its an array of objects (can be strings etc)
+        if isinstance(inputArray, ConditionsSource):
+            dims=(len(inputArray),)#(without reading every condition)
+        else:
+            dims=numpy.asarray(inputArray, 'O').shape#make sure its an array of objects (can be strings etc)
         #get some simple variables for later
-        dims=inputArray.shape
         dimsProd=numpy.product(dims)
         dimsN = len(dims)
         dimsList = range(dimsN)
         listOfLists = []
-        arrayOfTuples = numpy.ones(dimsProd, 'O')#this creates space for an array of any objects
 
         #for each dimension create list of its indices (using modulo)
         for thisDim in dimsList:
             prevDimsProd = numpy.product(dims[:thisDim])
-            thisDimVals = numpy.arange(dimsProd)/prevDimsProd % dims[thisDim] #NB this means modulus in python
-            listOfLists.append(thisDimVals)
+            thisDimVals = numpy.arange(dimsProd)//prevDimsProd % dims[thisDim] #NB this means modulus in python
+            listOfLists.append(thisDimVals.tolist())
 
-        #convert to array
-        indexArr = numpy.asarray(listOfLists)
-        for n in range(dimsProd):
-            arrayOfTuples[n] = tuple((indexArr[:,n]))
-        return (numpy.reshape(arrayOfTuples,dims)).tolist()
+        #zip the dimensions into tuples in one go, then nest them into the shape of the input
+        arrayOfTuples = zip(*listOfLists)
+        for dimLength in reversed(dims[1:]):
+            arrayOfTuples = [arrayOfTuples[n:n+dimLength] for n in range(0, len(arrayOfTuples), dimLength)]
+        return arrayOfTuples
 
     def next(self):
         """Advances to next trial and returns it.
@@ -823,10 +1322,11 @@ class TrialHandler(_BaseTrialHandler):
         #loop through stimuli, writing data
         for stimN in range(len(self.trialList)):
             #first the params for this stim (from self.trialList)
+            thisTrial = self.trialList[stimN]#once per row (a ConditionsSource reads it from file)
             for heading in stimOut:
-                thisType = type(self.trialList[stimN][heading])
-                if thisType==float: f.write('%.4f%s' %(self.trialList[stimN][heading],delim))
-                else: f.write('%s%s' %(self.trialList[stimN][heading],delim))
+                thisType = type(thisTrial[heading])
+                if thisType==float: f.write('%.4f%s' %(thisTrial[heading],delim))
+                else: f.write('%s%s' %(thisTrial[heading],delim))
 
             #then the data for this stim (from self.data)
             for thisDataOut in dataOut:
@@ -953,10 +1453,11 @@ class TrialHandler(_BaseTrialHandler):
                 nextEntry["TrialNumber"] = trialCount
 
                 # now collect the value from each trial of the variables named in the header:
+                thisTrial = self.trialList[trialTypeIndex]#once per trial (a ConditionsSource reads it from file)
                 for parameterName in header:
                     # the header includes both trial and data variables, so need to check before accessing:
-                    if self.trialList[trialTypeIndex].has_key(parameterName):
-                        nextEntry[parameterName] = self.trialList[trialTypeIndex][parameterName]
+                    if thisTrial.has_key(parameterName):
+                        nextEntry[parameterName] = thisTrial[parameterName]
                     elif self.data.has_key(parameterName):
                         nextEntry[parameterName] = self.data[parameterName][trialTypeIndex][repThisType]
                     else: # allow a null value if this parameter wasn't explicitly stored on this trial:
@@ -990,6 +1491,58 @@ class TrialHandler(_BaseTrialHandler):
             f.close()
             logging.info('saved wide-format data to %s' %f.name)
 
+    def saveAsColumns(self, fileName, compressed=False, fileCollisionMethod='rename'):
+        """Save the trials column-wise in a binary file (a numpy .npz file), with
+        the same rows and columns as :meth:`~TrialHandler.saveAsWideText` but
+        keeping ints and floats as numbers. This is much smaller and quicker
+        to load than text or a pickle; use :func:`~psychopy.data.loadColumns`
+        to read it (or selected columns from many such files).
+
+        :Parameters:
+
+            compressed: True or **False**
+                Compress each column (smaller files, but the columns can't then
+                be memory-mapped when they're loaded)
+
+            fileCollisionMethod: Collision method passed to ~psychopy.misc._handleFileCollision
+        """
+        if self.thisTrialN<1 and self.thisRepN<1:#if both are <1 we haven't started
+            logging.info('TrialHandler.saveAsColumns called but no trials completed. Nothing saved')
+            return -1
+        store=_EntryStore()
+        paramNames=[]
+        for trialType in self.trialList:
+            if trialType is not None:
+                paramNames.extend([name for name in trialType.keys() if name not in paramNames])
+        repsPerType={}
+        for rep in range(self.nReps):
+            for trialN in range(len(self.trialList)):
+                trialTypeIndex = self.sequenceIndices[trialN, rep]
+                repThisType = repsPerType[trialTypeIndex] = repsPerType.get(trialTypeIndex, -1)+1
+                entry={'TrialNumber':store.nRows+1}
+                thisTrial = self.trialList[trialTypeIndex]#once per trial (a ConditionsSource reads it from file)
+                if thisTrial is not None:
+                    entry.update(thisTrial)
+                for dataType in self.data.dataTypes:
+                    val = self.data[dataType][trialTypeIndex][repThisType]
+                    if val is numpy.ma.masked:
+                        continue#no value stored for this trial
+                    if isinstance(val, numpy.generic):
+                        val = val.item()
+                    entry[dataType] = val
+                if type(self.extraInfo)==dict:
+                    store.append(entry, constants=self.extraInfo)
+                else:
+                    store.append(entry)
+        names=[]
+        if type(self.extraInfo)==dict:
+            names.extend(self.extraInfo.keys())
+        names.append('TrialNumber')
+        names.extend(paramNames)
+        names.extend(self.data.dataTypes)
+        _saveColumns(fileName, store, names, compressed=compressed,
+            fileCollisionMethod=fileCollisionMethod)
+
     def addData(self, thisType, value, position=None):
         """Add data for the current trial
         """
@@ -1089,8 +1642,9 @@ class TrialHandler(_BaseTrialHandler):
         #loop through lines (trialTypes), writing data
         for stimN in range(len(self.trialList)):
             #first the params for this trialType (from self.trialList)
+            thisTrial = self.trialList[stimN]
             for colN, heading in enumerate(stimOut):
-                ws.cell(_getExcelCellName(col=colN,row=stimN+1)).value = unicode(self.trialList[stimN][heading])
+                ws.cell(_getExcelCellName(col=colN,row=stimN+1)).value = unicode(thisTrial[heading])
             colN = len(stimOut)
             #then the data for this stim (from self.data)
             for thisDataOut in dataOut:
@@ -1140,7 +1694,7 @@ def importTrialTypes(fileName, returnFieldNames=False):
     logging.warning("importTrialTypes is DEPRECATED (as of v1.70.00). Please use `importConditions` for identical functionality.")
     return importConditions(fileName, returnFieldNames)
 
-def importConditions(fileName, returnFieldNames=False):
+def importConditions(fileName, returnFieldNames=False, useCache=True):
         """Imports a list of conditions from an .xlsx, .csv, or .pkl file
 
         The output is suitable as an input to :class:`TrialHandler` `trialTypes` or to
@@ -1159,45 +1713,24 @@ def importConditions(fileName, returnFieldNames=False):
             - begin with a letter (upper or lower case)
             - contain no spaces or other punctuation (underscores are permitted)
 
+        In a .csv file a column of numbers gives ints (or floats, if any value
+        needs one, with blank cells as nan), a column of True/False gives bools
+        and other columns give unicode strings. In either format, text such as
+        `[1, 2]` is converted to a list and, in an .xlsx file, text such as
+        `('a', 0.5)` to a tuple (only literal values are allowed).
+
+        If `useCache` is True the parsed table from a .csv or .xlsx file is
+        kept (in the user's PsychoPy preferences folder) and reused the next
+        time the same file contents are imported, which is much faster for
+        large files. The least recently used tables are removed once there
+        are more than 50 of them or they take more than 100MB.
         """
         if fileName in ['None','none',None]:
             return []
         elif not os.path.isfile(fileName):
             raise ImportError, 'Conditions file not found: %s' %os.path.abspath(fileName)
 
-        if fileName.endswith('.csv'):
-            #use csv import library to fetch the fieldNames
-            f = open(fileName, 'rU')#the U converts line endings to os.linesep (not unicode!)
-            #lines = f.read().split(os.linesep)#csv module is temperamental with line endings
-            try:
-                reader = csv.reader(f)#.split(os.linesep))
-            except:
-                raise ImportError, 'Could not open %s as conditions' % fileName
-                return []
-            fieldNames = reader.next()
-            #use matplotlib to import data and intelligently check for data types
-            #all data in one column will be given a single type (e.g. if one cell is string, all will be set to string)
-            trialsArr = mlab.csv2rec(f)
-            f.close()
-            #convert the record array into a list of dicts
-            trialList = []
-            for trialN, trialType in enumerate(trialsArr):
-                thisTrial ={}
-                for fieldN, fieldName in enumerate(fieldNames):
-                    OK, msg = isValidVariableName(fieldName)
-                    if not OK:
-                        #provide error message about incorrect header
-                        msg.replace('Variables','Parameters (column headers)') #tailor message to this usage
-                        raise ImportError, '%s: %s' %(fieldName, msg)
-                    val = trialsArr[trialN][fieldN]
-                    #if it looks like a list, convert it
-                    if type(val)==numpy.string_ and val.startswith('[') and val.endswith(']'):
-                        exec('val=%s' %unicode(val.decode('utf8')))
-                    elif type(val)==numpy.string_:#if it looks like a string read it as utf8
-                        val=unicode(val.decode('utf-8'))
-                    thisTrial[fieldName] = val
-                trialList.append(thisTrial)
-        elif fileName.endswith('.pkl'):
+        if fileName.endswith('.pkl'):
             f = open(fileName, 'rU') # is U needed?
             try:
                 trialsArr = cPickle.load(f)
@@ -1207,63 +1740,313 @@ def importConditions(fileName, returnFieldNames=False):
             f.close()
             trialList = []
             fieldNames = trialsArr[0] # header line first
-            for fieldName in fieldNames:
-                OK, msg = isValidVariableName(fieldName)
-                if not OK:
-                    #provide error message about incorrect header
-                    msg.replace('Variables','Parameters (column headers)') #tailor message to this usage
-                    raise ImportError, '%s: %s' %(fieldName, msg)
+            _checkConditionNames(fieldNames)
             for row in trialsArr[1:]:
                 thisTrial = {}
                 for fieldN, fieldName in enumerate(fieldNames):
                     thisTrial[fieldName] = row[fieldN] # type is correct, being .pkl
                 trialList.append(thisTrial)
         else:
-            if not haveOpenpyxl:
-                raise ImportError, 'openpyxl is required for loading excel format files, but it was not found.'
-                return []
-            try:
-                wb = load_workbook(filename = fileName)
-            except: # InvalidFileException(unicode(e)): # this fails
-                raise ImportError, 'Could not open %s as conditions' % fileName
-                return []
-            ws = wb.worksheets[0]
-            nCols = ws.get_highest_column()
-            nRows = ws.get_highest_row()
-
-            #get headers
-            fieldNames = []
-            for colN in range(nCols):
-                #get filedName and check validity
-                fieldName = ws.cell(_getExcelCellName(col=colN, row=0)).value
-                OK, msg = isValidVariableName(fieldName)
-                if not OK:
-                    #provide error message about incorrect header
-                    msg.replace('Variables','Parameters (column headers)') #tailor message to this usage
-                    raise ImportError, '%s: %s' %(fieldName, msg)
+            cacheName=None
+            if useCache:
+                cacheName = _getConditionsCacheName(fileName)
+            fieldNames=None
+            if cacheName and os.path.isfile(cacheName):
+                try:
+                    f = open(cacheName, 'rb')
+                    fieldNames, columns = cPickle.load(f)
+                    f.close()
+                    os.utime(cacheName, None)#recently used, so kept when the cache is pruned
+                except:
+                    logging.warning('Could not read cached conditions for %s' %fileName)
+                    fieldNames=None
+            if fieldNames is None:
+                if fileName.endswith('.csv'):
+                    fieldNames, columns = _importCsvColumns(fileName)
                 else:
-                    fieldNames.append(fieldName)
-
-            #loop trialTypes
-            trialList = []
-            for rowN in range(nRows)[1:]:#not first row
-                thisTrial={}
-                for colN in range(nCols):
-                    fieldName = fieldNames[colN]
-                    val = ws.cell(_getExcelCellName(col=colN, row=rowN)).value
-                    #if it looks like a list, convert it
-                    if type(val) in [unicode, str] and val.startswith('[') and val.endswith(']'):
-                        val = eval(val)
-                    elif type(val) in [unicode, str] and val.startswith('(') and val.endswith(')'):
-                        val = eval(val)
-                    thisTrial[fieldName] = val
-                trialList.append(thisTrial)
+                    fieldNames, columns = _importXlsxColumns(fileName)
+                if cacheName:
+                    _saveConditionsCache(cacheName, fieldNames, columns)
+            #build the dicts row by row from the (already converted) columns
+            trialList = [dict(zip(fieldNames, row)) for row in zip(*columns)]
 
         if returnFieldNames:
             return (trialList,fieldNames)
         else:
             return trialList
 
+_conditionsCacheVersion='2'#change this if the parsing rules change
+_conditionsCacheMaxFiles=50
+_conditionsCacheMaxMB=100
+
+def _getConditionsCacheName(fileName):
+    """The file in which the parsed contents of a conditions file are cached
+    (named by a hash of its contents) or None if there's nowhere to put it
+    """
+    cacheDir = os.path.join(psychopy.prefs.paths['userPrefsDir'], 'conditionsCache')
+    if not os.path.isdir(cacheDir):
+        try:
+            os.makedirs(cacheDir)
+        except OSError:
+            return None
+    f = open(fileName, 'rb')
+    digest = hashlib.md5(_conditionsCacheVersion+os.path.splitext(fileName)[1].lower())
+    for chunk in iter(lambda: f.read(2**20), ''):
+        digest.update(chunk)
+    f.close()
+    return os.path.join(cacheDir, digest.hexdigest()+'.pkl')
+
+def _saveConditionsCache(cacheName, fieldNames, columns):
+    tmpName = '%s.%i.tmp' %(cacheName, os.getpid())
+    try:
+        f = open(tmpName, 'wb')
+        cPickle.dump((fieldNames, columns), f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        if os.path.exists(cacheName):#(os.rename won't replace a file on windows)
+            os.remove(cacheName)
+        os.rename(tmpName, cacheName)
+    except (IOError, OSError, cPickle.PicklingError):
+        logging.warning('Could not cache conditions in %s' %cacheName)
+    _pruneConditionsCache(os.path.dirname(cacheName))
+
+def _pruneConditionsCache(cacheDir):
+    """Remove the least recently used cached conditions until the cache is
+    within _conditionsCacheMaxFiles and _conditionsCacheMaxMB
+    """
+    cached=[]
+    for fileName in glob.glob(os.path.join(cacheDir, '*.pkl')):
+        try:
+            info = os.stat(fileName)
+        except OSError:#removed by another process
+            continue
+        cached.append((info.st_mtime, info.st_size, fileName))
+    cached.sort(reverse=True)#newest first
+    nBytes=0
+    for fileN, (mtime, size, fileName) in enumerate(cached):
+        nBytes+=size
+        if fileN>=_conditionsCacheMaxFiles or nBytes>_conditionsCacheMaxMB*2**20:
+            try:
+                os.remove(fileName)
+            except OSError:
+                pass
+
+def _checkConditionNames(fieldNames):
+    for fieldName in fieldNames:
+        OK, msg = isValidVariableName(fieldName)
+        if not OK:
+            #provide error message about incorrect header
+            msg = msg.replace('Variables','Parameters (column headers)') #tailor message to this usage
+            raise ImportError, '%s: %s' %(fieldName, msg)
+
+def _importCsvColumns(fileName):
+    """Reads a csv conditions file as (fieldNames, columns) with each column
+    converted (as a whole) to a list of ints, floats or unicode/literals
+    """
+    f = open(fileName, 'rU')#the U converts line endings to os.linesep (not unicode!)
+    try:
+        rows = list(csv.reader(f))
+    except csv.Error:
+        raise ImportError, 'Could not open %s as conditions' % fileName
+    f.close()
+    if not rows:
+        raise ImportError, 'Could not open %s as conditions' % fileName
+    fieldNames = rows[0]
+    _checkConditionNames(fieldNames)
+    nCols = len(fieldNames)
+    rows = [row+['']*(nCols-len(row)) for row in rows[1:] if row]#(skipping blank lines)
+    if not rows:
+        return fieldNames, [[] for name in fieldNames]
+    return fieldNames, [_convertCsvColumn(column) for column in zip(*rows)[:nCols]]
+
+def _convertCsvColumn(cells):
+    """Converts a column of text from a csv file: all numbers gives ints, or
+    floats if any value needs one (with blank cells as nan), all True/False
+    (in any case) gives bools, otherwise unicode (with text like '[1,2]'
+    converted to a list)
+    """
+    cells = numpy.array(cells)
+    blank = (numpy.char.strip(cells)=='')
+    if not blank.all():
+        lowered = numpy.char.lower(numpy.char.strip(cells))
+        if ((lowered=='true')|(lowered=='false')).all():
+            return (lowered=='true').tolist()
+        if not blank.any():
+            try:
+                return cells.astype(numpy.int64).tolist()
+            except (ValueError, OverflowError):
+                pass
+        try:
+            return numpy.where(blank, 'nan', cells).astype(numpy.float64).tolist()
+        except ValueError:
+            pass
+    column = [cell.decode('utf-8') for cell in cells.tolist()]
+    return [_parseLiteral(val) for val in column]
+
+def _importXlsxColumns(fileName):
+    """Reads the first sheet of an xlsx conditions file as (fieldNames, columns)
+    """
+    if not haveOpenpyxl:
+        raise ImportError, 'openpyxl is required for loading excel format files, but it was not found.'
+    try:
+        wb = load_workbook(filename = fileName)
+    except: # InvalidFileException(unicode(e)): # this fails
+        raise ImportError, 'Could not open %s as conditions' % fileName
+    ws = wb.worksheets[0]
+    #fetch all the values in one go rather than cell by cell
+    rows = [[cell.value for cell in row] for row in ws.range(ws.calculate_dimension())]
+    fieldNames = rows[0]
+    _checkConditionNames(fieldNames)
+    if len(rows)==1:
+        return fieldNames, [[] for name in fieldNames]
+    return fieldNames, [[_parseLiteral(val, tuples=True) for val in column] for column in zip(*rows[1:])]
+
+def _parseLiteral(val, tuples=False):
+    """If val is text that looks like a list (e.g. u'[1, 2]') or, if `tuples`
+    is True, a tuple (e.g. u'(1, 2)') return that value, otherwise return val.
+    Only literals (numbers, strings, lists, tuples, dicts) are allowed, so no
+    code from the file is ever run.
+    """
+    if type(val) in [unicode, str] and len(val)>1 and \
+            ((val[0]=='[' and val[-1]==']') or (tuples and val[0]=='(' and val[-1]==')')):
+        try:
+            return ast.literal_eval(val)
+        except (ValueError, SyntaxError):
+            logging.warning('Could not convert %s to a list or tuple, keeping it as text' %val)
+    return val
+
+class ConditionsSource(object):
+    """A conditions list that stays in its file, for use as the `trialList`
+    of a :class:`TrialHandler` when there are too many conditions (e.g. a
+    large word list or image database) to load them all with
+    :func:`importConditions`.
+
+    The file is indexed when the source is created, but each row is only read
+    (as a :class:`TrialType`) when it's needed, e.g. when the TrialHandler
+    reaches that trial. `len(source)` and `source[n]` work as for a list.
+
+    Usage::
+
+        conditions = data.ConditionsSource('words.csv')
+        trials = data.TrialHandler(conditions, nReps=1)
+
+    The file can be:
+        - .csv: a comma-separated-value file with a header row. The start of
+          each line is indexed and each value converted on its own (to an int,
+          float, bool, list or unicode; blank cells are u''). Quoted values
+          can't contain line breaks.
+        - .npz: a file from saveAsColumns() (of an ExperimentHandler or a
+          TrialHandler). The columns are memory-mapped (unless the file was
+          compressed).
+    """
+    def __init__(self, fileName):
+        if not os.path.isfile(fileName):
+            raise ImportError, 'Conditions file not found: %s' %os.path.abspath(fileName)
+        self.fileName=fileName
+        self._missing=False
+        if fileName.endswith('.npz'):
+            self._openColumns()
+        elif fileName.endswith('.csv'):
+            self._indexLines()
+        else:
+            raise ImportError, 'ConditionsSource needs a .csv or .npz file, not %s' %fileName
+    def __len__(self):
+        return self.nRows
+    def __getitem__(self, rowN):
+        if rowN<0:
+            rowN+=self.nRows
+        if not 0<=rowN<self.nRows:
+            raise IndexError, 'ConditionsSource index out of range'
+        if self._missing:
+            raise IOError, 'Conditions file %s is no longer available' %self.fileName
+        if self.fileName.endswith('.npz'):
+            return self._getColumnsRow(rowN)
+        return self._getLine(rowN)
+    def __iter__(self):
+        for rowN in xrange(self.nRows):
+            yield self[rowN]
+    def __repr__(self):
+        return 'ConditionsSource(%r) (%i rows)' %(self.fileName, self.nRows)
+    def __getstate__(self):
+        #just refer to the file (rather than pickling an open file or the whole index)
+        return {'fileName':self.fileName, 'nRows':self.nRows, 'fieldNames':self.fieldNames}
+    def __setstate__(self, state):
+        try:
+            self.__init__(state['fileName'])
+        except ImportError:
+            logging.warning('Conditions file %s not found, so its conditions are unavailable' %state['fileName'])
+            self.__dict__.update(state)
+            self._missing=True
+    def _indexLines(self):
+        f = open(self.fileName, 'rb')
+        text = f.read()
+        f.close()
+        chars = numpy.frombuffer(text, numpy.uint8)
+        if '\n' in text: eol='\n'
+        else: eol='\r'#(old mac line endings)
+        ends = numpy.flatnonzero(chars==ord(eol))
+        starts = numpy.concatenate([[0], ends+1])
+        ends = numpy.concatenate([ends, [len(text)]])
+        #ignore blank lines (including any '\r' of '\r\n' line endings)
+        lengths = ends-starts
+        blank = (lengths==0)|((lengths==1)&(chars[numpy.minimum(starts, len(chars)-1)]==ord('\r')))
+        starts, ends = starts[~blank], ends[~blank]
+        if not len(starts):
+            raise ImportError, 'Could not open %s as conditions' % self.fileName
+        if '"' in text:
+            #an odd number of quotes on a line means a quoted value carries on to the next
+            nQuotes = numpy.concatenate([[0], numpy.cumsum(chars==ord('"'))])
+            if ((nQuotes[ends]-nQuotes[starts])%2).any():
+                raise ImportError, '%s has quoted values that span lines, which ConditionsSource can\'t index (use importConditions)' % self.fileName
+        self.fieldNames = csv.reader([text[starts[0]:ends[0]].rstrip('\r')]).next()
+        _checkConditionNames(self.fieldNames)
+        self._starts, self._ends = starts[1:], ends[1:]
+        self.nRows = len(self._starts)
+        self._file = open(self.fileName, 'rb')
+    def _getLine(self, rowN):
+        self._file.seek(self._starts[rowN])
+        line = self._file.read(self._ends[rowN]-self._starts[rowN]).rstrip('\r')
+        cells = csv.reader([line]).next()
+        cells.extend(['']*(len(self.fieldNames)-len(cells)))
+        return TrialType(zip(self.fieldNames, map(_convertCsvCell, cells)))
+    def _openColumns(self):
+        npz = numpy.load(self.fileName)
+        self.fieldNames = [str(name) for name in npz['_names']]
+        _checkConditionNames(self.fieldNames)
+        self.nRows = int(npz['_nRows'])
+        self._columns=[]
+        for colN in range(len(self.fieldNames)):
+            prefix = 'col%i.' %colN
+            if prefix+'codes' in npz.files:
+                self._columns.append(('codes', _readNpzArray(npz, self.fileName, prefix+'codes'),
+                    npz[prefix+'table'].tolist()))
+            else:
+                self._columns.append(('values', _readNpzArray(npz, self.fileName, prefix+'values'),
+                    _readNpzArray(npz, self.fileName, prefix+'mask')))
+        npz.close()
+    def _getColumnsRow(self, rowN):
+        thisTrial = TrialType()
+        for fieldName, (kind, vals, extra) in zip(self.fieldNames, self._columns):
+            if kind=='codes':
+                if vals[rowN]>=0:
+                    thisTrial[fieldName] = _parseLiteral(extra[vals[rowN]], tuples=True)
+            elif not extra[rowN]:
+                thisTrial[fieldName] = _parseLiteral(vals[rowN].item(), tuples=True)
+        return thisTrial
+
+def _convertCsvCell(cell):
+    """Converts a single csv cell to an int, float, bool, list or unicode"""
+    if cell.strip().lower() in ['true', 'false']:
+        return cell.strip().lower()=='true'
+    try:
+        return int(cell)
+    except ValueError:
+        pass
+    try:
+        return float(cell)
+    except ValueError:
+        pass
+    return _parseLiteral(cell.decode('utf-8'))
+
 def createFactorialTrialList(factors):
     """Create a trialList by entering a list of factors with names (keys) and levels (values)
     it will return a trialList in which all factors have been factorially combined (so for example
@@ -1306,6 +2089,79 @@ def createFactorialTrialList(factors):
 
     return trialList
 
+def loadColumns(fileNames, columns=None, mmap=True):
+    """Load data saved by saveAsColumns (of an
+    :class:`~psychopy.data.ExperimentHandler` or :class:`~psychopy.data.TrialHandler`)
+    from one or more files, joining the rows of all the files together.
+
+    Only the requested columns are read from each file, so this is a quick
+    way to collect a few variables from many sessions. Columns that were
+    saved without compression are memory-mapped rather than read into memory
+    (when loading a single file).
+
+    Usage::
+
+        data = loadColumns(glob.glob('data/*.npz'), columns=['participant', 'resp.rt'])
+        meanRT = data['resp.rt'].mean()#missing values are masked
+
+    :Parameters:
+
+        fileNames : a filename or a list of them
+
+        columns : a list of column names or None (all the columns in any of the files)
+
+        mmap : **True** or False
+            Whether uncompressed columns should be memory-mapped
+
+    :Returns:
+
+        a dict of {name:numpy.ma.MaskedArray}, masked where a row had no value
+        (including all the rows of files that lacked that column). An extra
+        entry, '_file', gives the index (in fileNames) of the file each row
+        came from.
+    """
+    if type(fileNames) in [str, unicode]:
+        fileNames=[fileNames]
+    parts=[]#for each file a dict of the columns it has, and its number of rows
+    allNames=[]
+    for fileName in fileNames:
+        npz = numpy.load(fileName)
+        names = list(npz['_names'])
+        for name in names:
+            if name not in allNames: allNames.append(name)
+        if columns is None:
+            wanted=names
+        else:
+            wanted=[name for name in columns if name in names]
+        cols={}
+        for name in wanted:
+            cols[name] = _readColumn(npz, fileName, names.index(name), mmap)
+        parts.append((cols, int(npz['_nRows'])))
+        npz.close()#(memory-mapped columns don't need it to stay open)
+    if columns is None:
+        columns=allNames
+    output={}
+    for name in columns:
+        dtype=None
+        for cols, nRows in parts:
+            if name in cols:
+                dtype = cols[name].dtype
+                break
+        if dtype is None:
+            dtype=numpy.float64#a column that's in none of the files
+        arrays=[]
+        for cols, nRows in parts:
+            if name in cols:
+                arrays.append(cols[name])
+            else:
+                arrays.append(numpy.ma.MaskedArray(numpy.zeros(nRows, dtype), mask=numpy.ones(nRows, bool)))
+        if len(arrays)==1:
+            output[name]=arrays[0]
+        else:
+            output[name]=numpy.ma.concatenate(arrays)
+    output['_file']=numpy.repeat(numpy.arange(len(parts)), [nRows for cols, nRows in parts])
+    return output
+
 class StairHandler(_BaseTrialHandler):
     """Class to handle smoothly the selection of the next trial
     and report current values etc.
@@ -2428,7 +3284,10 @@ class DataHandler(dict):
         #if given dataShape use it - otherwise guess!
         if dataShape: self.dataShape=dataShape
         elif self.trials:
-            self.dataShape=list(numpy.asarray(trials.trialList,'O').shape)
+            if isinstance(trials.trialList, ConditionsSource):
+                self.dataShape=[len(trials.trialList)]#(without reading every condition)
+            else:
+                self.dataShape=list(numpy.asarray(trials.trialList,'O').shape)
             self.dataShape.append(trials.nReps)
 
         #initialise arrays now if poss
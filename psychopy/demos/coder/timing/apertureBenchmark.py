@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+#Measures the cost of moving an Aperture on every frame (as for a
+#gaze-contingent display), for a circle, a concave polygon and an image
+#shape. Moving the aperture only changes its transform and erases the
+#area of the stencil it covered before, so the cost shouldn't depend on the
+#size of the window.
+
+from psychopy import visual, core
+import numpy
+
+nFrames=500
+
+win = visual.Window([1024,768], units='pix', allowStencil=True,
+    waitBlanking=False, allowGUI=False)
+win.setRecordFrameIntervals(False)
+grating = visual.PatchStim(win, tex='sin', mask=None, size=1024, sf=0.02, autoLog=False)
+imageMask = numpy.ones([64,64])*-1
+imageMask[16:48,:] = 1; imageMask[:,16:48] = 1#a cross
+shapes = {'circle':'circle', 'polygon':[[-0.5,-0.5],[0.5,-0.5],[0,0],[0,0.5]], 'image':imageMask}
+
+print '%-10s %12s' %('shape', 'ms/setPos')
+for name, shape in shapes.items():
+    aperture = visual.Aperture(win, size=200, shape=shape)
+    t = 0
+    for frameN in range(nFrames):
+        angle = frameN*0.05
+        t0 = core.getTime()
+        aperture.setPos([200*numpy.cos(angle), 200*numpy.sin(angle)])
+        t += core.getTime()-t0
+        grating.draw()
+        win.flip()
+    print '%-10s %12.3f' %(name, t*1000/nFrames)
+    aperture.disable()
+win.close()
+core.quit()
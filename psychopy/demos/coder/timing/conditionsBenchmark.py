@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+#Times data.importConditions() for conditions files of increasing length,
+#first parsing the file and then loading it again from the cache (which is
+#what happens when an experiment is run again with the same file). Then
+#times creating a TrialHandler from a ConditionsSource instead, which only
+#indexes the file and reads each condition as the trials reach it.
+
+from psychopy import data, core
+import os, tempfile, shutil
+
+rowNumbers=[1000, 5000, 20000, 200000]
+
+tempDir = tempfile.mkdtemp()
+clock=core.Clock()
+print '%8s %12s %12s %12s' %('nRows', 'parse (s)', 'cached (s)', 'source (s)')
+for nRows in rowNumbers:
+    fileName = os.path.join(tempDir, 'conds%i.csv' %nRows)
+    f = open(fileName, 'w')
+    f.write('word,freq,nLetters,category,pos\n')
+    for rowN in range(nRows):
+        f.write('word%i,%f,%i,noun,"[%i, %i]"\n' %(rowN, rowN/7.0, rowN%12, rowN%100, rowN%50))
+    f.close()
+    clock.reset()
+    data.importConditions(fileName, useCache=False)
+    tParse = clock.getTime()
+    data.importConditions(fileName)#parse it and fill the cache
+    clock.reset()
+    data.importConditions(fileName)
+    tCached = clock.getTime()
+    clock.reset()
+    trials = data.TrialHandler(data.ConditionsSource(fileName), nReps=1)
+    trials.next()
+    tSource = clock.getTime()
+    print '%8i %12.3f %12.3f %12.3f' %(nRows, tParse, tCached, tSource)
+shutil.rmtree(tempDir)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+#Times how long an ExperimentHandler takes to store entries and to save
+#them, for increasing numbers of trials. The time per entry for nextEntry()
+#should stay flat and saving should scale roughly linearly, because the
+#entries are held column by column rather than as one dict per trial.
+#Loading one column back from the binary file (saveAsColumns) should be
+#almost instant.
+
+from psychopy import data, core
+import os, tempfile, shutil
+
+trialNumbers=[1000, 10000, 100000]
+conditions=[{'ori':ori, 'sf':sf, 'label':'ori%i' %ori} for ori in range(0,180,30) for sf in [1,2,4]]
+
+tempDir = tempfile.mkdtemp()
+clock=core.Clock()
+print '%8s %14s %14s %14s %14s' %('nTrials', 'us/nextEntry', 'wideText (s)', 'columns (s)', 'load rt (s)')
+for nTrials in trialNumbers:
+    exp = data.ExperimentHandler(name='bench', extraInfo={'participant':'bench', 'session':1},
+        savePickle=False, saveWideText=False)
+    trials = data.TrialHandler(conditions, nReps=nTrials//len(conditions)+1, method='random')
+    exp.addLoop(trials)
+    clock.reset()
+    for trialN in range(nTrials):
+        trials.next()
+        exp.addData('resp.rt', 0.001*trialN)
+        exp.addData('resp.keys', 'left')
+        exp.nextEntry()
+    tEntry = clock.getTime()/nTrials
+    fileName = os.path.join(tempDir, 'bench%i' %nTrials)
+    clock.reset()
+    exp.saveAsWideText(fileName+'.csv')
+    tWide = clock.getTime()
+    clock.reset()
+    exp.saveAsColumns(fileName)
+    tCols = clock.getTime()
+    clock.reset()
+    rt = data.loadColumns(fileName+'.npz', columns=['resp.rt'])['resp.rt']
+    tLoad = clock.getTime()
+    print '%8i %14.1f %14.3f %14.3f %14.3f' %(nTrials, tEntry*1e6, tWide, tCols, tLoad)
+shutil.rmtree(tempDir)
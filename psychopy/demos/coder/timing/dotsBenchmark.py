@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+#Measures how many frames per second a DotStim can be drawn at, for
+#increasing numbers of dots and for each of the noiseDots modes. Both
+#plain points and textured point sprites (dotMask) are tested.
+
+#The window doesn't wait for the screen refresh (waitBlanking=False) so
+#that the frame rate isn't simply capped at your monitor's refresh rate.
+
+from psychopy import visual, core, event
+import numpy
+
+nFrames=200
+dotNumbers=[100, 1000, 2000, 5000, 10000, 50000]
+noiseModes=['direction', 'position', 'walk']
+masks=[None, 'gauss']
+
+win = visual.Window([800,800], units='pix', waitBlanking=False, allowGUI=False)
+win.setRecordFrameIntervals(False)
+clock=core.Clock()
+
+print '%-10s %-10s %8s %10s' %('noiseDots', 'dotMask', 'nDots', 'frames/s')
+for noiseDots in noiseModes:
+    for dotMask in masks:
+        for nDots in dotNumbers:
+            dots = visual.DotStim(win, nDots=nDots, fieldShape='circle',
+                fieldSize=700, dotSize=6, speed=2, dotLife=20, coherence=0.5,
+                noiseDots=noiseDots, signalDots='different', dotMask=dotMask,
+                autoLog=False)
+            dots.draw(); win.flip()#the first draw can include one-off costs
+            clock.reset()
+            for frameN in range(nFrames):
+                dots.draw()
+                win.flip()
+            fps = nFrames/clock.getTime()
+            print '%-10s %-10s %8i %10.1f' %(noiseDots, dotMask, nDots, fps)
+            if event.getKeys(['escape','q']):
+                core.quit()
+win.close()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+#Times the CPU cost of the DotStim update rule alone (no drawing), which
+#runs once per frame inside DotStim.draw(). The cost per dot should stay
+#flat as the number of dots grows (the update works in place, so no new
+#arrays are created on each frame).
+
+from psychopy import visual, core
+import timeit
+
+nFrames=500
+dotNumbers=[100, 1000, 10000, 100000]
+
+win = visual.Window([400,400], units='pix', allowGUI=False)
+
+print '%-8s %-10s %8s %14s %12s' %('shape', 'noiseDots', 'nDots', 'us/frame', 'ns/dot')
+for fieldShape in ['circle', 'sqr']:
+    for noiseDots in ['direction', 'position', 'walk']:
+        for nDots in dotNumbers:
+            dots = visual.DotStim(win, nDots=nDots, fieldShape=fieldShape,
+                fieldSize=300, speed=2, dotLife=20, coherence=0.5,
+                noiseDots=noiseDots, signalDots='different', seed=1,
+                autoLog=False)
+            t = min(timeit.repeat(dots._update_dotsXY, repeat=3, number=nFrames))/nFrames
+            print '%-8s %-10s %8i %14.1f %12.2f' %(fieldShape, noiseDots, nDots, t*1e6, t*1e9/nDots)
+win.close()
+core.quit()
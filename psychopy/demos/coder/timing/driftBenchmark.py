@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+#Times drifting and counterphase-flickering gratings, which change their
+#phase (or contrast) on every frame. The phase, sf and size of a PatchStim
+#are applied with the texture/modelview matrices at draw time, so these
+#changes shouldn't cost more than drawing a static grating.
+
+from psychopy import visual, core, event
+
+nFrames=500
+win = visual.Window([800,800], units='pix', waitBlanking=False, allowGUI=False)
+win.setRecordFrameIntervals(False)
+clock=core.Clock()
+
+def static(stim, frameN): pass
+def drift(stim, frameN): stim.setPhase(0.01, '+')
+def counterphase(stim, frameN): stim.setContrast(frameN%2*2-1)
+def driftAndGrow(stim, frameN):
+    stim.setPhase(0.01, '+')
+    stim.setSize(400+frameN%100)
+
+print '%-8s %-14s %8s %10s' %('shaders', 'update', 'nStims', 'frames/s')
+for useShaders in [True, False]:
+    if useShaders and not win._haveShaders:
+        continue
+    for update in [static, drift, counterphase, driftAndGrow]:
+        for nStims in [1, 10, 50]:
+            stims = [visual.PatchStim(win, tex='sin', mask='gauss', size=400, sf=0.02,
+                ori=n*10, autoLog=False) for n in range(nStims)]
+            for stim in stims: stim.setUseShaders(useShaders)
+            clock.reset()
+            for frameN in range(nFrames):
+                for stim in stims:
+                    update(stim, frameN)
+                    stim.draw()
+                win.flip()
+            print '%-8s %-14s %8i %10.1f' %(useShaders, update.__name__, nStims, nFrames/clock.getTime())
+            if event.getKeys(['escape','q']):
+                core.quit()
+win.close()
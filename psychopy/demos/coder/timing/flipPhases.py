@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+#Shows where the time goes within each frame. The window records how long
+#each phase of flip() takes (and the draw() of each autoDraw stimulus), and
+#the percentiles are shown live on the screen. On exit the frames are saved
+#to flipPhases.csv (one row per frame, in ms).
+
+from psychopy import visual, core, event
+
+win = visual.Window([800,600], units='pix', allowGUI=False)
+gabors = [visual.PatchStim(win, tex='sin', mask='gauss', sf=0.05, size=100,
+    pos=[x, 150], autoLog=False) for x in [-200, 0, 200]]
+for gabor in gabors:
+    gabor.setAutoDraw(True)
+summary = visual.TextStim(win, text='', pos=[-380, 50], height=14, font='Courier',
+    alignHoriz='left', alignVert='top', wrapWidth=800, autoLog=False)
+
+win.setRecordFlipPhases(True, nFrames=600)
+frameN=0
+while not event.getKeys(['escape','q']):
+    for gabor in gabors:
+        gabor.setPhase(0.02, '+')
+    if frameN%60==0:#update the table once per second
+        summary.setText(win.flipProfiler.getSummary())
+    summary.draw()#drawn by us, so counts as 'user' time
+    win.flip()
+    frameN+=1
+win.flipProfiler.save('flipPhases.csv')
+win.close()
+core.quit()
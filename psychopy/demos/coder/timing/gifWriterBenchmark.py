@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+#Times writing an animated GIF of 600 800x600 frames with the streaming
+#makeMovies.GifWriter (frames are palettised with numpy and written one at a
+#time, so they never all need to be in memory).
+
+from psychopy import makeMovies, core
+import numpy, tempfile, os, shutil
+
+nFrames=600
+outDir = tempfile.mkdtemp()
+fileName = os.path.join(outDir, 'benchmark.gif')
+
+#a drifting grating with a moving square, much like a captured stimulus
+x = numpy.linspace(0, 8*numpy.pi, 800)
+def makeFrame(frameN):
+    lum = (numpy.sin(x+frameN*0.1)*100+128).astype(numpy.uint8)
+    frame = numpy.repeat(numpy.repeat(lum[None,:,None], 600, axis=0), 3, axis=2)
+    frame[200:300, frameN%700:frameN%700+100] = [255,0,0]
+    return frame
+
+t0 = core.getTime()
+palette = makeMovies.makePaletteFast([makeFrame(0), makeFrame(nFrames//2)])
+writer = makeMovies.GifWriter(fileName, palette=palette, fps=60)
+tPalette = core.getTime()-t0
+t0 = core.getTime()
+for frameN in range(nFrames):
+    writer.addFrame(makeFrame(frameN))
+writer.close()
+tFrames = core.getTime()-t0
+print 'palette: %.1fms (%i colors)' %(tPalette*1000, len(palette))
+print 'frames: %.1fms per frame, file size %.1fMB' %(tFrames*1000/nFrames, os.path.getsize(fileName)/1e6)
+shutil.rmtree(outDir)
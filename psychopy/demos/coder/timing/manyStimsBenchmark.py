@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+#Draws many small stimuli on every frame with autoDraw, to measure the cost
+#per stimulus. For each scene the frame rate and the number of openGL calls
+#per frame are reported, with and without sorting the stimuli by type and
+#texture (Window(sortAutoDraw=True)).
+
+#The window doesn't wait for the screen refresh (waitBlanking=False) so
+#that the frame rate isn't simply capped at your monitor's refresh rate.
+
+from psychopy import visual, core, event
+import numpy
+
+nFrames=200
+nStims=300
+
+clock=core.Clock()
+print '%-12s %8s %10s %12s' %('sortAutoDraw', 'nStims', 'frames/s', 'GLcalls/frame')
+for sortAutoDraw in [False, True]:
+    win = visual.Window([800,800], units='pix', waitBlanking=False, allowGUI=False,
+        sortAutoDraw=sortAutoDraw)
+    rng = numpy.random.RandomState(1)
+    for n in range(nStims):
+        #alternate the types so that an unsorted scene switches state each time
+        pos = rng.uniform(-380, 380, 2)
+        if n%3==0:
+            stim = visual.PatchStim(win, tex='sin', mask='gauss', size=40, sf=0.1, pos=pos, autoLog=False)
+        elif n%3==1:
+            stim = visual.PatchStim(win, tex=None, mask='circle', size=20, pos=pos, autoLog=False)
+        else:
+            stim = visual.ShapeStim(win, vertices=[[-10,-10],[10,-10],[0,10]], fillColor='red', pos=pos, autoLog=False)
+        stim.setAutoDraw(True)
+    win.flip()
+    win.setRecordGLCalls(True)
+    win.flip()
+    win.setRecordGLCalls(False)
+    clock.reset()
+    for frameN in range(nFrames):
+        win.flip()
+    fps = nFrames/clock.getTime()
+    print '%-12s %8i %10.1f %12i' %(sortAutoDraw, nStims, fps, win.glCallCounts[-1])
+    win.close()
+    if event.getKeys(['escape','q']):
+        break
+core.quit()
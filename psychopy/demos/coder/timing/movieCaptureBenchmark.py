@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+#Compares the cost of capturing every frame of a moving stimulus with
+#getMovieFrame() (frames kept in memory as images) and with
+#startMovieCapture() (pixels read via pixel buffer objects and written
+#to disk on a background thread).
+
+from psychopy import visual, core, event
+import numpy, tempfile, os, shutil
+
+nFrames=120
+outDir = tempfile.mkdtemp()
+
+win = visual.Window([800,600], units='pix', allowGUI=False)
+gabor = visual.PatchStim(win, tex='sin', mask='gauss', sf=0.02, size=300, autoLog=False)
+
+def run(capture):
+    win.setRecordFrameIntervals(True)
+    win.frameIntervals.clear()
+    for frameN in range(nFrames):
+        gabor.setPhase(0.05, '+')
+        gabor.draw()
+        win.flip()
+        if capture=='getMovieFrame':
+            win.getMovieFrame()
+    win.setRecordFrameIntervals(False)
+    return win.frameIntervals.getStats()
+
+print '%-20s %10s %10s %8s' %('capture', 'mean(ms)', 'max(ms)', 'dropped')
+for capture in ['none', 'getMovieFrame', 'startMovieCapture']:
+    if capture=='startMovieCapture':
+        win.startMovieCapture(os.path.join(outDir, 'frames.raw'))
+    stats = run(capture)
+    if capture=='startMovieCapture':
+        win.stopMovieCapture()
+    win.movieFrames=[]
+    print '%-20s %10.2f %10.2f %8i' %(capture, stats['mean']*1000, stats['max']*1000, stats['nDropped'])
+    if event.getKeys(['escape','q']):
+        break
+win.close()
+shutil.rmtree(outDir)
+core.quit()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+#Measures the frame rate for a NoiseStim showing fresh noise on every frame,
+#for each noiseType and generator ('shader' makes the noise on the graphics
+#card, 'bank' makes it in a background thread and uploads a frame per draw).
+#For 120Hz displays you need well over 120 frames/s here.
+
+from psychopy import visual, core, event
+
+nFrames=300
+win = visual.Window([600,600], units='pix', waitBlanking=False, allowGUI=False)
+win.setRecordFrameIntervals(False)
+clock=core.Clock()
+
+generators=['bank']
+if win._haveShaders: generators.insert(0, 'shader')
+print '%-8s %-9s %8s %10s' %('generator', 'noiseType', 'noiseRes', 'frames/s')
+for generator in generators:
+    for noiseType in ['white', 'binary', 'gauss', 'filtered']:
+        if noiseType=='filtered' and generator=='shader':
+            continue#always made by the bank
+        for noiseRes in [128, 256, 512]:
+            noise = visual.NoiseStim(win, noiseType=noiseType, noiseRes=noiseRes,
+                size=512, generator=generator, seed=1, autoLog=False)
+            noise.draw(); win.flip()
+            clock.reset()
+            for frameN in range(nFrames):
+                noise.draw()
+                win.flip()
+            print '%-8s %-9s %8i %10.1f' %(generator, noiseType, noiseRes, nFrames/clock.getTime())
+            if event.getKeys(['escape','q']):
+                core.quit()
+win.close()
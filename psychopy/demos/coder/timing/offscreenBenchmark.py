@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+#Renders frames of a drifting grating into an offscreen Window (no visible
+#window, so nothing waits for the screen refresh) and reads each frame back
+#as a numpy array. The frame rate is limited only by the graphics card (or
+#the software renderer, e.g. on a display-less machine running Xvfb).
+
+from psychopy import visual, core
+import numpy
+
+nFrames=500
+
+for winType in ['offscreen', 'pyglet']:
+    win = visual.Window([512,512], units='pix', winType=winType,
+        waitBlanking=False, allowGUI=False)
+    grating = visual.PatchStim(win, tex='sin', mask='gauss', size=400, sf=0.02, autoLog=False)
+    frame = numpy.empty([512,512,3], numpy.uint8)
+    for readBack in [False, True]:
+        clock=core.Clock()
+        for frameN in range(nFrames):
+            grating.setPhase(0.02, '+')
+            grating.draw()
+            win.flip()
+            if readBack:
+                win.getFrameArray(buffer='front', out=frame)
+        t = clock.getTime()
+        print '%-10s readBack=%-6s %8.1f frames/s' %(winType, readBack, nFrames/t)
+    win.close()
+core.quit()
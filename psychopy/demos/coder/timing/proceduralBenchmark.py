@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+#Compares the time to create (and to change the mask of) a Gabor made from
+#textures with one computed in the shader (procedural=True), and the frame
+#rates for drawing many of them.
+
+from psychopy import visual, core, event
+import timeit
+
+nFrames=200
+win = visual.Window([800,800], units='pix', waitBlanking=False, allowGUI=False)
+win.setRecordFrameIntervals(False)
+if not win._haveShaders:
+    print 'procedural textures need shaders, which are not available here'
+    core.quit()
+clock=core.Clock()
+
+print '%-11s %-6s %14s %16s %10s' %('procedural', 'texRes', 'ms/new stim', 'ms/maskParams', 'frames/s')
+for procedural in [False, True]:
+    for texRes in [128, 512]:
+        def newStim():
+            return visual.PatchStim(win, tex='sin', mask='raisedCos', size=300, sf=0.02,
+                texRes=texRes, procedural=procedural, autoLog=False)
+        tNew = min(timeit.repeat(newStim, repeat=3, number=10))/10
+        stim = newStim()
+        widths = [0.1, 0.2, 0.3, 0.4]
+        def changeFringe():
+            widths.append(widths.pop(0))
+            stim.setMaskParams({'fringeWidth':widths[0]})
+        tParams = min(timeit.repeat(changeFringe, repeat=3, number=10))/10
+        stims = [newStim() for n in range(20)]
+        clock.reset()
+        for frameN in range(nFrames):
+            for n, stim in enumerate(stims):
+                stim.setOri(n*18+frameN)
+                stim.draw()
+            win.flip()
+        fps = nFrames/clock.getTime()
+        print '%-11s %-6i %14.2f %16.2f %10.1f' %(procedural, texRes, tNew*1000, tParams*1000, fps)
+        if event.getKeys(['escape','q']):
+            core.quit()
+win.close()
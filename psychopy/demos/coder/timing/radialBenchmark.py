@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+#Times a rotating, phase-reversing checkerboard wedge (as used for retinotopy)
+#drawn with and without shaders. With shaders the phase changes are just
+#uniform values sent at draw time, so the cost shouldn't depend on angularRes.
+
+from psychopy import visual, core, event
+
+nFrames=300
+win = visual.Window([800,800], units='pix', waitBlanking=False, allowGUI=False)
+win.setRecordFrameIntervals(False)
+clock=core.Clock()
+
+print '%-8s %10s %10s' %('shaders', 'angularRes', 'frames/s')
+for useShaders in [True, False]:
+    if useShaders and not win._haveShaders:
+        continue
+    for angularRes in [16, 100, 1000]:
+        wedge = visual.RadialStim(win, tex='sqrXsqr', size=700, visibleWedge=[0,45],
+            radialCycles=4, angularCycles=8, angularRes=angularRes, autoLog=False)
+        wedge.setUseShaders(useShaders)
+        clock.reset()
+        for frameN in range(nFrames):
+            wedge.setOri(1, '+')
+            wedge.setRadialPhase(0.05, '+')
+            wedge.draw()
+            win.flip()
+        print '%-8s %10i %10.1f' %(useShaders, angularRes, nFrames/clock.getTime())
+        if event.getKeys(['escape','q']):
+            core.quit()
+win.close()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+#Renders a batch of masked noise patches with visual.renderBatch(), using
+#increasing numbers of worker processes (each with its own offscreen
+#Window), and reports the images rendered per second. With enough work per
+#image this should scale with the number of CPUs.
+
+from psychopy import visual, core
+import numpy, multiprocessing
+
+nImages=400
+size=256
+
+def makeNoisePatch(win, seed):
+    noise = numpy.random.RandomState(seed).uniform(-1, 1, [size, size])
+    return visual.PatchStim(win, tex=noise, mask='raisedCos', size=size,
+        units='pix', autoLog=False)
+
+if __name__=='__main__':
+    conditions = [{'seed':n} for n in range(nImages)]
+    print '%10s %12s' %('processes', 'images/s')
+    nCPUs = multiprocessing.cpu_count()
+    for nProcesses in sorted(set([1, 2, 4, nCPUs])):
+        if nProcesses>nCPUs:
+            continue
+        clock = core.Clock()
+        frames = visual.renderBatch(makeNoisePatch, conditions, size=[size,size],
+            nProcesses=nProcesses, progress=False)
+        print '%10i %12.1f' %(nProcesses, nImages/clock.getTime())
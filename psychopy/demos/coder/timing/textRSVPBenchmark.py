@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+#An RSVP-style stress test for TextStim: a new 10-character string is shown
+#on every frame. Reports how long setText() takes and how many frames were
+#dropped. At 60Hz each frame (setText, draw and flip) has 16.7ms, and
+#setText should only take a small fraction of that because the glyphs are
+#rendered once (per font and size) and reused.
+
+from psychopy import visual, core, event
+import numpy
+
+nFrames=600
+nChars=10
+letters=numpy.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+
+win = visual.Window([800,600], units='pix', allowGUI=False)
+text = visual.TextStim(win, text='', height=40, autoLog=False)
+rng = numpy.random.RandomState(1)
+strings = [''.join(letters[rng.randint(0, len(letters), nChars)]) for n in range(nFrames)]
+
+setTextTimes=numpy.zeros(nFrames)
+win.setRecordFrameIntervals(True)
+for frameN, thisString in enumerate(strings):
+    t0=core.getTime()
+    text.setText(thisString)
+    setTextTimes[frameN]=core.getTime()-t0
+    text.draw()
+    win.flip()
+    if event.getKeys(['escape','q']):
+        break
+win.setRecordFrameIntervals(False)
+
+intervals = numpy.array(win.frameIntervals[1:])#the first includes setup time
+refresh = numpy.median(intervals)
+print 'setText: mean %.3fms, max %.3fms' %(setTextTimes.mean()*1000, setTextTimes.max()*1000)
+print 'frames: %i, refresh %.2fms, dropped %i (intervals >1.5 refreshes)' \
+    %(len(intervals), refresh*1000, numpy.sum(intervals>1.5*refresh))
+win.close()
+core.quit()
@@ -4,13 +4,14 @@
 
 """
 Not for users. To create a movie use win.getMovieFrame() and then win.saveMovieFrames(filename)
+(or win.startMovieCapture(filename) to write the frames as they are drawn)
 
 Many thanks to Ray Pascor (pascor at hotpop.com) for the public domain code on
 building an optimised gif palette (makeRGBhistogram, makePalette, rgb2palette are
 very heavily based on his code).
 """
 from psychopy import logging
-import string, time, tempfile, os, glob
+import string, time, tempfile, os, glob, subprocess, shlex
 import Image, ImageChops
 from GifImagePlugin import getheader, getdata #part of PIL
 try:
@@ -30,92 +31,211 @@ import numpy
 # --------------------------------------------------------------------
 # straightforward delta encoding
 
-def makeAnimatedGIF(filename, images):
+def makeAnimatedGIF(filename, images, fps=None):
     """Convert list of image frames to a GIF animation file
-    using simple delta coding"""
-
-    frames = 0
-    previous=None
-    fp = open(filename, 'wb')
-    if images[0].mode in ['RGB','RGBA']:
-        #first make an optimised palette
-        optimPalette=makePalette(images, verbose=True)
-
-    for n, im in enumerate(images):
-        print 'converting frame %i of %i to GIF' %(n+1,len(images))
-        if im.mode=='RGB':
-            im = rgb2palette(im, palette=optimPalette, verbose=False)
-        if not previous:
-            # global header
-            for s in getheader(im) + getdata(im):
-                fp.write(s)
+    using simple delta coding (with one palette optimised for all the frames)"""
+    frames = [numpy.asarray(im.convert('RGB')) for im in images]
+    #base the palette on (a sample of) the pixels of all frames
+    sampleStep = max(1, len(frames)//16)
+    palette = makePaletteFast(frames[::sampleStep])
+    writer = GifWriter(filename, palette=palette, fps=fps)
+    for frame in frames:
+        writer.addFrame(frame)
+    writer.close()
+    return writer.nFrames
+
+def _packColors(pixels):
+    """Pack the RGB (or RGBA) values of an array [...,3 or 4] of uint8 into uint32s
+    """
+    pixels = numpy.asarray(pixels, numpy.uint8)
+    packed = numpy.zeros(pixels.shape[:-1], numpy.uint32)
+    for chanN in range(pixels.shape[-1]):
+        packed |= pixels[...,chanN].astype(numpy.uint32) << (8*chanN)
+    return packed
+
+def _unpackColors(packed, nChannels=3):
+    return numpy.array([(packed >> (8*chanN)) & 255 for chanN in range(nChannels)],
+        numpy.uint8).transpose()
+
+def _colorCounts(frames, maxPixels=None):
+    """Returns the unique colors (as an array [n,nChannels]) in a list of frames
+    (numpy arrays [h,w,nChannels]) and how often each occurs. If maxPixels is
+    given then a regular sample of no more than that many pixels is used
+    """
+    nChannels = frames[0].shape[-1]
+    pixels = numpy.concatenate([numpy.asarray(frame).reshape([-1,nChannels]) for frame in frames])
+    if maxPixels and len(pixels)>maxPixels:
+        pixels = pixels[::int(numpy.ceil(len(pixels)/float(maxPixels)))]
+    colors, inverse = numpy.unique(_packColors(pixels), return_inverse=True)
+    return _unpackColors(colors, nChannels), numpy.bincount(inverse)
+
+def _medianCut(colors, counts, maxColors=256):
+    """Reduce colors (an array [n,3]) weighted by counts to at most maxColors,
+    by repeatedly splitting the box of colors with the largest range at its
+    (weighted) median, and return the mean color of each box
+    """
+    boxes = [numpy.arange(len(colors))]
+    while len(boxes)<maxColors:
+        ranges = [colors[box].max(0).astype(int)-colors[box].min(0) for box in boxes]
+        boxN = int(numpy.argmax([r.max() for r in ranges]))
+        if ranges[boxN].max()==0:
+            break#every box is a single color
+        box = boxes.pop(boxN)
+        chanN = int(numpy.argmax(ranges[boxN]))
+        box = box[numpy.argsort(colors[box, chanN], kind='mergesort')]
+        cumCounts = numpy.cumsum(counts[box])
+        splitN = int(numpy.searchsorted(cumCounts, cumCounts[-1]/2.0))
+        splitN = min(max(splitN, 1), len(box)-1)
+        boxes.extend([box[:splitN], box[splitN:]])
+    return numpy.array([numpy.average(colors[box], axis=0, weights=counts[box]) for box in boxes]
+        ).round().astype(numpy.uint8)
+
+def makePaletteFast(frames, maxColors=256, maxPixels=200000):
+    """Returns a palette (a uint8 array [nColors,3]) for a list of RGB frames
+    (numpy arrays or PIL images). If there are no more than maxColors colors
+    they are used exactly, otherwise a median cut of a sample of the pixels is used
+    """
+    frames = [numpy.asarray(frame)[...,:3] for frame in frames]
+    colors, counts = _colorCounts(frames, maxPixels=maxPixels)
+    if len(colors)<=maxColors:
+        colors, counts = _colorCounts(frames)#all the pixels, in case the sample missed some
+        if len(colors)<=maxColors:
+            return colors
+    return _medianCut(colors, counts, maxColors)
+
+def paletteIndices(frame, palette, lookup=None, default=0):
+    """Returns the index in palette (array [n,3]) of each pixel of frame (array
+    [h,w,3]) as a uint8 array [h,w]. Colors that aren't in the palette are given
+    the nearest color, using lookup (from _nearestColorLookup), or `default`
+    if lookup is None
+    """
+    packed = _packColors(numpy.asarray(frame)[...,:3])
+    palPacked = _packColors(palette)
+    order = numpy.argsort(palPacked, kind='mergesort')#so repeated colors give the first index
+    pos = numpy.searchsorted(palPacked[order], packed).clip(0, len(palette)-1)
+    indices = order[pos]
+    missing = palPacked[indices]!=packed
+    if missing.any():
+        if lookup is None:
+            indices[missing] = default
         else:
-            # delta frame
-            delta = ImageChops.subtract_modulo(im, previous)
-            bbox = delta.getbbox()
-            # compress difference
-            if bbox:
-                for s in getdata(im.crop(bbox), offset = bbox[:2]):
-                    fp.write(s)
+            indices[missing] = lookup[_quantise(numpy.asarray(frame)[missing][:,:3])]
+    return indices.astype(numpy.uint8)
+
+def _quantise(pixels):
+    """Index of the 5bit-per-channel cell of each pixel (array [n,3])"""
+    pixels = numpy.asarray(pixels, int) >> 3
+    return (pixels[:,0] << 10) | (pixels[:,1] << 5) | pixels[:,2]
+
+def _nearestColorLookup(palette):
+    """A table of the palette index nearest to each 5bit-per-channel color"""
+    cellN = numpy.arange(32**3)
+    cells = numpy.array([(cellN >> 10) & 31, (cellN >> 5) & 31, cellN & 31]).transpose()*8+4#centre of each cell
+    lookup = numpy.zeros(len(cells), numpy.uint8)
+    palette = palette.astype(int)
+    for start in range(0, len(cells), 4096):
+        dists = ((cells[start:start+4096,None,:]-palette[None,:,:])**2).sum(-1)
+        lookup[start:start+4096] = dists.argmin(1)
+    return lookup
+
+def _fillPalette(palette, nColors=256):
+    """Add evenly spaced colors of a 6x6x6 color cube to a palette with spare entries
+    """
+    nSpare = nColors-len(palette)
+    if nSpare<=0:
+        return palette
+    levels = numpy.arange(6)*51
+    cube = numpy.array([[r,g,b] for r in levels for g in levels for b in levels], numpy.uint8)
+    cube = cube[~numpy.in1d(_packColors(cube), _packColors(palette))]
+    cube = cube[numpy.linspace(0, len(cube)-1, min(nSpare, len(cube))).astype(int)]
+    return numpy.concatenate([palette, cube])
+
+class GifWriter:
+    """Writes an animated GIF one frame at a time (so frames needn't all be in
+    memory), using delta coding. Frames are numpy uint8 arrays [h,w,3] (top row
+    first) or PIL images.
+
+    The palette (a uint8 array [nColors,3]) can be given or else is made from
+    the first frame (see makePaletteFast), with any spare entries filled from
+    a color cube. Colors of later frames that are not in the palette are drawn
+    with the nearest palette color.
+    """
+    def __init__(self, fileName, palette=None, fps=None, loop=True):
+        self.fileName=fileName
+        self.palette=palette
+        self.fps=fps
+        self.loop=loop
+        self.nFrames=0
+        self._lookup=None
+        self._previous=None
+        self._file=open(fileName, 'wb')
+    def addFrame(self, frame):
+        frame = numpy.asarray(frame)
+        if frame.ndim==2:#luminance
+            frame = numpy.repeat(frame[:,:,None], 3, axis=2)
+        frame = frame[:,:,:3]
+        if self.palette is None:
+            self.palette = _fillPalette(makePaletteFast([frame]))
+        if self._lookup is None:
+            self._lookup = _nearestColorLookup(self.palette)
+        indices = paletteIndices(frame, self.palette, lookup=self._lookup)
+        im = Image.fromarray(indices, 'P')
+        palette = numpy.zeros([256,3], numpy.uint8)
+        palette[:len(self.palette)] = self.palette
+        im.putpalette(palette.ravel().tolist())
+        if self._previous is None:
+            header = getheader(im)
+            if isinstance(header, tuple):#newer PIL also returns the palette used
+                header = header[0]
+            if header[0][:6]=='GIF87a':#the extensions below need 89a
+                header[0] = 'GIF89a'+header[0][6:]
+            for s in header:
+                self._file.write(s)
+            if self.loop:#NETSCAPE2.0 extension: loop forever
+                self._file.write('\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+            bbox = None
+        else:
+            #only write the region that changed
+            changed = indices!=self._previous
+            rows = numpy.flatnonzero(changed.any(1))
+            cols = numpy.flatnonzero(changed.any(0))
+            if len(rows):
+                bbox = (int(cols[0]), int(rows[0]), int(cols[-1])+1, int(rows[-1])+1)
             else:
-                for s in getdata(im):
-                    fp.write(s)
-
-        previous = im.copy()
-        frames = frames + 1
-    fp.write(";")
-    fp.close()
-    return frames
+                bbox = (0, 0, 1, 1)#nothing changed, but GIF needs something
+        if self.fps:#graphic control extension, to set the frame duration
+            delay = int(round(100.0/self.fps))
+            self._file.write('\x21\xf9\x04\x04' + chr(delay & 255) + chr(delay >> 8) + '\x00\x00')
+        if bbox is None:
+            data = getdata(im)
+        else:
+            data = getdata(im.crop(bbox), offset=bbox[:2])
+        for s in data:
+            self._file.write(s)
+        self._previous = indices
+        self.nFrames+=1
+    def close(self):
+        if self._file is not None:
+            self._file.write(";")
+            self._file.close()
+            self._file=None
 
 
 def RgbHistogram (images, verbose=False):
     """build a histogram of the colors in the image(s)
     with which we can build an optimized color palette"""
-    hist = None
-
     #make a list if given only one image
-    if type(images)== type([]):
-        nImages = len(images)
-    else:
-        nImages=1
+    if type(images)!= type([]):
         images= [images]
-
-    # Form a histogram dictionary whose keys are the repr(color)
     if verbose:    print 'optimising palette ...'
-    datalist=[]
-    for imgRgb in images:
-        datalist.extend(imgRgb.getdata())
-
-    dicthist = {}
-    xsize, ysize = imgRgb.size
-    numcolors = 0
-    for i in xrange (xsize * ysize * nImages):
-        color = datalist [i]
-        key = repr (color)
-
-        if dicthist.has_key (key):  # color already exists
-            dicthist [key] += 1     # increment the count
-        else:                       # make a new key
-            dicthist [key] = 1      # instantiate a new entry and init the count
-            numcolors += 1
-
-            if numcolors > 256:
-                if verbose:    print '               ... too many colors'
-                return None         # Error flag:  use PIL default color palette/dithering
+    colors, counts = _colorCounts([numpy.asarray(im) for im in images])
+    if len(colors) > 256:
+        if verbose:    print '               ... too many colors'
+        return None         # Error flag:  use PIL default color palette/dithering
     if verbose:    print '               ... OK'
-
-    # reform the dictionary into a sorted histogram of the form: (count, (r, g, b))
-    hist = []
-    for key in dicthist.iterkeys():
-        count = dicthist [key]
-        color = eval (key)
-        hist.append ( (count, color) )
-    #end for
-
-    hist.sort()
-    hist.reverse()           # make largest counts first
-
-    return hist
+    # a sorted histogram of the form: (count, (r, g, b)), largest counts first
+    order = numpy.argsort(counts, kind='mergesort')[::-1]
+    return [(int(counts[i]), tuple(colors[i].tolist())) for i in order]
 
 #end def RgbHistogram
 
@@ -202,30 +322,15 @@ def rgb2palette (imgRgb, palette=None, verbose=False):     # image could be a "R
         palette=makePalette(imgRgb)
 
     numPalette= numpy.reshape(numpy.asarray(palette), [256,3])
-    listPalette = numPalette.tolist()
     imgP = Image.new ('P', size)            # Create a brand new paletted image
     imgP.putpalette (palette)               # Install the palette
 
     # Rewrite the entire image using new palette's indices.
     if verbose:    print 'Defining the new image using the newly created palette ...'
 
-    # Each pixel gets a palette color index
-    if datalist == None:
-        datalist = list (imgRgb.getdata())      # xsize*ysize list of color 3-tuples
-    #end if
-
-    pxlctr = 0
-    colctr = 0
-    for yord in xrange (ysize):
-        for xord in xrange (xsize):
-            pxlcolor = list(datalist [yord*xsize + xord])     # org image color tuple
-
-            if pxlcolor in listPalette:
-                index = listPalette.index(list(pxlcolor))
-            else: index=0
-            #paletteindex = colorsAndIndices [index] [1]     # a simple lookup
-
-            imgP.putpixel ((xord, yord), index)
+    # Each pixel gets a palette color index (or 0 if its color isn't in the palette)
+    indices = paletteIndices(numpy.asarray(imgRgb), numPalette)
+    imgP.putdata(indices.ravel().tolist())
 
     if hasalpha:
         indexleastused, leastcount = Getalphaindex (imgP, maskinv)
@@ -288,6 +393,151 @@ def makeMPEG(filename, images, codec='mpeg1video', codecParams = None, verbose=F
     fw.close()
 
 
+# --------------------------------------------------------------------
+# frame writers: take frames one at a time (e.g. from a Window's movie capture)
+
+class ImageFrameWriter:
+    """Saves each frame (a numpy uint8 array of shape [height,width,3], top row
+    first) as a numbered image file, e.g. frame00001.png, frame00002.png...
+    """
+    def __init__(self, fileName, nDigits=5):
+        self.fileRoot, self.fileExt = os.path.splitext(fileName)
+        self.nameFormat = "%s%%0%dd%s" %(self.fileRoot, nDigits, self.fileExt)
+        self.nFrames=0
+    def addFrame(self, frame):
+        self.nFrames+=1
+        Image.fromarray(numpy.ascontiguousarray(frame)).save(self.nameFormat %self.nFrames)
+    def close(self):
+        pass
+
+class RawVideoWriter:
+    """Appends frames (uint8 arrays of shape [height,width,3]) to a file of raw
+    RGB pixels. The shape is written to fileName+'.txt' on close() so that
+    the video can be memory-mapped with loadRawVideo(fileName)
+    """
+    def __init__(self, fileName, fps=30):
+        self.fileName=fileName
+        self.fps=fps
+        self.nFrames=0
+        self.frameShape=None
+        self._file=open(fileName, 'wb')
+    def addFrame(self, frame):
+        if self.frameShape is None:
+            self.frameShape=frame.shape
+        elif frame.shape!=self.frameShape:
+            raise ValueError("RawVideoWriter frames must all be the same size")
+        numpy.ascontiguousarray(frame, numpy.uint8).tofile(self._file)
+        self.nFrames+=1
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file=None
+        if self.frameShape is None:
+            return
+        info = open(self.fileName+'.txt', 'w')
+        info.write('nFrames=%i\nheight=%i\nwidth=%i\nchannels=%i\nfps=%s\n'
+            %((self.nFrames,)+tuple(self.frameShape)+(self.fps,)))
+        info.close()
+
+def loadRawVideo(fileName):
+    """Returns the frames of a video saved by RawVideoWriter as a (read-only)
+    numpy memmap of shape [nFrames, height, width, 3]
+    """
+    info={}
+    for line in open(fileName+'.txt'):
+        key, val = line.strip().split('=')
+        info[key]=val
+    shape = tuple([int(info[key]) for key in ['nFrames','height','width','channels']])
+    return numpy.memmap(fileName, dtype=numpy.uint8, mode='r', shape=shape)
+
+class PipeVideoWriter:
+    """Sends raw RGB frames to the stdin of another program (e.g. an encoder
+    such as ffmpeg). The command can include {width}, {height} and {fps}, which
+    are filled in when the first frame arrives, e.g.::
+
+        'ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {width}x{height} -r {fps} -i - movie.mp4'
+
+    """
+    def __init__(self, command, fps=30):
+        self.command=command
+        self.fps=fps
+        self.nFrames=0
+        self._proc=None
+    def addFrame(self, frame):
+        if self._proc is None:
+            cmd = self.command.format(width=frame.shape[1], height=frame.shape[0], fps=self.fps)
+            self._proc = subprocess.Popen(shlex.split(cmd), stdin=subprocess.PIPE)
+        self._proc.stdin.write(numpy.ascontiguousarray(frame, numpy.uint8).data)
+        self.nFrames+=1
+    def close(self):
+        if self._proc is not None:
+            self._proc.stdin.close()
+            self._proc.wait()
+            self._proc=None
+
+def getFrameWriter(fileName, fps=30):
+    """Returns a frame writer for fileName, based on its extension:
+
+        - '.gif' gives a GifWriter
+        - '.raw' or '.rgb' gives a RawVideoWriter
+        - a fileName starting with '|' gives a PipeVideoWriter (the rest being the command)
+        - any other extension gives an ImageFrameWriter (any format PIL can write)
+
+    An object that already has addFrame() and close() methods is returned as it is.
+    """
+    if hasattr(fileName, 'addFrame'):
+        return fileName
+    if fileName.startswith('|'):
+        return PipeVideoWriter(fileName[1:].strip(), fps=fps)
+    fileExt = os.path.splitext(fileName)[1].lower()
+    if fileExt in ['.raw', '.rgb']:
+        return RawVideoWriter(fileName, fps=fps)
+    if fileExt=='.gif':
+        return GifWriter(fileName, fps=fps)
+    return ImageFrameWriter(fileName)
+
+def _writeFramesProcess(fileName, fps, frames):
+    """Runs in the MovieWriterProcess: writes frames from the queue until None"""
+    writer = getFrameWriter(fileName, fps=fps)
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        writer.addFrame(frame)
+    writer.close()
+
+class MovieWriterProcess:
+    """Runs a frame writer (see getFrameWriter) in a separate process, so
+    that encoding (e.g. to GIF) doesn't compete with the experiment for the
+    python interpreter. Has the same addFrame() and close() methods as the
+    writers, so it can be given to Window.startMovieCapture()::
+
+        win.startMovieCapture(makeMovies.MovieWriterProcess('stimulus.gif', fps=30))
+
+    No more than maxQueued frames wait to be sent to the process at a time
+    (addFrame waits if the process falls that far behind).
+    """
+    def __init__(self, fileName, fps=30, maxQueued=10):
+        import multiprocessing
+        self.fileName=fileName
+        self.nFrames=0
+        self._frames = multiprocessing.Queue(maxQueued)
+        self._process = multiprocessing.Process(target=_writeFramesProcess,
+            args=(fileName, fps, self._frames))
+        self._process.daemon=True
+        self._process.start()
+    def addFrame(self, frame):
+        self._frames.put(numpy.ascontiguousarray(frame))
+        self.nFrames+=1
+    def close(self):
+        """Wait for the process to write the remaining frames and close the file"""
+        if self._process is not None:
+            self._frames.put(None)
+            self._process.join()
+            self._process=None
+
+
 qtCodecQuality= {
   'lossless':   0x00000400,
   'max':        0x000003FF,
@@ -163,6 +163,7 @@ class Monitor:
         self.calibNames = []
         self._gammaInterpolator=None
         self._gammaInterpolator2=None
+        self._nCalibChanges=0#so that cached unit conversions (e.g. in a Window) know to update
         self._loadAll()
         if len(self.calibNames)>0:
             self.setCurrent(-1) #will fetch previous vals if monitor exists
@@ -194,12 +195,15 @@ class Monitor:
 #functions to set params of current calibration
     def setSizePix(self, pixels):
         self.currentCalib['sizePix']=pixels
+        self._nCalibChanges+=1
     def setWidth(self, width):
         """Of the viewable screen (cm)"""
         self.currentCalib['width']=width
+        self._nCalibChanges+=1
     def setDistance(self, distance):
         """To the screen (cm)"""
         self.currentCalib['distance']=distance
+        self._nCalibChanges+=1
     def setCalibDate(self, date=None):
         """Sets the calibration to a given date/time or to the current
         date/time if none given. (Also returns the date as set)"""
@@ -451,6 +455,7 @@ class Monitor:
             return False
 
         self.currentCalib = self.calibs[self.currentCalibName]      #do the import
+        self._nCalibChanges+=1
         logging.info("Loaded calibration from:%s" %self.currentCalibName)
 
         return self.currentCalibName
@@ -24,8 +24,8 @@
 
 # General settings
 [general]
-    # which system to use as a backend for drawing
-    winType = option('pyglet', 'pygame', default='pyglet')
+    # which system to use as a backend for drawing ('offscreen' draws with no visible window)
+    winType = option('pyglet', 'pygame', 'offscreen', default='pyglet')
     # the default units for windows and visual stimuli
     units = option('deg', 'norm', 'cm', 'pix', default='norm')
     # full screen is best for accurate timing
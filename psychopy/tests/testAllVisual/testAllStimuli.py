@@ -38,6 +38,67 @@ class _baseVisualTest:
             stim.setAutoDraw(False)
             assert stim.status==visual.FINISHED
             assert stim.status==visual.STOPPED
+    def testGLCallCounts(self):
+        win = self.win
+        stims = [visual.PatchStim(win, mask='gauss', autoLog=False) for n in range(3)]
+        for stim in stims:
+            stim.setAutoDraw(True)
+        win.setRecordGLCalls(True)
+        win.flip(); win.flip()
+        win.setRecordGLCalls(False)
+        for stim in stims:
+            stim.setAutoDraw(False)
+        assert len(win.glCallCounts)==2 and win.glCallCounts[-1]>0
+        assert not isinstance(visual.GL, visual._GLCallCounter)
+    def testFlipProfiler(self):
+        win = self.win
+        stim = visual.PatchStim(win, mask='gauss', autoLog=False)
+        stim.setAutoDraw(True)
+        win.setRecordFlipPhases(True, nFrames=5)
+        for frameN in range(7):
+            win.flip()
+        #times stay with their own stimulus as the autoDraw list changes
+        other = visual.PatchStim(win, mask='gauss', name='other', autoLog=False)
+        other.setAutoDraw(True)
+        win.flip()
+        stim.setAutoDraw(False)
+        win.flip()
+        win.setRecordFlipPhases(False)
+        other.setAutoDraw(False)
+        prof = win.flipProfiler
+        assert prof.getPhaseTimes().shape==(5, len(prof.phases))
+        assert prof.stimNames==['PatchStim', 'other']
+        drawn = ~numpy.isnan(prof.getStimTimes()[:,:2])
+        assert (drawn==[[1,0],[1,0],[1,0],[1,1],[0,1]]).all()
+        assert 'swap' in prof.getSummary()
+    def testTextureCache(self):
+        win = self.win
+        #stimuli with the same mask should share a single texture
+        gabors = [visual.PatchStim(win, mask='gauss', sf=3) for n in range(5)]
+        maskIDs = set([gabor.maskID.value for gabor in gabors])
+        assert len(maskIDs)==1
+        gabors[0].setMask('circle')
+        assert gabors[0].maskID.value not in maskIDs
+        gabors[0].draw()
+        for gabor in gabors:
+            gabor.clearTextures()
+        for entry in visual.textureCache._entries.values():
+            assert entry['refs']==0
+    def testImagePreloader(self):
+        win = self.win
+        fileName = os.path.join(utils.TESTS_DATA_PATH, 'gabor1_norm.png')
+        preloader = visual.ImagePreloader(nThreads=1)
+        visual.imagePreloader, oldPreloader = preloader, visual.imagePreloader
+        try:
+            preloader.preload([fileName, 'notAFile.png', 0.5])
+            visual.textureCache.clear()#make sure the texture gets created
+            image = visual.PatchStim(win, tex=fileName)
+            image.draw()
+            stats = preloader.getStats()
+            assert stats['hits']+stats['waits']==1
+            assert stats['misses']==0
+        finally:
+            visual.imagePreloader = oldPreloader
     def testGabor(self):
         win = self.win
         contextName=self.contextName
@@ -57,6 +118,44 @@ class _baseVisualTest:
         gabor.setPos([-0.5*self.scaleFactor,0.5*self.scaleFactor],'+')
         gabor.draw()
         utils.compareScreenshot('gabor2_%s.png' %(contextName), win)
+    def testGratingDrift(self):
+        win = self.win
+        #changing phase/sf/size with .set() shouldn't rebuild the list but should
+        #look just like a stimulus created with those values
+        grating = visual.PatchStim(win, tex='sin', mask='circle', sf=1.0/self.scaleFactor,
+            size=self.scaleFactor, autoLog=False)
+        grating.draw(); win.flip()
+        grating.setPhase(0.3)
+        grating.setSF(3.0/self.scaleFactor)
+        grating.setSize(1.5*self.scaleFactor, units=win.units)
+        assert not grating.needUpdate
+        grating.draw()
+        drifted = win.getFrameArray(buffer='back').astype(float)
+        win.flip()
+        visual.PatchStim(win, tex='sin', mask='circle', sf=3.0/self.scaleFactor, phase=0.3,
+            size=1.5*self.scaleFactor, autoLog=False).draw()
+        fresh = win.getFrameArray(buffer='back').astype(float)
+        win.flip()
+        assert numpy.mean(abs(drifted-fresh))<1
+    def testProcedural(self):
+        win = self.win
+        if not win._haveShaders:
+            raise nose.plugins.skip.SkipTest("procedural textures need shaders")
+        #the shader versions should look like the textures they replace
+        for tex, mask in [('sin','gauss'), ('sinXsin','circle'), ('sin','raisedCos')]:
+            frames=[]
+            for procedural in [False, True]:
+                visual.PatchStim(win, tex=tex, mask=mask, sf=2.0/self.scaleFactor,
+                    size=self.scaleFactor, texRes=256, interpolate=True,
+                    procedural=procedural, autoLog=False).draw()
+                frames.append(win.getFrameArray(buffer='back').astype(float))
+                win.flip()
+            assert numpy.mean(abs(frames[0]-frames[1]))<2, "procedural %s/%s differs" %(tex,mask)
+        #changing maskParams of a procedural mask needs no new texture
+        stim = visual.PatchStim(win, mask='raisedCos', procedural=True, autoLog=False)
+        stim.setMaskParams({'fringeWidth':0.5})
+        stim.draw()
+        win.flip()
     #def testMaskMatrix(self):
     #    #aims to draw the exact same stimulus as in testGabor, but using filters
     #    win=self.win
@@ -98,6 +197,24 @@ class _baseVisualTest:
         stim.draw()
         #compare with a LIBERAL criterion (fonts do differ)
         utils.compareScreenshot('text2_%s.png' %(contextName), win, crit=30)
+        #changing back to a previous string reuses its layout (no new glyphs)
+        layout = stim._layout
+        stim.setText('yy')
+        stim.setText('y')
+        assert stim._layout is layout
+        nGlyphs = len(stim._atlas._advances)
+        stim.setText('yyy y')
+        assert len(stim._atlas._advances)==nGlyphs
+        if win.winType=='pyglet':#(pygame only has one window at a time)
+            #another window has its own glyphs, which go when it's closed
+            win2 = visual.Window([128,128], winType='pyglet', units=win.units, allowGUI=False)
+            stim2 = visual.TextStim(win2, text='y', height=1.0*self.scaleFactor, font=font)
+            stim2.draw()
+            assert stim2._atlas is not stim._atlas
+            win2.close()
+            assert stim2._atlas not in visual._glyphAtlases.values()
+            assert stim._atlas in visual._glyphAtlases.values()
+            win._setCurrent()
 
     def testMov(self):
         win = self.win
@@ -143,6 +260,43 @@ class _baseVisualTest:
         wedge.setAngularPhase(0.1)
         wedge.draw()
         utils.compareScreenshot('wedge2_%s.png' %(contextName), win, crit=10.0)
+    def testRadialShaders(self):
+        win = self.win
+        if not win._haveShaders:
+            raise nose.plugins.skip.SkipTest("the per-pixel RadialStim needs shaders")
+        #the shader and the triangles should agree (apart from the facets at the edge)
+        wedge = visual.RadialStim(win, tex='sqrXsqr', size=2*self.scaleFactor,
+            visibleWedge=[0, 270], radialCycles=3, angularCycles=4, angularRes=400,
+            autoLog=False)
+        for phase in [0, 0.25]:
+            wedge.setAngularPhase(phase)
+            wedge.setRadialPhase(phase)
+            wedge.draw()
+            withShaders = win.getFrameArray(buffer='back').astype(float)
+            win.flip()
+            wedge.setUseShaders(False)
+            wedge.draw()
+            withTriangles = win.getFrameArray(buffer='back').astype(float)
+            win.flip()
+            wedge.setUseShaders(True)
+            assert numpy.mean(abs(withShaders-withTriangles))<5, \
+                "RadialStim differs with/without shaders (phase %.2f)" %phase
+    def testNoiseStim(self):
+        win = self.win
+        generators = ['bank']
+        if win._haveShaders: generators.append('shader')
+        for generator in generators:
+            for noiseType in ['white', 'binary', 'gauss', 'filtered']:
+                frames=[]
+                for seed in [1, 1]:#the same seed should give the same noise
+                    noise = visual.NoiseStim(win, noiseType=noiseType, noiseRes=64,
+                        size=self.scaleFactor, seed=seed, generator=generator, autoLog=False)
+                    for frameN in range(2):
+                        noise.draw()
+                        frames.append(win.getFrameArray(buffer='back'))
+                        win.flip()
+                assert (frames[0]==frames[2]).all() and (frames[1]==frames[3]).all()
+                assert (frames[0]!=frames[1]).any(), "%s noise didn't change" %noiseType
     def testDots(self):
         #NB we can't use screenshots here - just check that no errors are raised
         win = self.win
@@ -172,6 +326,13 @@ class _baseVisualTest:
             msg="dots._signalDots failed to change after dots.setCoherence()")
         nose.tools.assert_false(numpy.alltrue(prevPosRend==dots._fieldPosRendered),
             msg="dots._fieldPosRendered failed to change after dots.setPos()")
+        #textured point sprites
+        dots.setMask('gauss')
+        dots.draw()
+        win.flip()
+        dots.setMask(None)
+        nose.tools.assert_true(dots._dotMaskID is None,
+            msg="dots.setMask(None) failed to remove the dot mask")
     def testElementArray(self):
         win = self.win
         contextName=self.contextName
@@ -188,6 +349,42 @@ class _baseVisualTest:
             sfs=3.0, xys=xys, oris=thetas)
         spiral.draw()
         utils.compareScreenshot('elarray1_%s.png' %(contextName), win)
+    def testElementArrayVBO(self):
+        win = self.win
+        contextName=self.contextName
+        if not win._haveShaders:
+            raise nose.plugins.skip.SkipTest("ElementArray requires shaders, which aren't available")
+        win.flip()
+        #should give identical results to the client-side arrays
+        thetas = numpy.arange(0,360,10)
+        N=len(thetas)
+        radii = numpy.linspace(0,1.0,N)*self.scaleFactor
+        x, y = misc.pol2cart(theta=thetas, radius=radii)
+        xys = numpy.array([x,y]).transpose()
+        spiral = visual.ElementArrayStim(win, nElements=N,sizes=0.5*self.scaleFactor,
+            sfs=3.0, xys=xys, oris=0, useVBO=True)
+        spiral.draw()#uploads the full buffers
+        win.flip()
+        spiral.setOris(thetas)#only the changed elements get uploaded
+        spiral.draw()
+        utils.compareScreenshot('elarray1_%s.png' %(contextName), win)
+        win.flip()
+        #values changed in place and passed back (as the stim's own array or
+        #the caller's) must still be uploaded
+        shift = numpy.array([0.2, 0.1])*self.scaleFactor
+        spiral.xys[:] += shift
+        spiral.setXYs(spiral.xys)
+        xys += shift
+        spiral.setXYs(xys)
+        xys += shift
+        spiral.setXYs(xys)
+        spiral.draw()
+        moved = win.getFrameArray(buffer='back')
+        win.flip()
+        visual.ElementArrayStim(win, nElements=N,sizes=0.5*self.scaleFactor,
+            sfs=3.0, xys=xys, oris=thetas).draw()
+        assert (win.getFrameArray(buffer='back')==moved).all()
+        win.flip()
     def testAperture(self):
         win = self.win
         contextName=self.contextName
@@ -201,6 +398,35 @@ class _baseVisualTest:
         grating.draw()
         utils.compareScreenshot('aperture1_%s.png' %(contextName), win)
         #aperture should automatically disable on exit
+    def testApertureMove(self):
+        #moving an aperture (which only erases where it was) should match making it there
+        win = self.win
+        if not win.allowStencil:
+            raise nose.plugins.skip.SkipTest("needs a stencil buffer")
+        grating = visual.PatchStim(win, mask=None, sf=8.0, size=2, units='norm', autoLog=False)
+        vertices = [[-0.5,-0.5], [0.5,-0.5], [0,0], [0,0.5]]#concave
+        x, y = numpy.mgrid[-1:1:64j, -1:1:64j]
+        image = numpy.where(x**2+y**2<0.8, 1.0, -1.0)#a disc
+        win.clearBuffer()
+        blank = win.getFrameArray(buffer='back')
+        frames = []
+        for shape in ['circle', vertices, image]:
+            aperture = visual.Aperture(win, size=0.5*self.scaleFactor, shape=shape,
+                pos=[-0.4*self.scaleFactor, 0])
+            win.flip()#(which leaves the GL color transparent) before moving it
+            aperture.setPos([0.3*self.scaleFactor, 0.2*self.scaleFactor])
+            aperture.setOri(30)
+            grating.draw()
+            frames.append(win.getFrameArray(buffer='back'))
+            assert not (frames[-1]==blank).all()
+            win.clearBuffer()
+            aperture = visual.Aperture(win, size=0.5*self.scaleFactor, shape=shape, ori=30,
+                pos=[0.3*self.scaleFactor, 0.2*self.scaleFactor])
+            grating.draw()
+            assert (win.getFrameArray(buffer='back')==frames[-1]).all()
+            win.clearBuffer()
+            aperture.disable()
+        assert not (frames[0]==frames[1]).all()
     def testRatingScale(self):
         # try to avoid text; avoid default / 'triangle' because it does not display on win XP
         win = self.win
@@ -217,6 +443,84 @@ class _baseVisualTest:
         #make sure that we're successfully syncing to the frame rate
         msPFavg, msPFstd, msPFmed = visual.getMsPerFrame(self.win,nFrames=60, showVisual=True)
         nose.tools.ok_(1000/150.0 < msPFavg < 1000/40.0, "Your frame period is %.1fms which suggests you aren't syncing to the frame" %msPFavg)
+    def testMovieCapture(self):
+        import tempfile, shutil
+        from psychopy import makeMovies
+        win = self.win
+        outDir = tempfile.mkdtemp()
+        fileName = os.path.join(outDir, 'frames.raw')
+        win.startMovieCapture(fileName)
+        for frameN in range(4):
+            win.flip()
+        nFrames = win.stopMovieCapture()
+        frames = makeMovies.loadRawVideo(fileName)
+        assert nFrames==4
+        assert frames.shape==(4, win.size[1], win.size[0], 3)
+        del frames
+        shutil.rmtree(outDir)
+        #frames the writer fails on aren't counted as written
+        class FlakyWriter:
+            nCalls=0
+            def addFrame(self, frame):
+                self.nCalls+=1
+                if self.nCalls%2==0:
+                    raise IOError('disk full')
+            def close(self):
+                pass
+        win.startMovieCapture(FlakyWriter())
+        for frameN in range(4):
+            win.flip()
+        assert win.stopMovieCapture()==2
+    def testFrameIntervalRecorder(self):
+        win = self.win
+        win.setRecordFrameIntervals(True)
+        for frameN in range(6):
+            win.flip()
+        win.setRecordFrameIntervals(False)
+        stats = win.frameIntervals.getStats()
+        assert stats['n']==len(win.frameIntervals)==5#the first flip isn't recorded
+        assert stats['counts'].sum()==5
+        nose.tools.assert_almost_equal(stats['mean'], numpy.mean(win.frameIntervals))
+        win.frameIntervals.clear()
+    def testFrameArray(self):
+        win = self.win
+        stim = visual.PatchStim(win, tex=None, mask=None, color=[1,-1,-1], autoLog=False)
+        stim.draw()
+        frame = win.getFrameArray(buffer='back')
+        assert frame.shape==(win.size[1], win.size[0], 3) and frame.dtype==numpy.uint8
+        win.getMovieFrame(buffer='back')
+        assert (numpy.asarray(win.movieFrames.pop())==frame).all()
+        win.flip()
+        if win.winType=='offscreen':#the front buffer of a real window can be covered
+            assert (win.getFrameArray(buffer='front')==frame).all()
+
+def testUnitConverter():
+    class _Win:
+        monitor = monitors.Monitor('testMonitor')
+    win = _Win()
+    win.monitor.setDistance(57.0)
+    win.monitor.setWidth(40.0)
+    win.monitor.setSizePix([1024,768])
+    conv = visual.UnitConverter(win)
+    xys = numpy.random.uniform(-10, 10, [100,2])
+    out = numpy.zeros([100,2], numpy.float32)
+    assert conv.sizeToPix(xys, 'deg', out=out) is out
+    assert numpy.allclose(out, misc.deg2pix(xys, win.monitor), rtol=1e-5)
+    assert numpy.allclose(conv.toPix(xys, 'cm'), misc.cm2pix(xys, win.monitor))
+    win.monitor.setDistance(114.0)#should be noticed
+    nose.tools.assert_almost_equal(conv.sizeToPix(1.0, 'deg'), misc.deg2pix(1.0, win.monitor))
+    conv.exactDegrees = True
+    assert numpy.allclose(conv.pixToUnits(conv.toPix(xys, 'deg'), 'deg'), xys)
+    nose.tools.assert_almost_equal(conv.toPix(45.0, 'deg'), misc.cm2pix(114.0, win.monitor))
+
+def _makeBatchPatch(win, ori):
+    return visual.PatchStim(win, tex='sin', mask='gauss', ori=ori, autoLog=False)
+def testRenderBatch():
+    #(in this process, because the windows of the tests above are open)
+    conds = [{'ori':ori} for ori in [0, 45, 90, 0]]
+    frames = visual.renderBatch(_makeBatchPatch, conds, size=[64,64], nProcesses=1, progress=False)
+    assert len(frames)==4 and frames[0].shape==(64,64,3)
+    assert (frames[0]==frames[3]).all() and not (frames[0]==frames[2]).all()
 
 #create different subclasses for each context/backend
 class TestPygletNorm(_baseVisualTest):
@@ -277,6 +581,23 @@ class TestPygletDeg(_baseVisualTest):
             units='deg')
         self.contextName='deg'
         self.scaleFactor=2#applied to size/pos values
+class TestOffscreenNorm(_baseVisualTest):
+    @classmethod
+    def setupClass(self):
+        self.win = visual.Window([128,128], winType='offscreen', allowStencil=True)
+        self.contextName='norm'
+        self.scaleFactor=1#applied to size/pos values
+class TestOffscreenDeg(_baseVisualTest):
+    @classmethod
+    def setupClass(self):
+        mon = monitors.Monitor('testMonitor')
+        mon.setDistance(57.0)
+        mon.setWidth(40.0)
+        mon.setSizePix([1024,768])
+        self.win = visual.Window([128,128], monitor=mon, winType='offscreen', allowStencil=True,
+            units='deg')
+        self.contextName='deg'
+        self.scaleFactor=2#applied to size/pos values
 class TestPygameNorm(_baseVisualTest):
     @classmethod
     def setupClass(self):
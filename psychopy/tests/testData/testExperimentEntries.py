@@ -0,0 +1,87 @@
+"""Tests for the column-wise storage of ExperimentHandler entries"""
+import os, shutil, codecs, cPickle
+from os.path import join as pjoin
+from tempfile import mkdtemp
+import numpy
+
+from psychopy import data
+
+class TestExperimentEntries:
+    def setUp(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
+        self.exp = data.ExperimentHandler(name='entries', extraInfo={'participant':'jwp'},
+            savePickle=False, saveWideText=False)
+        trials = data.TrialHandler([{'ori':0, 'word':'cat'},{'ori':90, 'word':u'caf\xe9'}],
+            nReps=3, method='sequential', name='trials')
+        self.exp.addLoop(trials)
+        for trial in trials:
+            trials.addData('rt', 0.1*trials.thisN)
+            if trials.thisN%2:
+                trials.addData('key', 'left')
+            if trials.thisN==3:
+                self.exp.addData('intensity', 3)
+            if trials.thisN==4:
+                self.exp.addData('intensity', 3.5)#mixed types are kept as they were
+            self.exp.nextEntry()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_entries(self):
+        entries = self.exp.entries
+        assert len(entries)==6
+        assert entries[1]['key']=='left' and 'key' not in entries[0]
+        assert entries[3]['intensity']==3 and type(entries[3]['intensity'])==int
+        assert entries[4]['intensity']==3.5
+        assert entries[5]['participant']=='jwp' and entries[5]['word']==u'caf\xe9'
+        #survives pickling
+        assert cPickle.loads(cPickle.dumps(self.exp)).entries==entries
+        #the list is a copy, but can be assigned back
+        entries.append({'note':'added'})
+        assert len(self.exp.entries)==6
+        self.exp.entries = entries
+        assert len(self.exp.entries)==7 and self.exp.entries[6]=={'note':'added'}
+        assert self.exp.entries[5]==entries[5]
+
+    def test_wide_text(self):
+        fileName = pjoin(self.temp_dir, 'entries.csv')
+        self.exp.saveAsWideText(fileName)
+        lines = codecs.open(fileName, encoding='utf-8').read().splitlines()
+        header = lines[0].split(',')
+        assert len(lines)==7
+        for entry, line in zip(self.exp.entries, lines[1:]):
+            for name, val in zip(header, line.split(',')):
+                if name:
+                    assert val==(u'%s' %entry[name] if name in entry else u'')
+
+    def test_columns(self):
+        fileName = pjoin(self.temp_dir, 'entries')
+        self.exp.saveAsColumns(fileName)
+        f = numpy.load(fileName+'.npz')
+        names = list(f['_names'])
+        rtN = names.index('rt')
+        assert f['col%i.values' %rtN].dtype==numpy.float64
+        assert numpy.allclose(f['col%i.values' %rtN], numpy.arange(6)*0.1)
+        keyN = names.index('key')
+        keys = f['col%i.table' %keyN][f['col%i.codes' %keyN]]
+        assert list(keys[1::2])==['left']*3 and (f['col%i.codes' %keyN][::2]==-1).all()
+        f.close()
+
+    def test_load_columns(self):
+        fileName = pjoin(self.temp_dir, 'entries')
+        self.exp.saveAsColumns(fileName)
+        self.exp.addData('rt', 9.0)
+        self.exp.addData('extra', 'new')
+        self.exp.nextEntry()
+        self.exp.saveAsColumns(fileName, compressed=True)#renamed to entries_1.npz
+        fileNames = [fileName+'.npz', fileName+'_1.npz']
+        cols = data.loadColumns(fileNames, columns=['rt', 'key', 'extra'])
+        assert sorted(cols.keys())==['_file', 'extra', 'key', 'rt']
+        assert list(cols['_file'])==[0]*6+[1]*7
+        assert numpy.allclose(cols['rt'][:12], numpy.tile(numpy.arange(6)*0.1, 2))
+        assert cols['rt'][12]==9.0
+        assert cols['extra'].mask[:12].all() and cols['extra'][12]=='new'
+        assert list(cols['key'][1:6:2])==['left']*3 and cols['key'].mask[0:6:2].all()
+        #a single uncompressed file is memory-mapped
+        rt = data.loadColumns(fileNames[0], columns=['rt'])['rt']
+        assert isinstance(rt.data, numpy.memmap)
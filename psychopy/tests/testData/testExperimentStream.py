@@ -0,0 +1,60 @@
+"""Tests for streaming ExperimentHandler entries to file"""
+import os, shutil, codecs
+from os.path import join as pjoin
+from tempfile import mkdtemp
+
+from psychopy import data
+from nose.tools import raises
+
+class TestExperimentStream:
+    def setUp(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
+        self.fileName = pjoin(self.temp_dir, 'streamed')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_stream_matches_entries(self):
+        exp = data.ExperimentHandler(name='streamed', extraInfo={'participant':'jwp'},
+            dataFileName=self.fileName, streamWideText=True, savePickle=False,
+            flushRows=2)
+        trials = data.TrialHandler([{'ori':0},{'ori':90}], nReps=2, method='sequential')
+        exp.addLoop(trials)
+        for trial in trials:
+            trials.addData('rt', 0.5)
+            if trials.thisN==2:
+                exp.addData('late', 'only here')#a column that turns up part way through
+            exp.nextEntry()
+        #the loop has ended, so the entries are on disk before we close
+        lines = codecs.open(self.fileName+'.csv', encoding='utf-8').readlines()
+        assert len(lines)==5
+        assert os.path.exists(self.fileName+'.csv.columns')
+        assert exp.entries==[]
+        exp.closeStream()
+        lines = codecs.open(self.fileName+'.csv', encoding='utf-8').readlines()
+        header = lines[0].rstrip().split(',')[:-1]
+        assert 'late' in header and 'participant' in header and 'rt' in header
+        assert not os.path.exists(self.fileName+'.csv.columns')
+        #the earlier rows have been padded to the full width
+        assert lines[1].count(',')==lines[3].count(',')==len(header)
+
+    def test_stream_bytes(self):
+        exp = data.ExperimentHandler(name='streamed', dataFileName=self.fileName,
+            streamWideText=True, savePickle=False)
+        exp.addData('word', 'caf\xc3\xa9')#a utf-8 byte string
+        exp.nextEntry()
+        exp.closeStream()
+        lines = codecs.open(self.fileName+'.csv', encoding='utf-8').readlines()
+        assert lines[1]==u'caf\xe9,\n'
+
+    @raises(ValueError)
+    def test_stream_error(self):
+        class Unwritable(object):
+            def __unicode__(self):
+                raise ValueError('not today')
+        exp = data.ExperimentHandler(name='streamed', dataFileName=self.fileName,
+            streamWideText=True, savePickle=False)
+        exp.addData('thing', Unwritable())
+        exp.nextEntry()
+        exp._streamWriter.sync()#the error from the thread is raised here, rather than hanging
+
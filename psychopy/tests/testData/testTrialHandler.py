@@ -6,6 +6,7 @@ import nose
 from nose.tools import raises
 from tempfile import mkdtemp
 from numpy.random import random, randint
+import numpy
 
 from psychopy import data
 from psychopy.tests.utils import TESTS_PATH
@@ -141,6 +142,50 @@ class TestTrialHandler:
         txtCorr = open('corrRandom.csv', 'r').read()
         assert txtActual==txtCorr
 
+    def testColumnsOutput(self):
+        conditions=[{'trialType':trialType, 'label':'type%i' %trialType} for trialType in range(5)]
+        trials= data.TrialHandler(trialList=conditions, seed=100, nReps=3, method='random',
+            extraInfo={'participant':'jwp'})
+        for thisTrial in trials:
+            trials.addData('rt', thisTrial['trialType']/10.0)
+        trials.saveAsColumns(pjoin(self.temp_dir, 'testRandom'))
+        cols = data.loadColumns(pjoin(self.temp_dir, 'testRandom.npz'))
+        assert list(cols['TrialNumber'])==range(1,16)
+        assert (cols['participant']=='jwp').all()
+        assert cols['trialType'].dtype.kind=='i'
+        #the rows are in the order the trials were run
+        order = trials.sequenceIndices.T.flatten()
+        assert list(cols['trialType'])==list(order)
+        assert list(cols['label'])==['type%i' %n for n in order]
+        assert numpy.allclose(cols['rt'], order/10.0)
+
+    def testConditionsSource(self):
+        fileName = pjoin(self.temp_dir, 'conds.csv')
+        f = open(fileName, 'w')
+        f.write('word,freq,pos\n')
+        for n in range(50):
+            f.write('w%i,%f,"[%i, 1]"\n' %(n, n/7.0, n))
+        f.close()
+        conditions = data.importConditions(fileName, useCache=False)
+        source = data.ConditionsSource(fileName)
+        assert len(source)==50 and source.fieldNames==['word', 'freq', 'pos']
+        assert source[-1]==conditions[-1]
+        trials = data.TrialHandler(source, nReps=2, seed=100, method='random')
+        listTrials = data.TrialHandler(conditions, nReps=2, seed=100, method='random')
+        assert trials.data['ran'].shape==(50, 2)
+        for thisTrial in trials:
+            assert thisTrial==listTrials.next()
+            assert thisTrial.word==u'w%i' %trials.thisIndex
+            trials.addData('rt', 0.5)
+        trials.saveAsWideText(pjoin(self.temp_dir, 'fromSource.csv'), delim=',', appendFile=False)
+        lines = open(pjoin(self.temp_dir, 'fromSource.csv')).readlines()
+        assert len(lines)==101 and lines[0].startswith('TrialNumber,')
+        #a quoted value with a line break can't be indexed by lines
+        f = open(fileName, 'w')
+        f.write('word,note\nw1,"two\nlines"\n')
+        f.close()
+        nose.tools.assert_raises(ImportError, data.ConditionsSource, fileName)
+
 class TestMultiStairs:
     def setUp(self):
         self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
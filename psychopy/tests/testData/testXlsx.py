@@ -58,3 +58,61 @@ def testTrialTypeImport():
             if trialXLSX[header] != trialCSV[header]:
                 print header, trialCSV[header], trialXLSX[header]
             assert trialXLSX[header] == trialCSV[header]
+
+def testConditionsTypesAndCache():
+    tmpDir = tempfile.mkdtemp()
+    fileName = os.path.join(tmpDir, 'conds.csv')
+    f = open(fileName, 'w')
+    f.write('n,x,word,pos\n1,0.5,cat,"[1, 2]"\n2,,dog,"(3, 4)"\n')
+    f.close()
+    for useCache in [False, True, True]:#parse, parse and cache, then from the cache
+        conds = data.importConditions(fileName, useCache=useCache)
+        assert [cond['n'] for cond in conds]==[1, 2]
+        assert conds[0]['x']==0.5 and numpy.isnan(conds[1]['x'])
+        assert conds[1]['word']==u'dog'
+        assert conds[0]['pos']==[1, 2] and conds[1]['pos']==u'(3, 4)'#tuples only from xlsx
+    #a changed file isn't read from the cache
+    f = open(fileName, 'w')
+    f.write('n,x,word,pos\n5,0.5,cat,"[1, 2]"\n')
+    f.close()
+    assert data.importConditions(fileName)[0]['n']==5
+    shutil.rmtree(tmpDir)
+
+def testConditionsNoCode():
+    tmpDir = tempfile.mkdtemp()
+    fileName = os.path.join(tmpDir, 'conds.csv')
+    f = open(fileName, 'w')
+    f.write('val\n"[__import__(\'os\').getcwd()]"\n')
+    f.close()
+    #not a literal, so it stays as text rather than being run
+    assert data.importConditions(fileName, useCache=False)[0]['val']==u"[__import__('os').getcwd()]"
+    shutil.rmtree(tmpDir)
+
+def testConditionsBool():
+    tmpDir = tempfile.mkdtemp()
+    fileName = os.path.join(tmpDir, 'conds.csv')
+    f = open(fileName, 'w')
+    f.write('isTarget,word,side\nTrue,cat,(left)\nfalse,dog,(1)\n')
+    f.close()
+    for useCache in [False, True, True]:
+        conds = data.importConditions(fileName, useCache=useCache)
+        assert conds[0]['isTarget'] is True and conds[1]['isTarget'] is False
+        assert conds[0]['side']==u'(left)' and conds[1]['side']==u'(1)'
+    source = data.ConditionsSource(fileName)
+    assert source[0]['isTarget'] is True and source[1]['isTarget'] is False
+    shutil.rmtree(tmpDir)
+
+def testConditionsCachePruned():
+    tmpDir = tempfile.mkdtemp()
+    for n in range(5):
+        fileName = os.path.join(tmpDir, '%i.pkl' %n)
+        open(fileName, 'wb').write('x'*1000)
+        os.utime(fileName, (n*100, n*100))#so 0.pkl is the least recently used
+    maxFiles = data._conditionsCacheMaxFiles
+    data._conditionsCacheMaxFiles = 3
+    try:
+        data._pruneConditionsCache(tmpDir)
+    finally:
+        data._conditionsCacheMaxFiles = maxFiles
+    assert sorted(os.listdir(tmpDir))==['2.pkl', '3.pkl', '4.pkl']
+    shutil.rmtree(tmpDir)
@@ -0,0 +1,39 @@
+from psychopy import makeMovies
+import numpy, tempfile, shutil, os
+import Image
+
+def _frames(nFrames=4):
+    frames=[]
+    for frameN in range(nFrames):
+        frame = numpy.zeros([60,80,3], numpy.uint8)
+        frame[:,:] = [10,20,30]
+        frame[10:30, 5+frameN*5:25+frameN*5] = [200,100,50]
+        frames.append(frame)
+    return frames
+
+def testPaletteExact():
+    frames = _frames()
+    palette = makeMovies.makePaletteFast(frames)
+    assert len(palette)==2
+    indices = makeMovies.paletteIndices(frames[0], palette)
+    assert (palette[indices]==frames[0]).all()
+
+def testPaletteMedianCut():
+    rng = numpy.random.RandomState(1)
+    frame = (rng.rand(50,50,3)*255).astype(numpy.uint8)
+    palette = makeMovies.makePaletteFast([frame], maxColors=16)
+    assert len(palette)<=16
+
+def testGifWriter():
+    tmpDir = tempfile.mkdtemp()
+    fileName = os.path.join(tmpDir, 'test.gif')
+    frames = _frames()
+    writer = makeMovies.GifWriter(fileName, fps=30)
+    for frame in frames:
+        writer.addFrame(frame)
+    writer.close()
+    im = Image.open(fileName)
+    for frameN, frame in enumerate(frames):#each is composited from the deltas
+        im.seek(frameN)
+        assert (numpy.asarray(im.convert('RGB'))==frame).all()
+    shutil.rmtree(tmpDir)
@@ -4,7 +4,8 @@
 # Copyright (C) 2012 Jonathan Peirce
 # Distributed under the terms of the GNU General Public License (GPL).
 
-import sys, os, platform, time, glob, copy
+import sys, os, platform, time, glob, copy, operator
+import threading, Queue
 #on windows try to load avbin now (other libs can interfere)
 if sys.platform=='win32':
     #make sure we also check in SysWOW64 if on 64-bit windows
@@ -116,7 +117,9 @@ class Window:
                  viewPos  = None,
                  viewOri  = 0.0,
                  waitBlanking=True,
-                 allowStencil=False):
+                 allowStencil=False,
+                 sortAutoDraw=False,
+                 exactDegrees=False):
         """
         :Parameters:
 
@@ -130,8 +133,12 @@ class Window:
                 Better timing can be achieved in full-screen mode
             allowGUI :  *None*, True or False (if None prefs are used)
                 If set to False, window will be drawn with no frame and no buttons to close etc...
-            winType :  *None*, 'pyglet', 'pygame'
-                If None then PsychoPy will revert to user/site preferences
+            winType :  *None*, 'pyglet', 'pygame', 'offscreen'
+                If None then PsychoPy will revert to user/site preferences.
+                'offscreen' draws into an openGL framebuffer object with no
+                visible window (and no waiting for the screen refresh), e.g. for
+                generating stimulus images or movies, or running tests. Use
+                getFrameArray() or getMovieFrame() to get the frames.
             monitor : *None*, string or a `~psychopy.monitors.Monitor` object
                 The monitor to be used during the experiment
             units :  *None*, 'height' (of the window), 'norm' (normalised),'deg','cm','pix'
@@ -154,6 +161,16 @@ class Window:
             allowStencil : True or *False*
                 When set to True, this allows operations that use the OpenGL stencil buffer
                 (notably, allowing the class:`~psychopy.visual.Aperture` to be used).
+            sortAutoDraw : True or *False*
+                If True then stimuli with autoDraw set are drawn grouped by stimulus
+                type and texture (rather than in the order they were added), which
+                saves GL state changes in scenes with many stimuli. Only use this if
+                the order of drawing doesn't matter (e.g. the stimuli don't overlap).
+            exactDegrees : True or *False*
+                If True then stimulus positions and sizes in 'deg' are converted
+                to pixels using the tangent of the angle, rather than the usual
+                linear approximation (which is accurate near the centre of the
+                screen). See :class:`UnitConverter`.
 
             :note: Preferences. Some parameters (e.g. units) can now be given default values in the user/site preferences and these will be used if None is given here. If you do specify a value here it will take precedence over preferences.
 
@@ -282,9 +299,10 @@ class Window:
         #setup the context
         if self.winType == "pygame": self._setupPygame()
         elif self.winType == "pyglet": self._setupPyglet()
+        elif self.winType == "offscreen": self._setupOffscreen()
 
         #check whether shaders are supported
-        if self.winType=='pyglet':#we can check using gl_info
+        if self.winType in ['pyglet','offscreen']:#we can check using gl_info
             if pyglet.gl.gl_info.get_version()>='2.0':
                 self._haveShaders=True #also will need to check for ARB_float extension, but that should be done after context is created
             else:
@@ -293,18 +311,30 @@ class Window:
             self._haveShaders=False
 
         self._setupGL()
+        if self.winType=='offscreen':
+            self._setupOffscreenBuffers()
         self.frameClock = core.Clock()#from psycho/core
         self.frames = 0         #frames since last fps calc
         self.movieFrames=[] #list of captured frames (Image objects)
+        self._frameCapture=None#see startMovieCapture()
+        self._autoCapture=False
 
         self.recordFrameIntervals=False
         self.recordFrameIntervalsJustTurnedOn=False # Allows us to omit the long timegap that follows each time turn it off
         self.nDroppedFrames=0
-        self.frameIntervals=[]
+        self.frameIntervals=FrameIntervalRecorder()
         self._toLog=[]
         self._toDraw=[]
         self._toDrawDepths=[]
+        self.sortAutoDraw=sortAutoDraw
         self._eventDispatchers=[]
+        self._unitScales={}#cached by setScale()
+        self.unitConverter=UnitConverter(self, exactDegrees=exactDegrees)
+        self._uniformLocations={}#(program, name):location
+        self.recordGLCalls=False
+        self.glCallCounts=[]
+        self.flipProfiler=None#see setRecordFlipPhases()
+        self._profileFlip=False
         try:
             self.origGammaRamp=self.getGammaRamp()
         except:
@@ -317,13 +347,20 @@ class Window:
         self.lastFrameT = core.getTime()
 
         self.waitBlanking = waitBlanking
+        if self.winType=='offscreen':
+            self.waitBlanking=False#there is no screen to wait for
 
         self._refreshThreshold=1/1.0#initial val needed by flip()
-        self._monitorFrameRate = self._getActualFrameRate()#over several frames with no drawing
+        if self.winType=='offscreen':
+            self._monitorFrameRate = None
+        else:
+            self._monitorFrameRate = self._getActualFrameRate()#over several frames with no drawing
         if self._monitorFrameRate != None:
             self._refreshThreshold = (1.0/self._monitorFrameRate)*1.2
         else:
             self._refreshThreshold = (1.0/60)*1.2#guess its a flat panel
+        if isinstance(self.frameIntervals, FrameIntervalRecorder):
+            self.frameIntervals.refreshThreshold = self._refreshThreshold
 
         openWindows.append(self)
 
@@ -345,6 +382,8 @@ class Window:
         self.frameClock.reset()
     def saveFrameIntervals(self, fileName=None, clear=True):
         """Save recorded screen frame intervals to disk, as comma-separated values.
+        (For long sessions see also :class:`FrameIntervalRecorder`, which
+        `win.frameIntervals` is, for running statistics and spilling to disk)
 
         :Parameters:
 
@@ -355,13 +394,59 @@ class Window:
         if fileName==None:
             fileName = 'lastFrameIntervals.log'
         if len(self.frameIntervals):
-            intervalStr = str(self.frameIntervals)[1:-1]
             f = open(fileName, 'w')
-            f.write(intervalStr)
+            numpy.savetxt(f, numpy.asarray(self.frameIntervals).reshape([1,-1]), fmt='%r', delimiter=', ')
             f.close()
         if clear:
-            self.frameIntervals=[]
+            self._clearFrameIntervals()
             self.frameClock.reset()
+    def _clearFrameIntervals(self):
+        if isinstance(self.frameIntervals, FrameIntervalRecorder):
+            self.frameIntervals.clear()
+        else:#the user replaced it (e.g. with a list)
+            self.frameIntervals=[]
+    def setRecordFlipPhases(self, value=True, nFrames=1000, maxStims=50):
+        """Record the duration of each phase of flip() (and the draw() of each
+        autoDraw stimulus) for the last `nFrames` frames, in a
+        :class:`FrameProfiler` available as `win.flipProfiler`.
+
+        Turning this off keeps the profiler (and its data) until it is next
+        turned on.
+        """
+        if value and (self.flipProfiler is None or not self._profileFlip):
+            self.flipProfiler = FrameProfiler(nFrames=nFrames, maxStims=maxStims)
+        self._profileFlip = value
+    def setRecordGLCalls(self, value=True):
+        """Count the openGL calls made on each frame (to check the cost of a
+        scene). The count for each frame is appended to `win.glCallCounts` on
+        flip(). Commands inside display lists are not counted separately (the
+        glCallList counts as one).
+
+        Counting makes each call a little slower so leave this off during
+        experiments.
+        """
+        global GL
+        if value and not isinstance(GL, _GLCallCounter):
+            GL = _GLCallCounter(pyglet.gl)
+        elif not value and isinstance(GL, _GLCallCounter):
+            if not [win for win in openWindows if win is not self and win.recordGLCalls]:
+                GL = pyglet.gl
+        self.recordGLCalls=value
+        if isinstance(GL, _GLCallCounter):
+            GL.nCalls=0
+    def _setCurrent(self):
+        """Make this window's openGL context the current one, if it isn't already
+        (switching context is costly, so stimuli call this rather than switch_to)
+        """
+        if self.winType in ['pyglet','offscreen'] and GL.current_context is not self.winHandle.context:
+            self.winHandle.switch_to()
+    def _getUniformLocation(self, program, name):
+        """Look up the location of a shader uniform (only once for each program)
+        """
+        key = (program, name)
+        if key not in self._uniformLocations:
+            self._uniformLocations[key] = GL.glGetUniformLocation(program, name)
+        return self._uniformLocations[key]
     def onResize(self, width, height):
         '''A default resize event handler.
 
@@ -401,8 +486,20 @@ class Window:
         win.flip(clearBuffer=True)#results in a clear screen after flipping
         win.flip(clearBuffer=False)#the screen is not cleared (so represent the previous screen)
         """
-        for thisStim in self._toDraw:
-            thisStim.draw()
+        if self._profileFlip: prof = self.flipProfiler
+        else: prof = None
+        toDraw = self._toDraw
+        if self.sortAutoDraw:
+            toDraw = sorted(toDraw, key=_renderStateKey)#a stable sort, so depth order is kept within groups
+        if prof:
+            prof.startFrame(toDraw)
+            for stimN, thisStim in enumerate(toDraw):
+                thisStim.draw()
+                prof.stimDrawn(stimN)
+            prof.mark(1)
+        else:
+            for thisStim in toDraw:
+                thisStim.draw()
 
         if haveFB:
             #need blit the frambuffer object to the actual back buffer
@@ -419,10 +516,14 @@ class Window:
             GL.glTexCoord2f( 1.0, 1.0 ) ; GL.glVertex2f( 1.0,   1.0 )
             GL.glTexCoord2f( 1.0, 0.0 ) ; GL.glVertex2f( 1.0,   -1.0 )
             GL.glEnd()
+        if prof: prof.mark(2)
 
         #update the bits++ LUT
         if self.bitsMode in ['fast','bits++']:
             self.bits._drawLUTtoScreen()
+        if prof: prof.mark(3)
+        if self._autoCapture and self._frameCapture is not None:
+            self._frameCapture.capture(buffer='back')#the frame about to be shown
 
         if self.winType =="pyglet":
             #make sure this is current context
@@ -433,16 +534,30 @@ class Window:
             for dispatcher in self._eventDispatchers:
                 dispatcher._dispatch_events()
             self.winHandle.dispatch_events()#this might need to be done even more often than once per frame?
+            if prof: prof.mark(4)
             pyglet.media.dispatch_events()#for sounds to be processed
+            if prof: prof.mark(5)
             self.winHandle.flip()
             #self.winHandle.clear()
             GL.glLoadIdentity()
+        elif self.winType=="offscreen":
+            #nothing is shown (so nothing to wait for) and there are no user events
+            self._setCurrent()
+            for dispatcher in self._eventDispatchers:
+                dispatcher._dispatch_events()
+            if prof: prof.mark(4)
+            pyglet.media.dispatch_events()#for sounds to be processed
+            if prof: prof.mark(5)
+            self._swapOffscreenBuffers(keepFrame=not clearBuffer)
+            GL.glLoadIdentity()
         else:
             if pygame.display.get_init():
+                if prof: prof.mark(4); prof.mark(5)
                 pygame.display.flip()
                 pygame.event.pump()#keeps us in synch with system event queue
             else:
                 core.quit()#we've unitialised pygame so quit
+        if prof: prof.mark(6)
 
         #rescale/reposition view of the window
         if self.viewScale != None:
@@ -464,11 +579,13 @@ class Window:
         if haveFB:
             #set rendering back to the framebuffer object
             FB.glBindFramebufferEXT(FB.GL_FRAMEBUFFER_EXT, self.frameBuffer)
+        if prof: prof.mark(7)
 
         #reset returned buffer for next frame
         if clearBuffer: GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
         else: GL.glClear(GL.GL_DEPTH_BUFFER_BIT)#always clear the depth bit
         self._defDepth=0.0#gets gradually updated through frame
+        if prof: prof.mark(8)
 
         #waitBlanking
         if self.waitBlanking:
@@ -480,6 +597,7 @@ class Window:
                 GL.glVertex2i(10,10)#this corrupts text rendering on win with some ATI cards :-(
             GL.glEnd()
             GL.glFinish()
+        if prof: prof.mark(9)
 
         #get timestamp
         now = logging.defaultClock.getTime()
@@ -498,11 +616,19 @@ class Window:
                    elif self.nDroppedFrames==reportNDroppedFrames:
                        logging.warning("Multiple dropped frames have occurred - I'll stop bothering you about them!")
 
+        if self.recordGLCalls:
+            self.glCallCounts.append(GL.nCalls)
+            GL.nCalls=0
+        if prof: prof.mark(10)
+
         #log events
         for logEntry in self._toLog:
             #{'msg':msg,'level':level,'obj':copy.copy(obj)}
             logging.log(msg=logEntry['msg'], level=logEntry['level'], t=now, obj=logEntry['obj'])
         self._toLog = []
+        if prof:
+            prof.mark(11)
+            prof.endFrame()
 
     def update(self):
         """Deprecated: use Window.flip() instead
@@ -556,32 +682,106 @@ class Window:
         Frames are stored in memory until a .saveMovieFrames(filename) command
         is issued. You can issue getMovieFrame() as often
         as you like and then save them all in one go when finished.
+
+        During :meth:`startMovieCapture` the frame is instead read asynchronously
+        and written to that file.
         """
+        if self._frameCapture is not None:
+            self._frameCapture.capture(buffer=buffer)
+            return
         im = self._getFrame(buffer=buffer)
         self.movieFrames.append(im)
 
+    def startMovieCapture(self, fileName, fps=30, autoCapture=True, nBuffers=3,
+            maxQueued=10, dropFrames=False, writerProcess=False):
+        """Start writing frames straight to disk (or to another program) as
+        they are drawn, rather than storing them in memory. Reading the pixels
+        overlaps with drawing the next frames (using pixel buffer objects) and
+        the frames are written on a background thread. See :class:`FrameCapture`.
+
+        :Parameters:
+
+            fileName:
+                an image file name (e.g. 'frame.png' gives frame00001.png,
+                frame00002.png...), an animated '.gif', a '.raw' file (raw RGB frames that can be
+                loaded with makeMovies.loadRawVideo), or '|' followed by a
+                command to pipe raw RGB frames to, e.g.
+                '|ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {width}x{height} -r {fps} -i - movie.mp4'.
+                An object with addFrame(frame) and close() methods can also be given.
+            autoCapture:
+                if True every flip() captures the frame it shows, otherwise call
+                getMovieFrame() for the frames you want
+            nBuffers, maxQueued, dropFrames:
+                see :class:`FrameCapture`
+            writerProcess:
+                if True the frames are encoded and written by a separate process
+                (see makeMovies.MovieWriterProcess), which is worthwhile for gif
+
+        Call :meth:`stopMovieCapture` to finish writing.
+        """
+        if self._frameCapture is not None:
+            self.stopMovieCapture()
+        if writerProcess and not hasattr(fileName, 'addFrame'):
+            writer = makeMovies.MovieWriterProcess(fileName, fps=fps, maxQueued=maxQueued)
+        else:
+            writer = makeMovies.getFrameWriter(fileName, fps=fps)
+        self._frameCapture = FrameCapture(self, writer, nBuffers=nBuffers,
+            maxQueued=maxQueued, dropFrames=dropFrames)
+        self._autoCapture = autoCapture
+    def stopMovieCapture(self):
+        """Finish writing the frames of :meth:`startMovieCapture` and close the file.
+        Returns the number of frames written (frames that were dropped or that
+        the writer failed to write are logged as warnings).
+        """
+        if self._frameCapture is None:
+            return 0
+        capture = self._frameCapture
+        self._frameCapture=None
+        capture.close()
+        if capture.nDropped:
+            logging.warning('%i movie frames were dropped because the writer could not keep up' %capture.nDropped)
+        if capture.nFailed:
+            logging.warning('%i movie frames could not be written (see the errors above)' %capture.nFailed)
+        return capture.nCaptured
+
     def _getFrame(self, buffer='front'):
         """
         Return the current Window as an image.
         """
-        #GL.glLoadIdentity()
-        #do the reading of the pixels
-        if buffer=='back':
+        return Image.fromarray(self.getFrameArray(buffer=buffer))
+    def getFrameArray(self, buffer='front', out=None):
+        """Return the current Window as a numpy array of uint8 with shape
+        [height, width, 3] (RGB, top row first).
+
+        Unlike getMovieFrame() nothing is stored, so this is the quickest way to
+        take frames from a window (particularly an offscreen one) for your own
+        processing. If `out` is given (an array of the right shape and type) the
+        frame is read into that rather than a new array.
+        """
+        width, height = int(self.size[0]), int(self.size[1])
+        frame = numpy.empty([height, width, 3], numpy.uint8)
+        self._setReadBuffer(buffer)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+        GL.glReadPixels(0, 0, width, height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE,
+            frame.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)))
+        if out is None:
+            return frame[::-1].copy()#GL rows start at the bottom
+        out[:] = frame[::-1]
+        return out
+    def _setReadBuffer(self, buffer='front'):
+        """Set the buffer ('front' or 'back') that glReadPixels reads from.
+        An offscreen window's front and back buffers are the two colour
+        attachments of its framebuffer object (see _swapOffscreenBuffers)
+        """
+        if self.winType=='offscreen':
+            if buffer=='back': n=self._offscreenBack
+            else: n=1-self._offscreenBack
+            GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0_EXT+n)
+        elif buffer=='back':
             GL.glReadBuffer(GL.GL_BACK)
         else:
             GL.glReadBuffer(GL.GL_FRONT)
 
-        #fetch the data with glReadPixels
-        #pyglet.gl stores the data in a ctypes buffer
-        bufferDat = (GL.GLubyte * (4 * self.size[0] * self.size[1]))()
-        GL.glReadPixels(0,0,self.size[0],self.size[1], GL.GL_RGBA,GL.GL_UNSIGNED_BYTE,bufferDat)
-        im = Image.fromstring(mode='RGBA',size=self.size, data=bufferDat)
-
-        im=im.transpose(Image.FLIP_TOP_BOTTOM)
-        im=im.convert('RGB')
-
-        return im
-
     def saveMovieFrames(self, fileName, mpgCodec='mpeg1video',
         fps=30, clearFrames=True):
         """
@@ -660,12 +860,9 @@ class Window:
         box = [(rect[0]/2. + 0.5)*x, (rect[1]/-2. + 0.5)*y, # Left Top in pix
                 (rect[2]/2. + 0.5)*x, (rect[3]/-2. + 0.5)*y] # Right Bottom in pix
         box = map(int, box)
-        if buffer=='back':
-            GL.glReadBuffer(GL.GL_BACK)
-        else:
-            GL.glReadBuffer(GL.GL_FRONT)
+        self._setReadBuffer(buffer)
 
-        if self.winType == 'pyglet': #pyglet.gl stores the data in a ctypes buffer
+        if self.winType in ['pyglet','offscreen']: #pyglet.gl stores the data in a ctypes buffer
             bufferDat = (GL.GLubyte * (4 * (box[2]-box[0]) * (box[3]-box[1])))()
             GL.glReadPixels(box[0], box[1], box[2]-box[0], box[3]-box[1], GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, bufferDat)
             #http://www.opengl.org/sdk/docs/man/xhtml/glGetTexImage.xml
@@ -692,15 +889,24 @@ class Window:
 
     def close(self):
         """Close the window (and reset the Bits++ if necess)."""
+        self.stopMovieCapture()#write any frames still being captured
         self.setMouseVisible(True)
+        self._setCurrent()
+        _clearGlyphAtlases(self)#their textures go with the window
         if self.winType=='pyglet':
             self.winHandle.close()
+        elif self.winType=='offscreen':
+            GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, 0)
+            GL.glDeleteFramebuffersEXT(1, ctypes.byref(self._offscreenFB))
+            GL.glDeleteRenderbuffersEXT(len(self._offscreenRBs), self._offscreenRBs)
+            self.winHandle.close()
         else:
             #pygame.quit()
             pygame.display.quit()
         if self.bitsMode!=None:
             self.bits.reset()
         openWindows.remove(self)
+        textureCache.clear(win=self)#those textures went with the window
         logging.flush()
 
     def fps(self):
@@ -774,7 +980,7 @@ class Window:
         else:
             desiredRGB = (self.rgb)/255.0
         if self.winHandle!=None:#if it is None then this will be done during window setup
-            if self.winType=='pyglet': self.winHandle.switch_to()
+            if self.winType in ['pyglet','offscreen']: self.winHandle.switch_to()
             GL.glClearColor(desiredRGB[0], desiredRGB[1], desiredRGB[2], 1.0)
 
     def setRGB(self, newRGB):
@@ -785,7 +991,7 @@ class Window:
             self.rgb=[newRGB, newRGB, newRGB]
         else:
             self.rgb=newRGB
-        if self.winType=='pyglet': self.winHandle.switch_to()
+        if self.winType in ['pyglet','offscreen']: self.winHandle.switch_to()
         GL.glClearColor((self.rgb[0]+1.0)/2.0, (self.rgb[1]+1.0)/2.0, (self.rgb[2]+1.0)/2.0, 1.0)
 
     def setScale(self, units, font='dummyFont', prevScale=(1.0,1.0)):
@@ -797,6 +1003,11 @@ class Window:
         The `units` can be 'height' (multiples of window height), 'norm'(normalised), 'pix'(pixels), 'cm' or
         'stroke_font'. The `font` parameter is only used if units='stroke_font'
         """
+        key = (units, self.size[0], self.size[1], self.scrWidthCM, self.scrWidthPIX, self.scrDistCM)
+        if key in self._unitScales:
+            thisScale = self._unitScales[key]/numpy.asarray(prevScale)
+            GL.glScalef(thisScale[0], thisScale[1], 1.0)
+            return thisScale
         if units=="norm":
             thisScale = numpy.array([1.0,1.0])
         elif units=="height":
@@ -820,6 +1031,8 @@ class Window:
             thisScale = cmScale * 0.017455 * self.scrDistCM
         elif units=="stroke_font":
             thisScale = numpy.array([2*font.letterWidth,2*font.letterWidth]/self.size/38.0)
+        if units!="stroke_font":
+            self._unitScales[key] = thisScale
         #actually set the scale as appropriate
         thisScale = thisScale/numpy.asarray(prevScale)#allows undoing of a previous scaling procedure
         GL.glScalef(thisScale[0], thisScale[1], 1.0)
@@ -940,6 +1153,76 @@ class Window:
             pygame.display.set_caption('PsychoPy')
         self.winHandle = pygame.display.set_mode(self.size.astype('i'),winSettings)
         pygame.display.set_gamma(1.0) #this will be set appropriately later
+    def _setupOffscreen(self):
+        #a pyglet window that is never shown provides the openGL context (so an
+        #X server is still needed, but Xvfb will do) and the drawing goes into a
+        #framebuffer object (see _setupOffscreenBuffers)
+        self.winType = "offscreen"
+        self._isFullScr = False
+        self.winHandle = pyglet.window.Window(width=int(self.size[0]), height=int(self.size[1]),
+                                              caption="PsychoPy (offscreen)",
+                                              visible=False
+                                          )
+        self.winHandle.on_resize = lambda width, height: None#don't let pyglet reset our view
+        self.winHandle.switch_to()
+        if not GL.gl_info.have_extension('GL_EXT_framebuffer_object'):
+            self.winHandle.close()
+            raise RuntimeError, "offscreen windows need openGL framebuffer objects (GL_EXT_framebuffer_object)"
+    def _setupOffscreenBuffers(self):
+        """Create the framebuffer object that an offscreen window draws into.
+
+        It has two colour renderbuffers that act as the back buffer (being drawn)
+        and the front buffer (the last frame flipped), swapping roles on each
+        flip(), and a depth (and stencil) renderbuffer.
+        """
+        width, height = int(self.size[0]), int(self.size[1])
+        self._offscreenFB = GL.GLuint()
+        GL.glGenFramebuffersEXT(1, ctypes.byref(self._offscreenFB))
+        GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, self._offscreenFB)
+        self._offscreenRBs = (GL.GLuint*3)()
+        GL.glGenRenderbuffersEXT(3, self._offscreenRBs)
+        for n in range(2):
+            GL.glBindRenderbufferEXT(GL.GL_RENDERBUFFER_EXT, self._offscreenRBs[n])
+            GL.glRenderbufferStorageEXT(GL.GL_RENDERBUFFER_EXT, GL.GL_RGBA8, width, height)
+            GL.glFramebufferRenderbufferEXT(GL.GL_FRAMEBUFFER_EXT, GL.GL_COLOR_ATTACHMENT0_EXT+n,
+                GL.GL_RENDERBUFFER_EXT, self._offscreenRBs[n])
+        GL.glBindRenderbufferEXT(GL.GL_RENDERBUFFER_EXT, self._offscreenRBs[2])
+        if self.allowStencil:
+            if not GL.gl_info.have_extension('GL_EXT_packed_depth_stencil'):
+                logging.error("Offscreen windows need GL_EXT_packed_depth_stencil to use the stencil buffer")
+            GL.glRenderbufferStorageEXT(GL.GL_RENDERBUFFER_EXT, GL.GL_DEPTH24_STENCIL8_EXT, width, height)
+            GL.glFramebufferRenderbufferEXT(GL.GL_FRAMEBUFFER_EXT, GL.GL_STENCIL_ATTACHMENT_EXT,
+                GL.GL_RENDERBUFFER_EXT, self._offscreenRBs[2])
+        else:
+            GL.glRenderbufferStorageEXT(GL.GL_RENDERBUFFER_EXT, GL.GL_DEPTH_COMPONENT24, width, height)
+        GL.glFramebufferRenderbufferEXT(GL.GL_FRAMEBUFFER_EXT, GL.GL_DEPTH_ATTACHMENT_EXT,
+            GL.GL_RENDERBUFFER_EXT, self._offscreenRBs[2])
+        GL.glBindRenderbufferEXT(GL.GL_RENDERBUFFER_EXT, 0)
+        status = GL.glCheckFramebufferStatusEXT(GL.GL_FRAMEBUFFER_EXT)
+        if status != GL.GL_FRAMEBUFFER_COMPLETE_EXT:
+            raise RuntimeError, "Couldn't create the offscreen framebuffer (status %#x)" %status
+        #glBlitFramebuffer lets flip(clearBuffer=False) keep the frame for the next one
+        self._haveFBBlit = GL.gl_info.have_extension('GL_EXT_framebuffer_blit')
+        self._offscreenBack = 0
+        GL.glDrawBuffer(GL.GL_COLOR_ATTACHMENT0_EXT)
+        GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0_EXT)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT|GL.GL_DEPTH_BUFFER_BIT|GL.GL_STENCIL_BUFFER_BIT)
+    def _swapOffscreenBuffers(self, keepFrame=False):
+        """The offscreen equivalent of swapping the front and back buffers. If
+        keepFrame then the new back buffer starts as a copy of the frame just
+        drawn (as the screen is left after flip(clearBuffer=False)).
+        """
+        if keepFrame and not self._haveFBBlit:
+            return#just keep drawing into the same buffer
+        back = self._offscreenBack
+        self._offscreenBack = 1-back
+        if keepFrame:
+            width, height = int(self.size[0]), int(self.size[1])
+            GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0_EXT+back)
+            GL.glDrawBuffer(GL.GL_COLOR_ATTACHMENT0_EXT+1-back)
+            GL.glBlitFramebufferEXT(0, 0, width, height, 0, 0, width, height,
+                GL.GL_COLOR_BUFFER_BIT, GL.GL_NEAREST)
+        GL.glDrawBuffer(GL.GL_COLOR_ATTACHMENT0_EXT+1-back)
     def _setupGL(self):
 
         #setup screen color
@@ -972,13 +1255,20 @@ class Window:
         #this needs to be done AFTER the context has been created
         if not GL.gl_info.have_extension('GL_ARB_texture_float'):
             self._haveShaders=False
+        #images can be used at their own size (rather than resized to a square
+        #power-of-two) and uploaded as 16bit floats if the card supports it
+        self._haveNPOT = GL.gl_info.have_version(2,0) or \
+            GL.gl_info.have_extension('GL_ARB_texture_non_power_of_two')
+        self._haveHalfFloat = GL.gl_info.have_extension('GL_ARB_half_float_pixel')
 
-        if self.winType=='pyglet' and self._haveShaders:
+        if self.winType in ['pyglet','offscreen'] and self._haveShaders:
             #we should be able to compile shaders (don't just 'try')
             self._progSignedTexMask = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragSignedColorTexMask)#fragSignedColorTexMask
             self._progSignedTex = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragSignedColorTex)
             self._progSignedTexMask1D = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragSignedColorTexMask1D)
             self._progSignedTexFont = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragSignedColorTexFont)
+            self._progRadial = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragRadial)
+            self._progProcedural = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragProcedural)
 #        elif self.winType=='pygame':#on PyOpenGL we should try to get an init value
 #            from OpenGL.GL.ARB import shader_objects
 #            if shader_objects.glInitShaderObjectsARB():
@@ -1081,7 +1371,7 @@ class Window:
                 else: scrStr = " (%i)" %self.screen
                 logging.debug('Screen%s actual frame rate measured at %.2f' %(scrStr,rate))
                 self.setRecordFrameIntervals(recordFrmIntsOrig)
-                self.frameIntervals=[]
+                self._clearFrameIntervals()
                 return rate
         #if we got here we reached end of maxFrames with no consistent value
         logging.warning("Couldn't measure a consistent frame rate.\n" + \
@@ -1089,6 +1379,467 @@ class Window:
             "  - Are you running other processes on your computer?\n")
         return None
 
+class FrameCapture:
+    """Captures frames of a :class:`Window` without stalling it, and passes them
+    to a frame writer (see makeMovies.getFrameWriter) on a background thread.
+    Usually created with :meth:`Window.startMovieCapture`.
+
+    Where the card supports pixel buffer objects the pixels of each frame are
+    read into one of a ring of `nBuffers` PBOs, and only copied out (to a numpy
+    array) `nBuffers-1` captures later, by which time the card has finished the
+    transfer, so the read overlaps with drawing the following frames. Without
+    PBOs glReadPixels is used directly (which waits for the frame to finish).
+
+    At most `maxQueued` frames wait for the writer. If the writer falls behind
+    then capture() waits for it, unless dropFrames=True, in which case the
+    frame is dropped (and counted in nDropped).
+
+    nCaptured counts the frames the writer has written and nFailed those
+    for which it raised an error.
+    """
+    def __init__(self, win, writer, nBuffers=3, maxQueued=10, dropFrames=False):
+        self.win=win
+        self.writer=writer
+        self.dropFrames=dropFrames
+        self.nCaptured=self.nDropped=self.nFailed=0
+        self.width, self.height = int(win.size[0]), int(win.size[1])
+        self.nBytes = self.width*self.height*3
+        self.usePBO = GL.gl_info.have_version(2,1) or GL.gl_info.have_extension('GL_ARB_pixel_buffer_object')
+        self.nBuffers = max(1, nBuffers)
+        self._pending=[]#PBOs that have been read into (oldest first)
+        if self.usePBO:
+            self._pboIDs = (GL.GLuint*self.nBuffers)()
+            GL.glGenBuffers(self.nBuffers, self._pboIDs)
+            for pboID in self._pboIDs:
+                GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pboID)
+                GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, self.nBytes, None, GL.GL_STREAM_READ)
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+            self._nextPBO=0
+        #a pool of frame arrays, so that memory use is bounded and nothing is allocated per frame
+        self._free = Queue.Queue()
+        for n in range(maxQueued+1):
+            self._free.put(numpy.empty([self.height, self.width, 3], numpy.uint8))
+        self._toWrite = Queue.Queue()
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon=True
+        self._thread.start()
+    def capture(self, buffer='back'):
+        """Start reading the current frame from `buffer` ('back' or 'front')
+        """
+        self.win._setReadBuffer(buffer)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+        if not self.usePBO:
+            frame = self._getFreeFrame()
+            if frame is not None:
+                GL.glReadPixels(0, 0, self.width, self.height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE,
+                    frame.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)))
+                self._toWrite.put(frame)
+            return
+        if len(self._pending)==self.nBuffers:#all in use, so collect the oldest
+            self._collect()
+        pboID = self._pboIDs[self._nextPBO]
+        self._nextPBO = (self._nextPBO+1)%self.nBuffers
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pboID)
+        GL.glReadPixels(0, 0, self.width, self.height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, None)#into the PBO, returns at once
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        self._pending.append(pboID)
+        if len(self._pending)==self.nBuffers:#the oldest has had nBuffers-1 frames to arrive
+            self._collect()
+    def _getFreeFrame(self):
+        if self.dropFrames:
+            try:
+                return self._free.get_nowait()
+            except Queue.Empty:
+                self.nDropped+=1
+                return None
+        return self._free.get()
+    def _collect(self):
+        """Copy the oldest pending PBO into a frame array and queue it for writing
+        """
+        pboID = self._pending.pop(0)
+        frame = self._getFreeFrame()
+        if frame is None:
+            return
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pboID)
+        ptr = GL.glMapBuffer(GL.GL_PIXEL_PACK_BUFFER, GL.GL_READ_ONLY)
+        if ptr:
+            ctypes.memmove(frame.ctypes.data, ptr, self.nBytes)
+            self._toWrite.put(frame)
+        else:
+            self._free.put(frame)
+            self.nDropped+=1
+        GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+    def _write(self):
+        while True:
+            frame = self._toWrite.get()
+            if frame is None:
+                break
+            try:
+                self.writer.addFrame(frame[::-1])#GL rows start at the bottom
+            except Exception, err:
+                logging.error('Failed to write movie frame: %s' %err)
+                self.nFailed+=1
+            else:
+                self.nCaptured+=1
+            self._free.put(frame)
+    def close(self):
+        """Collect any frames still in PBOs, wait for the writer to finish them,
+        and close the writer
+        """
+        while self._pending:
+            self._collect()
+        self._toWrite.put(None)
+        self._thread.join()
+        self.writer.close()
+        if self.usePBO:
+            GL.glDeleteBuffers(self.nBuffers, self._pboIDs)
+            self.usePBO=False
+
+class UnitConverter:
+    """Converts positions and sizes in 'deg' or 'cm' to pixels (and back) for
+    the Monitor of a :class:`Window`. Each Window has one, as `win.unitConverter`,
+    which stimuli use to find their size and position in pixels.
+
+    The pixels per unit are only worked out again when the Monitor (or its
+    calibration) changes, rather than on each call, and arrays can be
+    converted into an existing array with `out` (so that e.g. the dots of a
+    DotStim are converted with a single multiply each frame, with nothing
+    allocated). If you edit `monitor.currentCalib` directly, rather than with
+    the Monitor's set methods, then call :meth:`invalidate`.
+
+    Degrees are converted linearly by default (as misc.deg2pix does), which is
+    accurate near the centre of the screen. With exactDegrees=True positions
+    are converted with the tangent of the angle (the point on the flat screen
+    at that angle to the line of sight through its centre) and sizes as the
+    width of something subtending that angle at the centre of the screen.
+    """
+    def __init__(self, win, exactDegrees=False):
+        self.win=win
+        self.exactDegrees=exactDegrees
+        self.invalidate()
+    def invalidate(self):
+        """Work out the pixels per unit again (on the next conversion)
+        """
+        self._monitor=None
+        self._nCalibChanges=None
+        self._factors={}#units:pixels per unit
+    def getFactor(self, units):
+        """Return the pixels per unit (linear) for 'deg', 'cm' or 'pix'
+        """
+        monitor = self.win.monitor
+        if monitor is not self._monitor or getattr(monitor, '_nCalibChanges', None)!=self._nCalibChanges:
+            self._factors={}
+            self._monitor=monitor
+            self._nCalibChanges=getattr(monitor, '_nCalibChanges', None)
+        if units in self._factors:
+            return self._factors[units]
+        if units in ['pix', 'pixels']: factor=1.0
+        elif units in ['deg', 'degs']: factor=float(psychopy.misc.deg2pix(1.0, monitor))
+        elif units=='cm': factor=float(psychopy.misc.cm2pix(1.0, monitor))
+        elif units=='distance':#the viewing distance in pixels
+            factor=float(psychopy.misc.cm2pix(monitor.getDistance(), monitor))
+        else:
+            raise ValueError, "UnitConverter can't convert units '%s' to pixels" %units
+        self._factors[units]=factor
+        return factor
+    def toPix(self, pos, units, out=None):
+        """Convert position(s) in `units` (from the centre of the screen) to pixels
+        """
+        if self.exactDegrees and units in ['deg', 'degs']:
+            out = numpy.multiply(pos, pi/180, *_outArgs(out))
+            out = numpy.tan(out, *_outArgs(out))
+            return numpy.multiply(out, self.getFactor('distance'), *_outArgs(out))
+        return numpy.multiply(pos, self.getFactor(units), *_outArgs(out))
+    def sizeToPix(self, size, units, out=None):
+        """Convert size(s) (or offsets within a stimulus) in `units` to pixels
+        """
+        if self.exactDegrees and units in ['deg', 'degs']:
+            out = numpy.multiply(size, pi/360, *_outArgs(out))
+            out = numpy.tan(out, *_outArgs(out))
+            return numpy.multiply(out, 2*self.getFactor('distance'), *_outArgs(out))
+        return numpy.multiply(size, self.getFactor(units), *_outArgs(out))
+    def pixToUnits(self, pixels, units, out=None):
+        """Convert position(s) in pixels to `units` (the inverse of toPix)
+        """
+        if self.exactDegrees and units in ['deg', 'degs']:
+            out = numpy.divide(pixels, self.getFactor('distance'), *_outArgs(out))
+            out = numpy.arctan(out, *_outArgs(out))
+            return numpy.multiply(out, 180/pi, *_outArgs(out))
+        return numpy.divide(pixels, self.getFactor(units), *_outArgs(out))
+    def pixToSize(self, pixels, units, out=None):
+        """Convert size(s) in pixels to `units` (the inverse of sizeToPix)
+        """
+        if self.exactDegrees and units in ['deg', 'degs']:
+            out = numpy.divide(pixels, 2*self.getFactor('distance'), *_outArgs(out))
+            out = numpy.arctan(out, *_outArgs(out))
+            return numpy.multiply(out, 360/pi, *_outArgs(out))
+        return numpy.divide(pixels, self.getFactor(units), *_outArgs(out))
+
+def _outArgs(out):
+    #numpy ufuncs can't write into a scalar, so only pass `out` if it's an array
+    if isinstance(out, numpy.ndarray):
+        return (out,)
+    return ()
+
+class FrameIntervalRecorder:
+    """Stores the frame intervals recorded by a :class:`Window` (as
+    `win.frameIntervals`) in a preallocated numpy ring buffer, and keeps
+    running statistics (mean, SD, min, max, dropped frames and a histogram)
+    that are updated as each frame arrives, so they cover the whole session
+    and can be read at any time with :meth:`getStats`.
+
+    It can be used much like the list it replaces (len(), indexing, slicing
+    and numpy functions all work on the stored intervals, oldest first).
+    Once `maxFrames` intervals are stored the oldest are overwritten, unless
+    a spill file is set (:meth:`setSpillFile`), in which case each full buffer
+    is appended to that file (as raw float64) and the memory used stays
+    constant::
+
+        win.frameIntervals.setSpillFile('frameIntervals.dat')
+        ... #3 hours later
+        print win.frameIntervals.getStats()['nDropped']
+
+    """
+    def __init__(self, maxFrames=2**16, refreshThreshold=None, binWidth=0.0005, maxInterval=0.1,
+            spillFileName=None):
+        self.maxFrames=maxFrames
+        self.refreshThreshold=refreshThreshold#intervals longer than this count as dropped
+        self.binWidth=binWidth
+        self.binEdges=numpy.arange(0, maxInterval+binWidth/2.0, binWidth)#last bin takes all longer intervals
+        self._ring=numpy.zeros(maxFrames)
+        self._counts=numpy.zeros(len(self.binEdges), int)
+        self._spillFile=None
+        self.spillFileName=None
+        self.clear()
+        if spillFileName:
+            self.setSpillFile(spillFileName)
+    def clear(self):
+        """Remove all the intervals and reset the statistics
+        """
+        self.n=0#intervals recorded (including any overwritten or spilled)
+        self.nDropped=0
+        self._pos=0#next position in the ring
+        self._nSpilled=0
+        self._mean=self._m2=0.0#for Welford's running variance
+        self.min=self.max=None
+        self._counts[:]=0
+        if self._spillFile is not None:
+            self._spillFile.seek(0)
+            self._spillFile.truncate()
+    def setSpillFile(self, fileName):
+        """Append each full buffer of intervals to `fileName` (rather than
+        overwriting the oldest), or stop doing so if fileName is None
+        """
+        if self._spillFile is not None:
+            self._spillFile.close()
+            self._spillFile=None
+        self.spillFileName=fileName
+        if fileName is not None:
+            self._spillFile=open(fileName, 'w+b')
+            self._nSpilled=0
+    def append(self, interval):
+        """Add the interval (s) of one frame (called by Window.flip())
+        """
+        if self._pos==self.maxFrames:
+            if self._spillFile is not None:
+                self._ring.tofile(self._spillFile)
+                self._spillFile.flush()
+                self._nSpilled+=self.maxFrames
+            self._pos=0
+        self._ring.itemset(self._pos, interval)
+        self._pos+=1
+        self.n+=1
+        delta = interval-self._mean
+        self._mean+=delta/self.n
+        self._m2+=delta*(interval-self._mean)
+        if self.max is None or interval>self.max: self.max=interval
+        if self.min is None or interval<self.min: self.min=interval
+        if self.refreshThreshold is not None and interval>self.refreshThreshold:
+            self.nDropped+=1
+        binN = min(int(interval/self.binWidth), len(self._counts)-1)
+        self._counts.itemset(binN, self._counts.item(binN)+1)
+    def getStats(self):
+        """Returns a dict of the statistics of all intervals recorded so far (s):
+        n, mean, sd, min, max, nDropped, and a histogram (counts) with its binEdges
+        (the last bin counts all intervals longer than its edge)
+        """
+        if self.n>1: sd = numpy.sqrt(self._m2/(self.n-1))
+        else: sd = 0.0
+        return {'n':self.n, 'mean':self._mean, 'sd':sd, 'min':self.min, 'max':self.max,
+            'nDropped':self.nDropped, 'counts':self._counts.copy(), 'binEdges':self.binEdges}
+    def getIntervals(self):
+        """Returns the stored intervals (oldest first) as a numpy array. Intervals
+        that were spilled to disk are read from the file (using a memmap)
+        """
+        if self._spillFile is not None:
+            if self._nSpilled:
+                spilled = numpy.memmap(self.spillFileName, dtype=numpy.float64, mode='r',
+                    shape=(self._nSpilled,))
+                return numpy.concatenate([spilled, self._ring[:self._pos]])
+            return self._ring[:self._pos].copy()
+        if self.n>self.maxFrames:#the ring has wrapped
+            return numpy.concatenate([self._ring[self._pos:], self._ring[:self._pos]])
+        return self._ring[:self._pos].copy()
+    def __len__(self):
+        if self._spillFile is not None:
+            return self._nSpilled+self._pos
+        return min(self.n, self.maxFrames)
+    def __getitem__(self, index):
+        if isinstance(index, slice) and self._pos>0 and index.step is None and \
+                index.start is not None and index.start<0 and index.stop is None and -index.start<=self._pos:
+            return self._ring[self._pos+index.start:self._pos].copy()#the most recent frames (the usual request)
+        return self.getIntervals()[index]
+    def __iter__(self):
+        return iter(self.getIntervals())
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.getIntervals()
+        return self.getIntervals().astype(dtype)
+
+class FrameProfiler:
+    """Records how long each phase of :meth:`Window.flip` takes (and each autoDraw
+    stimulus's draw()) into preallocated ring buffers, so that when frames are
+    dropped you can see where the time went. Usually created with
+    :meth:`Window.setRecordFlipPhases` and then available as `win.flipProfiler`::
+
+        win.setRecordFlipPhases(True, nFrames=1000)
+        ... #run trials
+        print win.flipProfiler.getSummary()
+        win.flipProfiler.save('flipPhases.csv')
+
+    The phases are given in `FrameProfiler.phases`. 'user' is the time between
+    the end of the previous flip() and the start of this one (i.e. your own code,
+    including any draw() calls you make yourself). Once `nFrames` have been
+    recorded the oldest frames are overwritten.
+
+    Each autoDraw stimulus gets its own column (named as in `stimNames`, up
+    to `maxStims` of them) the first time it's drawn, so the times stay with
+    the right stimulus as stimuli are added to and removed from the list.
+    Stimuli are told apart by name (or class, if they have no name), with a
+    number added for repeats, e.g. 'TextStim', 'TextStim_2'.
+    """
+    phases = ['user', 'autoDraw', 'fbBlit', 'bitsLUT', 'events', 'mediaEvents',
+        'swap', 'view', 'clear', 'waitBlanking', 'frameIntervals', 'log']
+    def __init__(self, nFrames=1000, maxStims=50):
+        self.nFrames=nFrames
+        self.maxStims=maxStims
+        self.nPhases=len(self.phases)
+        self._phaseTimes=numpy.zeros(nFrames*self.nPhases)#ring buffers, flat for itemset()
+        self._stimTimes=numpy.zeros(nFrames*maxStims)#by column, NaN where not drawn
+        self.stimNames=[]#the column names, for every autoDraw stimulus so far
+        self._lastToDraw=[]
+        self._stimColumns=[]#the column of each stimulus in _lastToDraw
+        self.nRecorded=0#total frames, including those overwritten
+        self._phaseBase=self._stimBase=0
+        self._last=self._stimLast=self._endLast=None
+    def startFrame(self, toDraw):
+        """Called at the start of flip()
+        """
+        now = core.getTime()
+        row = self.nRecorded%self.nFrames
+        self._phaseBase = row*self.nPhases
+        self._stimBase = row*self.maxStims
+        if self._endLast is None:
+            self._phaseTimes.itemset(self._phaseBase, 0.0)
+        else:
+            self._phaseTimes.itemset(self._phaseBase, now-self._endLast)
+        self._stimTimes[self._stimBase:self._stimBase+self.maxStims] = numpy.nan
+        #(stims don't define __eq__, so compare by identity, which is much quicker)
+        if len(toDraw)!=len(self._lastToDraw) or not all(map(operator.is_, toDraw, self._lastToDraw)):
+            self._lastToDraw=list(toDraw)#only when stimuli are added, removed or reordered
+            self._stimColumns=self._getColumns(toDraw)
+        self._last=self._stimLast=now
+    def _getColumns(self, toDraw):
+        columns=[]
+        nSeen={}
+        for stim in toDraw:
+            name = getattr(stim, 'name', '') or stim.__class__.__name__
+            nSeen[name] = nSeen.get(name, 0)+1
+            if nSeen[name]>1:
+                name = '%s_%i' %(name, nSeen[name])
+            if name not in self.stimNames:
+                self.stimNames.append(name)
+            columns.append(self.stimNames.index(name))
+        return columns
+    def stimDrawn(self, stimN):
+        """Called after each autoDraw stimulus has been drawn
+        """
+        now = core.getTime()
+        column = self._stimColumns[stimN]
+        if column<self.maxStims:
+            self._stimTimes.itemset(self._stimBase+column, now-self._stimLast)
+        self._stimLast=now
+    def mark(self, phaseN):
+        """Called at the end of each phase of flip() (as the index in `phases`)
+        """
+        now = core.getTime()
+        self._phaseTimes.itemset(self._phaseBase+phaseN, now-self._last)
+        self._last=now
+    def endFrame(self):
+        self._endLast=self._last
+        self.nRecorded+=1
+    def getPhaseTimes(self):
+        """Returns the recorded durations (s) as an array of shape [nFrames, nPhases],
+        oldest frame first
+        """
+        n = min(self.nRecorded, self.nFrames)
+        times = self._phaseTimes.reshape([self.nFrames, self.nPhases])
+        if self.nRecorded>self.nFrames:#the ring has wrapped
+            start = self.nRecorded%self.nFrames
+            return numpy.concatenate([times[start:], times[:start]])
+        return times[:n].copy()
+    def getStimTimes(self):
+        """Returns the draw() durations (s) of the autoDraw stimuli as an array
+        of shape [nFrames, maxStims], with a column for each of `stimNames`
+        (NaN where that stimulus wasn't drawn), oldest frame first
+        """
+        times = self._stimTimes.reshape([self.nFrames, self.maxStims]).copy()
+        if self.nRecorded>self.nFrames:
+            start = self.nRecorded%self.nFrames
+            return numpy.concatenate([times[start:], times[:start]])
+        return times[:self.nRecorded]
+    def getPercentiles(self, percentiles=(50, 95, 99)):
+        """Returns a dict of phase:array of the percentiles (in s) of the recorded frames
+        """
+        times = self.getPhaseTimes()
+        result={}
+        for phaseN, phase in enumerate(self.phases):
+            if len(times):
+                result[phase] = numpy.array([numpy.percentile(times[:,phaseN], p) for p in percentiles])
+            else:
+                result[phase] = numpy.zeros(len(percentiles))
+        return result
+    def getSummary(self, percentiles=(50, 95, 99)):
+        """Returns a table (string) of the percentiles of each phase, in ms
+        """
+        pcs = self.getPercentiles(percentiles)
+        lines = ['%-15s' %'phase (ms)' + ''.join(['%9s' %('%g%%' %p) for p in percentiles])]
+        for phase in self.phases:
+            lines.append('%-15s' %phase + ''.join(['%9.3f' %(val*1000) for val in pcs[phase]]))
+        return '\n'.join(lines)
+    def save(self, fileName, fileType=None):
+        """Save the recorded frames to a .csv file (one row per frame, with a column
+        for each phase and then each stimulus, in ms) or, if fileName ends .npz (or
+        fileType='npz'), in numpy's compressed binary format (in s).
+        """
+        if fileType is None:
+            fileType = os.path.splitext(fileName)[1][1:].lower() or 'csv'
+        phaseTimes = self.getPhaseTimes()
+        stimTimes = self.getStimTimes()
+        nStims = min(len(self.stimNames), self.maxStims)
+        if fileType=='npz':
+            numpy.savez_compressed(fileName, phaseTimes=phaseTimes, stimTimes=stimTimes[:,:nStims],
+                phases=numpy.array(self.phases), stimNames=numpy.array(self.stimNames[:nStims]))
+            return
+        f = open(fileName, 'w')
+        f.write(','.join(['frame']+self.phases+self.stimNames[:nStims])+'\n')
+        firstFrame = max(0, self.nRecorded-self.nFrames)
+        for frameN in range(len(phaseTimes)):
+            vals = numpy.concatenate([phaseTimes[frameN], stimTimes[frameN,:nStims]])*1000
+            f.write('%i,' %(firstFrame+frameN) + ','.join(['%.4f' %val for val in vals])+'\n')
+        f.close()
+
 class _BaseVisualStim:
     """A template for a stimulus class, on which PatchStim, TextStim etc... are based.
     Not finished...?
@@ -1267,15 +2018,13 @@ class _BaseVisualStim:
     def _calcSizeRendered(self):
         """Calculate the size of the stimulus in coords of the :class:`~psychopy.visual.Window` (normalised or pixels)"""
         if self.units in ['norm','pix', 'height']: self._sizeRendered=copy.copy(self.size)
-        elif self.units in ['deg', 'degs']: self._sizeRendered=psychopy.misc.deg2pix(self.size, self.win.monitor)
-        elif self.units=='cm': self._sizeRendered=psychopy.misc.cm2pix(self.size, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._sizeRendered=self.win.unitConverter.sizeToPix(self.size, self.units)
         else:
             logging.ERROR("Stimulus units should be 'height', 'norm', 'deg', 'cm' or 'pix', not '%s'" %self.units)
     def _calcPosRendered(self):
         """Calculate the pos of the stimulus in coords of the :class:`~psychopy.visual.Window` (normalised or pixels)"""
         if self.units in ['norm','pix', 'height']: self._posRendered= copy.copy(self.pos)
-        elif self.units in ['deg', 'degs']: self._posRendered=psychopy.misc.deg2pix(self.pos, self.win.monitor)
-        elif self.units=='cm': self._posRendered=psychopy.misc.cm2pix(self.pos, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._posRendered=self.win.unitConverter.toPix(self.pos, self.units)
     def setAutoDraw(self, val):
         """Add or remove a stimulus from the list of stimuli that will be
         automatically drawn on each flip
@@ -1362,6 +2111,8 @@ class DotStim(_BaseVisualStim):
                  element=None,
                  signalDots='same',
                  noiseDots='direction',
+                 dotMask=None,
+                 seed=None,
                  name='', autoLog=True):
         """
         :Parameters:
@@ -1426,6 +2177,18 @@ class DotStim(_BaseVisualStim):
                 ``.setPos([x,y])`` method (e.g. a PatchStim, TextStim...)!!
                 See `ElementArrayStim` for a faster implementation of this idea.
 
+            dotMask : *None* or a mask ('gauss', 'circle', 'raisedCos', a filename,
+                a numpy array...)
+                If given, every dot is drawn as a point sprite (of dotSize pixels)
+                textured with this mask. All the dots are still drawn in a single
+                call so this is far faster than using an `element` for
+                textured dots. Change it with :meth:`~DotStim.setMask`.
+
+            seed : *None* or int
+                Seed for this stimulus's own random number generator (used for
+                dot positions, lifetimes and noise directions). Give the same seed
+                to reproduce exactly the same dot sequence.
+
             name : string
                 The name of the object to be using during logged messages about
                 this stimulus
@@ -1463,6 +2226,9 @@ class DotStim(_BaseVisualStim):
         self._fieldPosRendered=None
 
         self._useShaders=False#not needed for dots?
+        self.interpolate=True#for the dot mask
+        self._dotMaskID=None
+        self._dotsXYRendered=None#preallocated (float32) once we know nDots
         self.colorSpace=colorSpace
         if rgb!=None:
             logging.warning("Use of rgb arguments to stimuli are deprecated. Please use color and colorSpace args instead")
@@ -1477,18 +2243,22 @@ class DotStim(_BaseVisualStim):
 
         self.coherence=round(coherence*self.nDots)/self.nDots#store actual coherence
 
+        self.seed=seed
+        self._rng = numpy.random.RandomState(seed)#so each stim can be reproduced
         self._dotsXY = self._newDotsXY(self.nDots) #initialise a random array of X,Y
         self._dotsSpeed = numpy.ones(self.nDots, 'f')*self.speed#all dots have the same speed
-        self._dotsLife = abs(dotLife)*numpy.random.rand(self.nDots)#abs() means we can ignore the -1 case (no life)
+        self._dotsLife = abs(dotLife)*self._rng.rand(self.nDots)#abs() means we can ignore the -1 case (no life)
         #determine which dots are signal
         self._signalDots = numpy.zeros(self.nDots, dtype=bool)
         self._signalDots[0:int(self.coherence*self.nDots)]=True
         #numpy.random.shuffle(self._signalDots)#not really necessary
         #set directions (only used when self.noiseDots='direction')
-        self._dotsDir = numpy.random.rand(self.nDots)*2*pi
+        self._dotsDir = self._rng.rand(self.nDots)*2*pi
         self._dotsDir[self._signalDots] = self.dir*pi/180
+        self._allocScratch()
 
         self._calcFieldCoordsRendered()
+        self.setMask(dotMask)
         self._update_dotsXY()
 
     def _set(self, attrib, val, op=''):
@@ -1548,7 +2318,7 @@ class DotStim(_BaseVisualStim):
         #for 'direction' method we need to update the direction of the number
         #of signal dots immediately, but for other methods it will be done during updateXY
         if self.noiseDots == 'direction':
-            self._dotsDir=numpy.random.rand(self.nDots)*2*pi
+            self._dotsDir=self._rng.rand(self.nDots)*2*pi
             self._dotsDir[self._signalDots]=self.dir*pi/180
     def setDir(self,val, op=''):
         """Change the direction of the signal dots (units in degrees)
@@ -1562,6 +2332,29 @@ class DotStim(_BaseVisualStim):
         """Change the speed of the dots (in stimulus `units` per second)
         """
         self._set('speed', val, op)
+    def setMask(self,value):
+        """Change the mask used to texture each dot (see `dotMask`). None
+        reverts to drawing plain (square) points. Avoid this during time-critical
+        points in your script; uploading new textures can be time-consuming.
+        """
+        self._maskName = value
+        if value is None:
+            self.clearTextures()
+            return
+        if self._dotMaskID is None:
+            self._dotMaskID=GL.GLuint()
+            GL.glGenTextures(1, ctypes.byref(self._dotMaskID))
+        #without shaders the opacity of the dots gets coded in the mask
+        createTexture(value, id=self._dotMaskID, pixFormat=GL.GL_ALPHA, stim=self, res=64)
+    def clearTextures(self):
+        """Clear the dot mask texture (if there is one) from the graphics card.
+        This is called automatically during garbage collection of your stimulus.
+        """
+        if self._dotMaskID is not None:
+            releaseTexture(self._dotMaskID)
+            self._dotMaskID=None
+    def __del__(self):
+        self.clearTextures()
     def draw(self, win=None):
         """Draw the stimulus in its relevant window. You must call
         this method after every MyWin.flip() if you want the
@@ -1569,7 +2362,7 @@ class DotStim(_BaseVisualStim):
         again.
         """
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
 
         self._update_dotsXY()
 
@@ -1582,15 +2375,26 @@ class DotStim(_BaseVisualStim):
             GL.glTranslatef(self._fieldPosRendered[0],self._fieldPosRendered[1],0)
             GL.glPointSize(self.dotSize)
 
-            #load Null textures into multitexteureARB - they modulate with glColor
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-            GL.glActiveTexture(GL.GL_TEXTURE1)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-
-            GL.glVertexPointer(2, GL.GL_DOUBLE, 0, self._dotsXYRendered.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+            if self._dotMaskID is None:
+                #load Null textures into multitexteureARB - they modulate with glColor
+                GL.glActiveTexture(GL.GL_TEXTURE0)
+                GL.glEnable(GL.GL_TEXTURE_2D)
+                GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+                GL.glActiveTexture(GL.GL_TEXTURE1)
+                GL.glEnable(GL.GL_TEXTURE_2D)
+                GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+            else:
+                #each point becomes a sprite with the mask stretched across it
+                GL.glActiveTexture(GL.GL_TEXTURE1)
+                GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+                GL.glDisable(GL.GL_TEXTURE_2D)
+                GL.glActiveTexture(GL.GL_TEXTURE0)
+                GL.glEnable(GL.GL_TEXTURE_2D)
+                GL.glBindTexture(GL.GL_TEXTURE_2D, self._dotMaskID)
+                GL.glEnable(GL.GL_POINT_SPRITE)
+                GL.glTexEnvi(GL.GL_POINT_SPRITE, GL.GL_COORD_REPLACE, GL.GL_TRUE)
+
+            GL.glVertexPointer(2, GL.GL_FLOAT, 0, self._dotsXYRendered.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
             if self.colorSpace in ['rgb','dkl','lms','hsv']:
                 GL.glColor4f(self.rgb[0]/2.0+0.5, self.rgb[1]/2.0+0.5, self.rgb[2]/2.0+0.5, 1.0)
             else:
@@ -1598,6 +2402,11 @@ class DotStim(_BaseVisualStim):
             GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
             GL.glDrawArrays(GL.GL_POINTS, 0, self.nDots)
             GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+            if self._dotMaskID is not None:
+                GL.glTexEnvi(GL.GL_POINT_SPRITE, GL.GL_COORD_REPLACE, GL.GL_FALSE)
+                GL.glDisable(GL.GL_POINT_SPRITE)
+                GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
         else:
             #we don't want to do the screen scaling twice so for each dot subtract the screen centre
             initialDepth=self.element.depth
@@ -1615,14 +2424,29 @@ class DotStim(_BaseVisualStim):
             dots = self._newDots(nDots)
 
         """
-        if self.fieldShape=='circle':#make more dots than we need and only use those that are within circle
-            while True:#repeat until we have enough
-                new=numpy.random.uniform(-1, 1, [nDots*2,2])#fetch twice as many as needed
-                inCircle= (numpy.hypot(new[:,0],new[:,1])<1)
-                if sum(inCircle)>=nDots:
-                    return new[inCircle,:][:nDots,:]*self.fieldSize/2.0
+        if self.fieldShape=='circle':
+            #sample the circle directly (sqrt of the radius gives uniform density)
+            radius = numpy.sqrt(self._rng.uniform(0, 1, nDots))
+            theta = self._rng.uniform(0, 2*pi, nDots)
+            new = numpy.empty([nDots,2])
+            numpy.cos(theta, new[:,0])
+            numpy.sin(theta, new[:,1])
+            new *= radius.reshape([nDots,1])
+            new *= self.fieldSize/2.0
+            return new
         else:
-            return numpy.random.uniform(-self.fieldSize/2.0, self.fieldSize/2.0, [nDots,2])
+            return self._rng.uniform(-self.fieldSize/2.0, self.fieldSize/2.0, [nDots,2])
+
+    def _allocScratch(self):
+        """Create the arrays that _update_dotsXY() works in, so that it
+        doesn't need to allocate new ones on every frame
+        """
+        N=self.nDots
+        self._dead = numpy.zeros(N, dtype=bool)
+        self._outside = numpy.zeros(N, dtype=bool)
+        self._noiseDots = numpy.zeros(N, dtype=bool)
+        self._dx = numpy.zeros(N)
+        self._dy = numpy.zeros(N)
 
     def _update_dotsXY(self):
         """
@@ -1630,14 +2454,22 @@ class DotStim(_BaseVisualStim):
         """
 
         """Find dead dots, update positions, get new positions for dead and out-of-bounds
+
+        All the work is done in place (in the arrays from _allocScratch) so
+        the only new arrays each frame are the random values for replacement dots
         """
+        if self._dead.shape[0]!=self.nDots:
+            self._allocScratch()
+        dead=self._dead
+        outside=self._outside
+        dx, dy = self._dx, self._dy
         #renew dead dots
         if self.dotLife>0:#if less than zero ignore it
             self._dotsLife -= 1 #decrement. Then dots to be reborn will be negative
-            dead = (self._dotsLife<=0.0)
-            self._dotsLife[dead]=self.dotLife
+            numpy.less_equal(self._dotsLife, 0.0, dead)
+            numpy.putmask(self._dotsLife, dead, self.dotLife)
         else:
-            dead=numpy.zeros(self.nDots, dtype=bool)
+            dead.fill(False)
 
         ##update XY based on speed and dir
         #NB self._dotsDir is in radians, but self.dir is in degs
@@ -1645,60 +2477,69 @@ class DotStim(_BaseVisualStim):
         if self.signalDots =='different':
             #  **up to version 1.70.00 this was the other way around, not in keeping with Scase et al**
             #noise and signal dots change identity constantly
-            numpy.random.shuffle(self._dotsDir)
-            self._signalDots = (self._dotsDir==(self.dir*pi/180))#and then update _signalDots from that
+            self._rng.shuffle(self._dotsDir)
+            numpy.equal(self._dotsDir, self.dir*pi/180, self._signalDots)#and then update _signalDots from that
+        numpy.logical_not(self._signalDots, self._noiseDots)
 
         #update the locations of signal and noise
         if self.noiseDots=='walk':
-            # noise dots are ~self._signalDots
-            self._dotsDir[~self._signalDots] = numpy.random.rand((~self._signalDots).sum())*pi*2
-            #then update all positions from dir*speed
-            self._dotsXY[:,0] += self.speed*numpy.reshape(numpy.cos(self._dotsDir),(self.nDots,))
-            self._dotsXY[:,1] += self.speed*numpy.reshape(numpy.sin(self._dotsDir),(self.nDots,))# 0 radians=East!
-        elif self.noiseDots == 'direction':
-            #simply use the stored directions to update position
-            self._dotsXY[:,0] += self.speed*numpy.reshape(numpy.cos(self._dotsDir),(self.nDots,))
-            self._dotsXY[:,1] += self.speed*numpy.reshape(numpy.sin(self._dotsDir),(self.nDots,))# 0 radians=East!
+            # noise dots get a new random direction
+            nNoise = numpy.count_nonzero(self._noiseDots)
+            if nNoise:
+                self._dotsDir[self._noiseDots] = self._rng.uniform(0, 2*pi, nNoise)
         elif self.noiseDots=='position':
-            #update signal dots
-            self._dotsXY[self._signalDots,0] += \
-                self.speed*numpy.reshape(numpy.cos(self._dotsDir[self._signalDots]),(self._signalDots.sum(),))
-            self._dotsXY[self._signalDots,1] += \
-                self.speed*numpy.reshape(numpy.sin(self._dotsDir[self._signalDots]),(self._signalDots.sum(),))# 0 radians=East!
-            #update noise dots
-            dead = dead+(~self._signalDots)#just create new ones
-
-        #handle boundaries of the field
+            #noise dots will simply be replaced with new ones (below)
+            numpy.logical_or(dead, self._noiseDots, dead)
+        #then update all positions from dir*speed (0 radians=East!)
+        numpy.cos(self._dotsDir, dx)
+        dx *= self.speed
+        numpy.sin(self._dotsDir, dy)
+        dy *= self.speed
+        self._dotsXY[:,0] += dx
+        self._dotsXY[:,1] += dy
+
+        #handle boundaries of the field (reusing dx,dy now that we're done with them)
         if self.fieldShape in  [None, 'square', 'sqr']:
-            dead = dead+(numpy.abs(self._dotsXY[:,0])>(self.fieldSize[0]/2.0))+(numpy.abs
-                                                                                  (self
-                                                                                   ._dotsXY[:,1])>(self.fieldSize[1]/2.0))
+            numpy.absolute(self._dotsXY[:,0], dx)
+            numpy.greater(dx, self.fieldSize[0]/2.0, outside)
+            numpy.logical_or(dead, outside, dead)
+            numpy.absolute(self._dotsXY[:,1], dy)
+            numpy.greater(dy, self.fieldSize[1]/2.0, outside)
+            numpy.logical_or(dead, outside, dead)
         elif self.fieldShape == 'circle':
-            #transform to a normalised circle (radius = 1 all around) then to polar coords to check
-            normXY = self._dotsXY/(self.fieldSize/2.0)#the normalised XY position (where radius should be <1)
-            dead = dead + (numpy.hypot(normXY[:,0],normXY[:,1])>1) #add out-of-bounds to those that need replacing
+            #transform to a normalised circle (radius = 1 all around) to check
+            numpy.multiply(self._dotsXY[:,0], 2.0/self.fieldSize[0], dx)
+            numpy.multiply(dx, dx, dx)
+            numpy.multiply(self._dotsXY[:,1], 2.0/self.fieldSize[1], dy)
+            numpy.multiply(dy, dy, dy)
+            dx += dy
+            numpy.greater(dx, 1.0, outside) #add out-of-bounds to those that need replacing
+            numpy.logical_or(dead, outside, dead)
 
         #update any dead dots
-        if sum(dead):
-            self._dotsXY[dead,:] = self._newDotsXY(sum(dead))
+        nDead = numpy.count_nonzero(dead)
+        if nDead:
+            self._dotsXY[dead,:] = self._newDotsXY(nDead)
 
         #update the pixel XY coordinates
         self._calcDotsXYRendered()
 
     def _calcDotsXYRendered(self):
-        if self.units in ['norm','pix', 'height']: self._dotsXYRendered=self._dotsXY
-        elif self.units in ['deg','degs']: self._dotsXYRendered=psychopy.misc.deg2pix(self._dotsXY, self.win.monitor)
-        elif self.units=='cm': self._dotsXYRendered=psychopy.misc.cm2pix(self._dotsXY, self.win.monitor)
+        #write into the same float32 array each frame, ready for glVertexPointer
+        #(the dots are relative to the field centre so convert them as sizes)
+        if self._dotsXYRendered is None or self._dotsXYRendered.shape!=self._dotsXY.shape:
+            self._dotsXYRendered=numpy.zeros(self._dotsXY.shape, numpy.float32)
+        if self.units in ['norm', 'pix', 'height']:
+            self._dotsXYRendered[:]=self._dotsXY
+        else:
+            self.win.unitConverter.sizeToPix(self._dotsXY, self.units, out=self._dotsXYRendered)
     def _calcFieldCoordsRendered(self):
         if self.units in ['norm', 'pix', 'height']:
             self._fieldSizeRendered=self.fieldSize
             self._fieldPosRendered=self.fieldPos
-        elif self.units in ['deg', 'degs']:
-            self._fieldSizeRendered=psychopy.misc.deg2pix(self.fieldSize, self.win.monitor)
-            self._fieldPosRendered=psychopy.misc.deg2pix(self.fieldPos, self.win.monitor)
-        elif self.units=='cm':
-            self._fieldSizeRendered=psychopy.misc.cm2pix(self.fieldSize, self.win.monitor)
-            self._fieldPosRendered=psychopy.misc.cm2pix(self.fieldPos, self.win.monitor)
+        else:
+            self._fieldSizeRendered=self.win.unitConverter.sizeToPix(self.fieldSize, self.units)
+            self._fieldPosRendered=self.win.unitConverter.toPix(self.fieldPos, self.units)
 
 class SimpleImageStim:
     """A simple stimulus for loading images from a file and presenting at exactly
@@ -1818,7 +2659,7 @@ class SimpleImageStim:
         """
         #set the window to draw to
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
         #push the projection matrix and set to orthorgaphic
         GL.glMatrixMode(GL.GL_PROJECTION)
         GL.glPushMatrix()
@@ -1884,8 +2725,7 @@ class SimpleImageStim:
     def _calcPosRendered(self):
         """Calculate the pos of the stimulus in coords of the :class:`~psychopy.visual.Window` (normalised or pixels)"""
         if self.units in ['pix', 'pixels', 'height', 'norm']: self._posRendered=self.pos
-        elif self.units in ['deg', 'degs']: self._posRendered=psychopy.misc.deg2pix(self.pos, self.win.monitor)
-        elif self.units=='cm': self._posRendered=psychopy.misc.cm2pix(self.pos, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._posRendered=self.win.unitConverter.toPix(self.pos, self.units)
     def setImage(self,filename=None):
         """Set the image to be drawn.
 
@@ -1899,8 +2739,12 @@ class SimpleImageStim:
         #is a string - see if it points to a file
             if os.path.isfile(filename):
                 self.filename=filename
-                im = Image.open(self.filename)
-                im = im.transpose(Image.FLIP_TOP_BOTTOM)
+                preloaded = imagePreloader.fetch(filename, powerOf2=False)
+                if preloaded is not None:
+                    im = preloaded[0]
+                else:
+                    im = Image.open(self.filename)
+                    im = im.transpose(Image.FLIP_TOP_BOTTOM)
             else:
                 logging.error("couldn't find image...%s" %(filename))
                 core.quit()
@@ -1983,7 +2827,8 @@ class PatchStim(_BaseVisualStim):
                  rgbPedestal = (0.0,0.0,0.0),
                  interpolate=False,
                  name='', autoLog=True,
-                 maskParams=None):
+                 maskParams=None,
+                 procedural=False):
         """
         :Parameters:
 
@@ -1991,8 +2836,7 @@ class PatchStim(_BaseVisualStim):
                 a :class:`~psychopy.visual.Window` object (required)
             tex :
                 The texture forming the image
-
-                + **'sin'**,'sqr', 'saw', 'tri', None
+                + **'sin'**,'sqr', 'saw', 'tri', 'noise', None
                 + or the name of an image file (most formats supported)
                 + or a numpy array (1xN or NxN) ranging -1:1
 
@@ -2085,6 +2929,17 @@ class PatchStim(_BaseVisualStim):
                 the proportion of the patch that will be blurred by the raised
                 cosine edge.
 
+            procedural: True or **False**
+                If True (and shaders are available) then the textures 'sin',
+                'sqr', 'sinXsin', 'sqrXsqr' and 'noise' (also 'binaryNoise' and
+                'gaussNoise') and the masks 'circle',
+                'gauss', 'radRamp' and 'raisedCos' are calculated for every pixel
+                on the graphics card, rather than read from a texture of `texRes`.
+                They use no texture memory, look smooth at any size and
+                :meth:`~PatchStim.setMaskParams` just changes a value sent to the
+                card. For 'noise', `texRes` gives the number of noise elements
+                across one cycle. Other textures and masks are drawn as normal.
+
         """
         _BaseVisualStim.__init__(self, win, units=units, name=name, autoLog=autoLog)
 
@@ -2132,6 +2987,8 @@ class PatchStim(_BaseVisualStim):
         # Set the maskParams (defaults to None):
         self.maskParams= maskParams
 
+        self.procedural = procedural
+        self._texType = self._maskType = 0#non-zero for textures/masks computed in the shader
         self.setTex(tex)
         self.setMask(mask)
 
@@ -2168,8 +3025,7 @@ class PatchStim(_BaseVisualStim):
 
     def setSF(self,value,operation=''):
         self._set('sf', value, operation)
-        self.needUpdate = 1
-        self._calcCyclesPerStim()
+        self._calcCyclesPerStim()#applied by the texture matrix in draw(), no need to update the list
         self._requestedSf=value#to track whether we're just using a default value
     def _setSfToDefault(self):
         """Set the sf to default (e.g. to the 1.0/size of the loaded image etc)
@@ -2194,8 +3050,7 @@ class PatchStim(_BaseVisualStim):
         else:
             #we have an image - calculate the size in `units` that matches original pixel size
             if self.units=='pix': self.size=numpy.array(self.origSize)
-            elif self.units=='deg': self.size= psychopy.misc.pix2deg(numpy.array(self.origSize, float), self.win.monitor)
-            elif self.units=='cm': self.size= psychopy.misc.pix2cm(numpy.array(self.origSize, float), self.win.monitor)
+            elif self.units in ['deg', 'cm']: self.size= self.win.unitConverter.pixToSize(numpy.array(self.origSize, float), self.units)
             elif self.units=='norm': self.size= 2*numpy.array(self.origSize, float)/self.win.size
             elif self.units=='height': self.size= numpy.array(self.origSize, float)/self.win.size[1]
         #set it
@@ -2204,8 +3059,14 @@ class PatchStim(_BaseVisualStim):
             self._calcCyclesPerStim()
         self.needUpdate=True
     def setPhase(self,value, operation=''):
-        self._set('phase', value, operation)
-        self.needUpdate = 1
+        self._set('phase', value, operation)#applied by the texture matrix in draw()
+    def setSize(self, newSize, operation='', units=None):
+        """Set the stimulus size [X,Y] in the specified (or inherited) `units`.
+        Can be a 2D list/array or a single value (which will be applied to both x and y).
+        """
+        needUpdate = self.needUpdate
+        _BaseVisualStim.setSize(self, newSize, operation, units=units)
+        self.needUpdate = needUpdate#the size is applied in draw(), no need to update the list
 
     def setContrast(self,value,operation=''):
         self._set('contrast', value, operation)
@@ -2215,17 +3076,50 @@ class PatchStim(_BaseVisualStim):
 
     def setTex(self,value):
         self._texName = value
-        createTexture(value, id=self.texID, pixFormat=GL.GL_RGB, stim=self,
-            res=self.texRes, maskParams=self.maskParams)
+        self._texType = self._getProceduralType(value, _proceduralTex)
+        if self._texType==_proceduralTex['noise']:
+            self._noiseSeed = numpy.random.uniform(0, 1000)#new noise for each setTex('noise')
+        elif not self._texType:
+            createTexture(value, id=self.texID, pixFormat=GL.GL_RGB, stim=self,
+                res=self.texRes, maskParams=self.maskParams)
         #if user requested size=None then update the size for new stim here
         if hasattr(self, '_requestedSize') and self._requestedSize==None:
             self._setSizeToDefault()
         if hasattr(self, '_requestedSf') and self._requestedSf==None:
             self._setSfToDefault()
+        self.needUpdate=True#the list may need a different shader program
     def setMask(self,value):
         self._maskName = value
-        createTexture(value, id=self.maskID, pixFormat=GL.GL_ALPHA, stim=self,
-        res=self.texRes, maskParams=self.maskParams)
+        self._maskType = self._getProceduralType(value, _proceduralMasks)
+        if not self._maskType:
+            createTexture(value, id=self.maskID, pixFormat=GL.GL_ALPHA, stim=self,
+            res=self.texRes, maskParams=self.maskParams)
+        self.needUpdate=True
+    def setMaskParams(self, value):
+        """Set the maskParams (e.g. {'fringeWidth':0.2} for a 'raisedCos' mask).
+        For a procedural mask this is just sent to the shader at the next draw,
+        otherwise the mask texture is recreated.
+        """
+        self.maskParams = value
+        if not self._maskType:
+            self.setMask(self._maskName)
+    def _getProceduralType(self, name, types):
+        """The shader code for a texture/mask name (0 if it should be a texture)"""
+        if self.procedural and self._useShaders and type(name) in [str, unicode]:
+            return types.get(name, 0)
+        return 0
+    def _setProceduralUniforms(self):
+        prog = self.win._progProcedural
+        GL.glUseProgram(prog)
+        GL.glUniform1i(self.win._getUniformLocation(prog, "texType"), self._texType)
+        GL.glUniform1i(self.win._getUniformLocation(prog, "maskType"), self._maskType)
+        if self._texType==_proceduralTex['noise']:
+            GL.glUniform1f(self.win._getUniformLocation(prog, "noiseRes"), self.texRes)
+            GL.glUniform1f(self.win._getUniformLocation(prog, "noiseSeed"), self._noiseSeed)
+        if self._maskType==_proceduralMasks['raisedCos']:
+            if self.maskParams is None: fringeWidth = 0.2
+            else: fringeWidth = self.maskParams['fringeWidth']
+            GL.glUniform1f(self.win._getUniformLocation(prog, "fringeWidth"), fringeWidth)
     def draw(self, win=None):
         """
         Draw the stimulus in its relevant window. You must call
@@ -2235,7 +3129,7 @@ class PatchStim(_BaseVisualStim):
         """
         #set the window to draw to
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
 
         #do scaling
         GL.glPushMatrix()#push before the list, pop after
@@ -2255,11 +3149,29 @@ class PatchStim(_BaseVisualStim):
         GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
 
         if self.needUpdate: self._updateList()
-        GL.glCallList(self._listID)
+        if self._texType or self._maskType:
+            self._setProceduralUniforms()
+        self._callList()
 
         #return the view to previous state
         GL.glPopMatrix()
 
+    def _callList(self):
+        """Draw the display list (a quad of unit size) scaled to the current size,
+        and with texture coords set for the current sf and phase by the texture matrix.
+        So none of those changes need the list to be recompiled.
+        """
+        GL.glScalef(self._sizeRendered[0], self._sizeRendered[1], 1.0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glMatrixMode(GL.GL_TEXTURE)
+        GL.glPushMatrix()
+        GL.glTranslatef(0.5-self.phase[0], 0.5-self.phase[1], 0.0)
+        GL.glScalef(self._cycles[0], self._cycles[1], 1.0)
+        GL.glCallList(self._listID)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glPopMatrix()
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+
     def _updateListShaders(self):
         """
         The user shouldn't need this method since it gets called
@@ -2269,11 +3181,15 @@ class PatchStim(_BaseVisualStim):
         rather than using the .set() command
         """
         self.needUpdate=0
+        if self._texType or self._maskType:
+            prog = self.win._progProcedural#some of the stim is computed by the shader
+        else:
+            prog = self.win._progSignedTexMask
         GL.glNewList(self._listID,GL.GL_COMPILE)
         #setup the shaderprogram
-        GL.glUseProgram(self.win._progSignedTexMask)
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "texture"), 0) #set the texture to be texture unit 0
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "mask"), 1)  # mask is texture unit 1
+        GL.glUseProgram(prog)
+        GL.glUniform1i(self.win._getUniformLocation(prog, "texture"), 0) #set the texture to be texture unit 0
+        GL.glUniform1i(self.win._getUniformLocation(prog, "mask"), 1)  # mask is texture unit 1
         #mask
         GL.glActiveTexture(GL.GL_TEXTURE1)
         GL.glBindTexture(GL.GL_TEXTURE_2D, self.maskID)
@@ -2283,16 +3199,9 @@ class PatchStim(_BaseVisualStim):
         GL.glActiveTexture(GL.GL_TEXTURE0)
         GL.glBindTexture(GL.GL_TEXTURE_2D, self.texID)
         GL.glEnable(GL.GL_TEXTURE_2D)
-        #calculate coords in advance:
-        L = -self._sizeRendered[0]/2#vertices
-        R =  self._sizeRendered[0]/2
-        T =  self._sizeRendered[1]/2
-        B = -self._sizeRendered[1]/2
-        #depth = self.depth
-        Ltex = -self._cycles[0]/2 - self.phase[0]+0.5
-        Rtex = +self._cycles[0]/2 - self.phase[0]+0.5
-        Ttex = +self._cycles[1]/2 - self.phase[1]+0.5
-        Btex = -self._cycles[1]/2 - self.phase[1]+0.5
+        #a quad of unit size, centred on 0 - size, sf and phase are set in _callList()
+        L = B = Ltex = Btex = -0.5
+        R = T = Rtex = Ttex = 0.5
         Lmask=Bmask= 0.0; Tmask=Rmask=1.0#mask
 
         GL.glBegin(GL.GL_QUADS)                  # draw a 4 sided polygon
@@ -2349,16 +3258,9 @@ class PatchStim(_BaseVisualStim):
         GL.glActiveTextureARB(GL.GL_TEXTURE0_ARB)
         GL.glEnable(GL.GL_TEXTURE_2D)
         GL.glBindTexture(GL.GL_TEXTURE_2D, self.texID)
-        #calculate coords in advance:
-        L = -self._sizeRendered[0]/2#vertices
-        R =  self._sizeRendered[0]/2
-        T =  self._sizeRendered[1]/2
-        B = -self._sizeRendered[1]/2
-        #depth = self.depth
-        Ltex = -self._cycles[0]/2 - self.phase[0]+0.5
-        Rtex = +self._cycles[0]/2 - self.phase[0]+0.5
-        Ttex = +self._cycles[1]/2 - self.phase[1]+0.5
-        Btex = -self._cycles[1]/2 - self.phase[1]+0.5
+        #a quad of unit size, centred on 0 - size, sf and phase are set in _callList()
+        L = B = Ltex = Btex = -0.5
+        R = T = Rtex = Ttex = 0.5
         Lmask=Bmask= 0.0; Tmask=Rmask=1.0#mask
 
         GL.glBegin(GL.GL_QUADS)                  # draw a 4 sided polygon
@@ -2393,8 +3295,8 @@ class PatchStim(_BaseVisualStim):
         As of v1.61.00 this is called automatically during garbage collection of
         your stimulus, so doesn't need calling explicitly by the user.
         """
-        GL.glDeleteTextures(1, self.texID)
-        GL.glDeleteTextures(1, self.maskID)
+        releaseTexture(self.texID)
+        releaseTexture(self.maskID)
 
     def _calcCyclesPerStim(self):
         if self.units in ['norm', 'height']: self._cycles=self.sf#this is the only form of sf that is not size dependent
@@ -2408,8 +3310,12 @@ class RadialStim(PatchStim):
 
     Many of the capabilities are built on top of the PatchStim.
 
-    This stimulus is still relatively new and I'm finding occasional gliches. it also takes longer to draw
-    than a typical PatchStim, so not recommended for tasks where high frame rates are needed.
+    If shaders are available the polar texture coordinates are computed for each
+    pixel on the graphics card, so the edge of the stimulus is a smooth ellipse
+    (whatever the `angularRes`) and changing the phase or number of cycles costs
+    nothing more than updating a value. Without shaders the stimulus is made of
+    `angularRes` triangles, whose texture coordinates are recalculated each time
+    a phase or cycles value changes.
     """
     def __init__(self,
                  win,
@@ -2467,7 +3373,8 @@ class RadialStim(PatchStim):
             texRes : (default= *128* )
                 resolution of the texture (if not loading from an image file)
             angularRes : (default= *100* )
-                100, the number of triangles used to make the sti
+                100, the number of triangles used to make the stim (only
+                used if the stimulus isn't drawn with shaders)
             radialPhase :
                 the phase of the texture from the centre to the perimeter
                 of the stimulus
@@ -2569,39 +3476,57 @@ class RadialStim(PatchStim):
         self._calcPosRendered()
         self._calcSizeRendered()#must be done BEFORE _updateXY
 
+        self._updateQuad()
+        if self._useShaders:
+            self._listID = None#the shader draws a quad directly, no list or triangles
+        else:
+            self._updateTriangles()
+
+    def _updateTriangles(self):
+        """Build the triangles (and display list) used when drawing without shaders"""
         self._updateTextureCoords()
         self._updateMaskCoords()
         self._updateXY()
-        if not self._useShaders:
+        if getattr(self, '_listID', None) is None:
             #generate a displaylist ID
             self._listID = GL.glGenLists(1)
-            self._updateList()#ie refresh display list
-
+        self._updateList()#ie refresh display list
+    def setUseShaders(self, val=True):
+        """Set this stimulus to use shaders if possible.
+        """
+        PatchStim.setUseShaders(self, val)
+        if not self._useShaders: self._updateTriangles()
     def setSize(self, value, operation=''):
         self._set('size', value, operation)
         self._calcSizeRendered()
-        self._updateXY()
-        self.needUpdate=True
+        self._updateQuad()
+        if not self._useShaders:
+            self._updateXY()
+            self.needUpdate=True
     def setAngularCycles(self,value,operation=''):
         """set the number of cycles going around the stimulus"""
         self._set('angularCycles', value, operation)
-        self._updateTextureCoords()
-        self.needUpdate=True
+        if not self._useShaders:#with shaders this is just a uniform at draw time
+            self._updateTextureCoords()
+            self.needUpdate=True
     def setRadialCycles(self,value,operation=''):
         """set the number of texture cycles from centre to periphery"""
         self._set('radialCycles', value, operation)
-        self._updateTextureCoords()
-        self.needUpdate=True
+        if not self._useShaders:
+            self._updateTextureCoords()
+            self.needUpdate=True
     def setAngularPhase(self,value, operation=''):
         """set the angular phase of the texture"""
         self._set('angularPhase', value, operation)
-        self._updateTextureCoords()
-        self.needUpdate=True
+        if not self._useShaders:
+            self._updateTextureCoords()
+            self.needUpdate=True
     def setRadialPhase(self,value, operation=''):
         """set the radial phase of the texture"""
         self._set('radialPhase', value, operation)
-        self._updateTextureCoords()
-        self.needUpdate=True
+        if not self._useShaders:
+            self._updateTextureCoords()
+            self.needUpdate=True
 
     def draw(self, win=None):
         """
@@ -2614,7 +3539,7 @@ class RadialStim(PatchStim):
         """
         #set the window to draw to
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
 
         #do scaling
         GL.glPushMatrix()#push before the list, pop after
@@ -2633,8 +3558,8 @@ class RadialStim(PatchStim):
 
             GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
 
-            #assign vertex array
-            GL.glVertexPointer(2, GL.GL_DOUBLE, 0, self._visibleXY.ctypes)
+            #assign vertex array (a single quad, the shader works out where the stim is)
+            GL.glVertexPointer(2, GL.GL_DOUBLE, 0, self._quadXY.ctypes)
 
             #then bind main texture
             GL.glActiveTexture(GL.GL_TEXTURE0)
@@ -2647,23 +3572,26 @@ class RadialStim(PatchStim):
             GL.glEnable(GL.GL_TEXTURE_1D)
 
             #setup the shaderprogram
-            GL.glUseProgram(self.win._progSignedTexMask1D)
-            GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask1D, "texture"), 0) #set the texture to be texture unit 0
-            GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask1D, "mask"), 1)  # mask is texture unit 1
-
-            #set pointers to visible textures
+            prog = self.win._progRadial
+            GL.glUseProgram(prog)
+            GL.glUniform1i(self.win._getUniformLocation(prog, "texture"), 0) #set the texture to be texture unit 0
+            GL.glUniform1i(self.win._getUniformLocation(prog, "mask"), 1)  # mask is texture unit 1
+            GL.glUniform1f(self.win._getUniformLocation(prog, "angularCycles"), self.angularCycles)
+            GL.glUniform1f(self.win._getUniformLocation(prog, "angularPhase"), self.angularPhase)
+            GL.glUniform1f(self.win._getUniformLocation(prog, "radialCycles"), self.radialCycles)
+            GL.glUniform1f(self.win._getUniformLocation(prog, "radialPhase"), self.radialPhase)
+            GL.glUniform1f(self.win._getUniformLocation(prog, "maskRadialPhase"), self.maskRadialPhase)
+            GL.glUniform2f(self.win._getUniformLocation(prog, "wedge"),
+                self.visibleWedge[0]*pi/180, self.visibleWedge[1]*pi/180)
+
+            #the quad's texture coords give the position (-1:1) within the stim
             GL.glClientActiveTexture(GL.GL_TEXTURE0)
-            GL.glTexCoordPointer(2, GL.GL_DOUBLE, 0, self._visibleTexture.ctypes)
-            GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
-
-            #mask
-            GL.glClientActiveTexture(GL.GL_TEXTURE1)
-            GL.glTexCoordPointer(1, GL.GL_DOUBLE, 0, self._visibleMask.ctypes)
+            GL.glTexCoordPointer(2, GL.GL_DOUBLE, 0, self._quadTexCoords.ctypes)
             GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
 
             #do the drawing
             GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
-            GL.glDrawArrays(GL.GL_TRIANGLES, 0, self._nVisible)
+            GL.glDrawArrays(GL.GL_QUADS, 0, 4)
 
             #unbind the textures
             GL.glClientActiveTexture(GL.GL_TEXTURE1)
@@ -2685,6 +3613,12 @@ class RadialStim(PatchStim):
         #return the view to previous state
         GL.glPopMatrix()
 
+    def _updateQuad(self):
+        """Update the quad drawn by the shader if the SIZE changes
+        Update AFTER _calcSizeRendered"""
+        self._quadTexCoords = numpy.array([[-1,-1],[1,-1],[1,1],[-1,1]], float)
+        self._quadXY = self._quadTexCoords*self._sizeRendered/2.0
+
     def _updateXY(self):
         """Update if the SIZE changes
         Update AFTER _calcSizeRendered"""
@@ -2733,8 +3667,8 @@ class RadialStim(PatchStim):
 
         #setup the shaderprogram
         GL.glUseProgram(self.win._progSignedTexMask1D)
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask1D, "texture"), 0) #set the texture to be texture unit 0
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask1D, "mask"), 1)  # mask is texture unit 1
+        GL.glUniform1i(self.win._getUniformLocation(self.win._progSignedTexMask1D, "texture"), 0) #set the texture to be texture unit 0
+        GL.glUniform1i(self.win._getUniformLocation(self.win._progSignedTexMask1D, "mask"), 1)  # mask is texture unit 1
 
         #set pointers to visible textures
         GL.glClientActiveTexture(GL.GL_TEXTURE0)
@@ -2892,10 +3826,181 @@ class RadialStim(PatchStim):
         As of v1.61.00 this is called automatically during garbage collection of
         your stimulus, so doesn't need calling explicitly by the user.
         """
-        GL.glDeleteTextures(1, self.texID)
-        GL.glDeleteTextures(1, self.maskID)
+        releaseTexture(self.texID)
+        releaseTexture(self.maskID)
+
 
 
+class NoiseStim(PatchStim):
+    """A :class:`~psychopy.visual.PatchStim` showing fresh random noise each time
+    it is drawn (e.g. for dynamic noise masks). The noise can be:
+
+        - 'white': uniformly distributed values (-1:1)
+        - 'binary': each element is -1 or 1
+        - 'gauss': normally distributed values (sd=1/3, clipped at -1:1)
+        - 'filtered': gaussian noise band-pass filtered to `sfRange`
+
+    With shaders, white, binary and gauss noise are computed on the graphics card
+    (generator='shader'), which costs almost nothing whatever the noiseRes.
+    Otherwise (and always for filtered noise) a background thread computes
+    frames of noise into a bank of `bankSize` arrays and each draw just uploads
+    the next one (generator='bank').
+
+    Usage::
+
+        noise = visual.NoiseStim(win, noiseType='binary', noiseRes=512, size=512,
+            units='pix', seed=1)
+        while True:
+            noise.draw()#new noise each frame
+            win.flip()
+    """
+    def __init__(self,
+                 win,
+                 noiseType='white',
+                 noiseRes=256,
+                 sfRange=(4,16),
+                 seed=None,
+                 generator='auto',
+                 bankSize=8,
+                 autoUpdate=True,
+                 mask    ="none",
+                 units   ="",
+                 pos     =(0.0,0.0),
+                 size    =None,
+                 ori     =0.0,
+                 color=(1.0,1.0,1.0),
+                 colorSpace='rgb',
+                 contrast=1.0,
+                 opacity=1.0,
+                 interpolate=False,
+                 name='', autoLog=True):
+        """
+        :Parameters:
+
+            noiseType : **'white'**, 'binary', 'gauss' or 'filtered'
+                the type of noise (can be changed with :meth:`~NoiseStim.setTex`)
+            noiseRes : int
+                the number of noise elements across (and down) the stimulus.
+                Needs to be a power of two on cards without non-power-of-two
+                texture support
+            sfRange : (low, high)
+                the pass band of 'filtered' noise, in cycles per stimulus
+            seed : int or None
+                the seed for the random numbers, to repeat a noise sequence
+            generator : **'auto'**, 'shader' or 'bank'
+                how the noise is made (see above). 'auto' uses the shader when
+                possible
+            bankSize : int
+                the number of frames of noise that can be computed ahead
+            autoUpdate : **True** or False
+                if False the noise only changes when you call :meth:`~NoiseStim.updateNoise`
+
+        The remaining parameters are as for :class:`~psychopy.visual.PatchStim`
+        """
+        self.noiseRes = int(noiseRes)
+        self.sfRange = sfRange
+        self.seed = seed
+        self.generator = generator
+        self.bankSize = bankSize
+        self.autoUpdate = autoUpdate
+        self._rng = numpy.random.RandomState(seed)
+        self._bank = None
+        PatchStim.__init__(self, win, tex=noiseType, mask=mask, units=units, pos=pos,
+            size=size, ori=ori, texRes=self.noiseRes, color=color, colorSpace=colorSpace,
+            contrast=contrast, opacity=opacity, interpolate=interpolate, name=name,
+            autoLog=autoLog, procedural=True)
+        #there is always exactly one image of noise across the stimulus
+        self.setSF = None
+        self.setPhase = None
+
+    def setTex(self, value):
+        """Set the noiseType ('white', 'binary', 'gauss' or 'filtered')
+        """
+        if value not in _noiseTexNames:
+            raise ValueError, "NoiseStim noiseType should be 'white', 'binary', 'gauss' or 'filtered' (not %s)" %repr(value)
+        if value==getattr(self, 'noiseType', None) and self._noiseShaders==self._useShaders:
+            return#e.g. after a color change without shaders, which the next upload includes
+        self.noiseType = self._texName = value
+        self._noiseShaders = self._useShaders
+        self._stopBank()
+        self._texType = 0
+        if self.generator in ['auto', 'shader'] and value!='filtered':
+            self._texType = self._getProceduralType(_noiseTexNames[value], _proceduralTex)
+        if not self._texType:
+            if self.generator=='shader':
+                logging.warning("NoiseStim can't make %s noise in a shader here, using generator='bank'" %value)
+            self._allocateNoiseTexture()
+            self._bank = _NoiseBank(value, self.noiseRes, self.sfRange,
+                seed=self._rng.randint(0, 2**31-1), nFrames=self.bankSize)
+        self.needUpdate = True
+        self.updateNoise()
+
+    def updateNoise(self):
+        """Change to the next frame of noise. Called by draw() if autoUpdate is True
+        """
+        if self._texType:#the shader just needs a new seed
+            self._noiseSeed = self._rng.uniform(0, 1000)
+            return
+        noise = self._bank.get()
+        res = self.noiseRes
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texID)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        if self._useShaders:
+            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, res, res,
+                GL.GL_LUMINANCE, GL.GL_FLOAT, noise.ctypes)
+        else:
+            #the color and contrast are built into the texture without shaders
+            if self.colorSpace in ['rgb', 'dkl', 'lms','hsv']: rgb=self.rgb
+            else: rgb=self.rgb/127.5-1.0
+            self._noiseRGB[:] = (noise[:,:,numpy.newaxis]*(rgb*self.contrast)+1)*127.5
+            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, res, res,
+                GL.GL_RGB, GL.GL_UNSIGNED_BYTE, self._noiseRGB.ctypes)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        self._bank.recycle(noise)
+
+    def draw(self, win=None):
+        """Draw the stimulus (with new noise, if autoUpdate is True)
+        """
+        if self.autoUpdate:
+            self.updateNoise()
+        PatchStim.draw(self, win)
+
+    def _allocateNoiseTexture(self):
+        """Make space on the card for a noise frame. Frames are then uploaded
+        with glTexSubImage2D (no mipmaps, no reallocation)
+        """
+        res = self.noiseRes
+        if self._useShaders:
+            if sys.platform!='darwin' and self.win.glVendor.startswith('nvidia'):
+                internalFormat = GL.GL_RGB16F_ARB
+            else:
+                internalFormat = GL.GL_RGB32F_ARB
+        else:
+            internalFormat = GL.GL_RGB
+            self._noiseRGB = numpy.empty([res, res, 3], numpy.uint8)
+        if self.interpolate: smoothing=GL.GL_LINEAR
+        else: smoothing=GL.GL_NEAREST
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texID)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internalFormat, res, res, 0,
+            GL.GL_RGB, GL.GL_UNSIGNED_BYTE, None)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_WRAP_S,GL.GL_REPEAT)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_WRAP_T,GL.GL_REPEAT)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MAG_FILTER,smoothing)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MIN_FILTER,smoothing)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    def _stopBank(self):
+        if self._bank is not None:
+            self._bank.stop()
+            self._bank = None
+
+    def _calcCyclesPerStim(self):
+        self._cycles = numpy.array([1.0,1.0])
+
+    def __del__(self):
+        self._stopBank()
+        PatchStim.__del__(self)
+
 
 class ElementArrayStim:
     """
@@ -2929,6 +4034,7 @@ class ElementArrayStim:
                  elementMask='gauss',
                  texRes=48,
                  interpolate=True,
+                 useVBO=False,
                  name='', autoLog=True):
 
         """
@@ -3010,6 +4116,14 @@ class ElementArrayStim:
                 the number of pixels in the textures (overridden if an array
                 or image is provided)
 
+            useVBO : True or **False**
+                If True the element vertices, colors and texture coordinates are
+                stored (as float32) in vertex buffer objects on the graphics card
+                rather than being sent from the client on every frame. Calls to
+                setXYs(), setOris() and setOpacities() then only re-upload the
+                range of elements that actually changed. Recommended for arrays
+                of several thousand elements (requires OpenGL 1.5).
+
             name : string
                 The name of the objec to be using during logged messages about
                 this stim
@@ -3018,6 +4132,20 @@ class ElementArrayStim:
         self.win=win
         self.name=name
         self.autoLog=autoLog
+        self._useVBO=useVBO
+        if self._useVBO:
+            #ranges of elements (lo,hi) needing upload; None means all of them
+            self._vertexDirty=None
+            self._colorDirty=None
+            #copies of the values as last set, to find which elements have changed
+            #(the stim's own arrays may have been changed in place since)
+            self._lastXYs=self._lastOris=self._lastOpacities=None
+            self._visXYZvertices=None
+            self._RGBAs=None
+            #buffers for vertices, colors, texCoords and maskCoords
+            self._vboIDs=(GL.GLuint*4)()
+            GL.glGenBuffers(4, self._vboIDs)
+            self._vboSizes=[0,0,0,0]
 
         #unit conversions
         if units!=None and len(units): self.units = units
@@ -3041,7 +4169,7 @@ class ElementArrayStim:
         self.interpolate=interpolate
         self.fieldDepth=fieldDepth
         self.depths=depths
-        if self.win.winType != 'pyglet':
+        if self.win.winType not in ['pyglet','offscreen']:
             raise TypeError('ElementArrayStim requires a pyglet context')
         if not self.win._haveShaders:
             raise Exception("ElementArrayStim requires shaders support and floating point textures")
@@ -3098,7 +4226,10 @@ class ElementArrayStim:
         on the fieldSize and fieldPos. In this case opacity will also be overridden
         by this function (it is used to make elements outside the field invisible.
         """
-        if value==None:
+        if self._useVBO and value is not None:
+            oldXYs = self._lastXYs
+        else: oldXYs=None#new field so all elements need uploading
+        if value is None:
             if self.fieldShape in ['sqr', 'square']:
                 self.xys = numpy.random.rand(self.nElements,2)*self.fieldSize - self.fieldSize/2 #initialise a random array of X,Y
                 #gone outside the square
@@ -3124,8 +4255,13 @@ class ElementArrayStim:
             if not (value.shape in [(),(2,),(self.nElements,2)]):
                 raise ValueError("New value for setXYs should be either None or Nx2")
             if operation=='':
-                self.xys=value
+                self.xys=numpy.array(value, dtype=float)#our own copy
             else: exec('self.xys'+operation+'=value')
+        if self._useVBO:
+            changed = self._markDirty('_vertexDirty', oldXYs, self.xys)
+            self._lastXYs = numpy.array(self.xys, copy=True)
+            if not changed:
+                return
         self.needVertexUpdate=True
 
     def setOris(self,value,operation=''):
@@ -3144,8 +4280,13 @@ class ElementArrayStim:
         else:
             raise ValueError("New value for setOris should be either Nx1 or a single value")
         if operation=='':
-            self.oris=value
+            self.oris=numpy.array(value, dtype=float)#our own copy
         else: exec('self.oris'+operation+'=value')
+        if self._useVBO:
+            changed = self._markDirty('_vertexDirty', self._lastOris, self.oris)
+            self._lastOris = numpy.array(self.oris, copy=True)
+            if not changed:
+                return
         self.needVertexUpdate=True
     #----------------------------------------------------------------------
     def setSfs(self, value,operation=''):
@@ -3198,8 +4339,13 @@ class ElementArrayStim:
             raise ValueError("New value for setOpacities should be either Nx1 or a single value")
 
         if operation=='':
-            self.opacities=value
+            self.opacities=numpy.array(value, dtype=float)#our own copy
         else: exec('self.opacities'+operation+'=value')
+        if self._useVBO:
+            changed = self._markDirty('_colorDirty', self._lastOpacities, self.opacities)
+            self._lastOpacities = numpy.array(self.opacities, copy=True)
+            if not changed:
+                return
         self.needColorUpdate =True
 
     def setSizes(self,value,operation=''):
@@ -3228,6 +4374,7 @@ class ElementArrayStim:
             self.sizes=value
         else: exec('self.sizes'+operation+'=value')
         self._calcSizesRendered()
+        if self._useVBO: self._markDirty('_vertexDirty')
         self.needVertexUpdate=True
         self.needTexCoordUpdate=True
 
@@ -3316,6 +4463,7 @@ class ElementArrayStim:
         else:
             raise ValueError("New value for setRgbs should be either Nx1, Nx3 or a single value")
 
+        if self._useVBO: self._markDirty('_colorDirty')
         self.needColorUpdate=True
         if self.autoLog:
             self.win.logOnFlip("Set %s colors=%s colorSpace=%s" %(self.name, self.colors, self.colorSpace),
@@ -3341,6 +4489,7 @@ class ElementArrayStim:
         if operation=='':
             self.contrs=value
         else: exec('self.contrs'+operation+'=value')
+        if self._useVBO: self._markDirty('_colorDirty')
         self.needColorUpdate=True
     def setFieldPos(self,value,operation=''):
         """Set the centre of the array (X,Y)
@@ -3388,7 +4537,7 @@ class ElementArrayStim:
         """
         #set the window to draw to
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
 
         if self.needVertexUpdate:
             self.updateElementVertices()
@@ -3406,13 +4555,20 @@ class ElementArrayStim:
 
         GL.glTranslatef(self._fieldPosRendered[0],self._fieldPosRendered[1],0)
 
-        GL.glColorPointer(4, GL.GL_DOUBLE, 0, self._RGBAs.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
-        GL.glVertexPointer(3, GL.GL_DOUBLE, 0, self._visXYZvertices.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+        if self._useVBO:
+            #the pointers are offsets into the buffers already on the card
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboIDs[1])
+            GL.glColorPointer(4, GL.GL_FLOAT, 0, None)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboIDs[0])
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, None)
+        else:
+            GL.glColorPointer(4, GL.GL_DOUBLE, 0, self._RGBAs.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+            GL.glVertexPointer(3, GL.GL_DOUBLE, 0, self._visXYZvertices.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
 
         #setup the shaderprogram
         GL.glUseProgram(self.win._progSignedTexMask)
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "texture"), 0) #set the texture to be texture unit 0
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "mask"), 1)  # mask is texture unit 1
+        GL.glUniform1i(self.win._getUniformLocation(self.win._progSignedTexMask, "texture"), 0) #set the texture to be texture unit 0
+        GL.glUniform1i(self.win._getUniformLocation(self.win._progSignedTexMask, "mask"), 1)  # mask is texture unit 1
 
         #bind textures
         GL.glActiveTexture (GL.GL_TEXTURE1)
@@ -3423,12 +4579,23 @@ class ElementArrayStim:
         GL.glEnable(GL.GL_TEXTURE_2D)
 
         #setup client texture coordinates first
-        GL.glClientActiveTexture (GL.GL_TEXTURE0)
-        GL.glTexCoordPointer (2, GL.GL_DOUBLE, 0, self._texCoords.ctypes)
-        GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
-        GL.glClientActiveTexture (GL.GL_TEXTURE1)
-        GL.glTexCoordPointer (2, GL.GL_DOUBLE, 0, self._maskCoords.ctypes)
-        GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+        if self._useVBO:
+            GL.glClientActiveTexture (GL.GL_TEXTURE0)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboIDs[2])
+            GL.glTexCoordPointer (2, GL.GL_FLOAT, 0, None)
+            GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+            GL.glClientActiveTexture (GL.GL_TEXTURE1)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboIDs[3])
+            GL.glTexCoordPointer (2, GL.GL_FLOAT, 0, None)
+            GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        else:
+            GL.glClientActiveTexture (GL.GL_TEXTURE0)
+            GL.glTexCoordPointer (2, GL.GL_DOUBLE, 0, self._texCoords.ctypes)
+            GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+            GL.glClientActiveTexture (GL.GL_TEXTURE1)
+            GL.glTexCoordPointer (2, GL.GL_DOUBLE, 0, self._maskCoords.ctypes)
+            GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
 
         GL.glEnableClientState(GL.GL_COLOR_ARRAY)
         GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
@@ -3453,47 +4620,55 @@ class ElementArrayStim:
 
     def _calcSizesRendered(self):
         if self.units in ['norm','pix', 'height']: self._sizesRendered=self.sizes
-        elif self.units in ['deg', 'degs']: self._sizesRendered=psychopy.misc.deg2pix(self.sizes, self.win.monitor)
-        elif self.units=='cm': self._sizesRendered=psychopy.misc.cm2pix(self.sizes, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._sizesRendered=self.win.unitConverter.sizeToPix(self.sizes, self.units)
     def _calcXYsRendered(self):
         if self.units in ['norm','pix','height']: self._XYsRendered=self.xys
-        elif self.units in ['deg', 'degs']: self._XYsRendered=psychopy.misc.deg2pix(self.xys, self.win.monitor)
-        elif self.units=='cm': self._XYsRendered=psychopy.misc.cm2pix(self.xys, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._XYsRendered=self.win.unitConverter.sizeToPix(self.xys, self.units)
     def _calcFieldCoordsRendered(self):
         if self.units in ['norm', 'pix','height']:
             self._fieldSizeRendered=self.fieldSize
             self._fieldPosRendered=self.fieldPos
-        elif self.units in ['deg', 'degs']:
-            self._fieldSizeRendered=psychopy.misc.deg2pix(self.fieldSize, self.win.monitor)
-            self._fieldPosRendered=psychopy.misc.deg2pix(self.fieldPos, self.win.monitor)
-        elif self.units=='cm':
-            self._fieldSizeRendered=psychopy.misc.cm2pix(self.fieldSize, self.win.monitor)
-            self._fieldPosRendered=psychopy.misc.cm2pix(self.fieldPos, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']:
+            self._fieldSizeRendered=self.win.unitConverter.sizeToPix(self.fieldSize, self.units)
+            self._fieldPosRendered=self.win.unitConverter.toPix(self.fieldPos, self.units)
 
     def updateElementVertices(self):
         self._calcXYsRendered()
 
-        self._visXYZvertices=numpy.zeros([self.nElements , 4, 3],'d')
-        wx = self._sizesRendered[:,0]*numpy.cos(self.oris[:]*numpy.pi/180)/2
-        wy = self._sizesRendered[:,0]*numpy.sin(self.oris[:]*numpy.pi/180)/2
-        hx = self._sizesRendered[:,1]*numpy.sin(self.oris[:]*numpy.pi/180)/2
-        hy = -self._sizesRendered[:,1]*numpy.cos(self.oris[:]*numpy.pi/180)/2
+        if self._useVBO:
+            #only recalculate (and upload) the elements that have changed
+            lo, hi = self._getDirtyRange('_vertexDirty')
+            if self._visXYZvertices is None:
+                self._visXYZvertices=numpy.zeros([self.nElements , 4, 3],numpy.float32)
+        else:
+            lo, hi = 0, self.nElements
+            self._visXYZvertices=numpy.zeros([self.nElements , 4, 3],'d')
+        vertices = self._visXYZvertices[lo:hi]#a view, so we can write to it
+        sizes = self._sizesRendered[lo:hi]
+        XYs = self._XYsRendered[lo:hi]
+        oris = self.oris[lo:hi]
+        wx = sizes[:,0]*numpy.cos(oris[:]*numpy.pi/180)/2
+        wy = sizes[:,0]*numpy.sin(oris[:]*numpy.pi/180)/2
+        hx = sizes[:,1]*numpy.sin(oris[:]*numpy.pi/180)/2
+        hy = -sizes[:,1]*numpy.cos(oris[:]*numpy.pi/180)/2
 
         #X
-        self._visXYZvertices[:,0,0] = self._XYsRendered[:,0] -wx + hx#TopL
-        self._visXYZvertices[:,1,0] = self._XYsRendered[:,0] +wx + hx#TopR
-        self._visXYZvertices[:,2,0] = self._XYsRendered[:,0] +wx - hx#BotR
-        self._visXYZvertices[:,3,0] = self._XYsRendered[:,0] -wx - hx#BotL
+        vertices[:,0,0] = XYs[:,0] -wx + hx#TopL
+        vertices[:,1,0] = XYs[:,0] +wx + hx#TopR
+        vertices[:,2,0] = XYs[:,0] +wx - hx#BotR
+        vertices[:,3,0] = XYs[:,0] -wx - hx#BotL
 
         #Y
-        self._visXYZvertices[:,0,1] = self._XYsRendered[:,1] -wy + hy
-        self._visXYZvertices[:,1,1] = self._XYsRendered[:,1] +wy + hy
-        self._visXYZvertices[:,2,1] = self._XYsRendered[:,1] +wy - hy
-        self._visXYZvertices[:,3,1] = self._XYsRendered[:,1] -wy - hy
+        vertices[:,0,1] = XYs[:,1] -wy + hy
+        vertices[:,1,1] = XYs[:,1] +wy + hy
+        vertices[:,2,1] = XYs[:,1] +wy - hy
+        vertices[:,3,1] = XYs[:,1] -wy - hy
 
         #depth
-        self._visXYZvertices[:,:,2] = self.depths
+        vertices[:,:,2] = self.depths
 
+        if self._useVBO:
+            self._uploadVBO(0, self._visXYZvertices, lo, hi)
         self.needVertexUpdate=False
 
     #----------------------------------------------------------------------
@@ -3505,6 +4680,22 @@ class ElementArrayStim:
         this function also converts them to be one for each vertex of each element
         """
         N=self.nElements
+        if self._useVBO:
+            #update the changed elements in place, rather than creating a new array
+            lo, hi = self._getDirtyRange('_colorDirty')
+            if self._RGBAs is None:
+                self._RGBAs=numpy.zeros([N,4,4],numpy.float32)
+            n=hi-lo
+            contrs=self.contrs[lo:hi].reshape([n,1]).repeat(3,1)
+            if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
+                RGBs = self.rgbs[lo:hi,:] * contrs/2+0.5
+            else:
+                RGBs = self.rgbs[lo:hi] * contrs/255.0
+            self._RGBAs[lo:hi,:,0:3] = RGBs.reshape([n,1,3])#same for the 4 vertices
+            self._RGBAs[lo:hi,:,3] = self.opacities[lo:hi].reshape([n,1])
+            self._uploadVBO(1, self._RGBAs, lo, hi)
+            self.needColorUpdate=False
+            return
         self._RGBAs=numpy.zeros([N,4],'d')
         if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
             self._RGBAs[:,0:3] = self.rgbs[:,:] * self.contrs[:].reshape([N,1]).repeat(3,1)/2+0.5
@@ -3537,8 +4728,56 @@ class ElementArrayStim:
         #self._texCoords=numpy.array([[1,1],[1,0],[0,0],[0,1]],'d').reshape([1,4,2])
         self._texCoords=numpy.concatenate([[L,T],[R,T],[R,B],[L,B]]) \
             .transpose().reshape([N,4,2]).astype('d')
+        if self._useVBO:
+            self._texCoords=self._texCoords.astype(numpy.float32)
+            self._maskCoords=self._maskCoords.astype(numpy.float32)
+            self._uploadVBO(2, self._texCoords, 0, N)
+            self._uploadVBO(3, self._maskCoords, 0, N)
         self.needTexCoordUpdate=False
 
+    def _markDirty(self, rangeAttrib, oldVal=None, newVal=None):
+        """Extend the range of elements that need uploading to the VBO (stored
+        in rangeAttrib) to cover all elements that differ between oldVal (a copy
+        of the values last set) and newVal. With no values the whole array is marked.
+
+        Returns False if nothing changed (so no update is needed)
+        """
+        N=self.nElements
+        if oldVal is None or numpy.shape(oldVal)!=numpy.shape(newVal) \
+                or numpy.shape(oldVal)[:1]!=(N,):
+            lo, hi = 0, N
+        else:
+            changed = numpy.flatnonzero(
+                (numpy.asarray(oldVal)!=numpy.asarray(newVal)).reshape([N,-1]).any(1))
+            if len(changed)==0:
+                return False
+            lo, hi = int(changed[0]), int(changed[-1])+1
+        current = getattr(self, rangeAttrib)
+        if current is not None:
+            lo, hi = min(lo, current[0]), max(hi, current[1])
+        setattr(self, rangeAttrib, (lo, hi))
+        return True
+    def _getDirtyRange(self, rangeAttrib):
+        """Return (and then reset) the range of elements awaiting upload"""
+        dirty = getattr(self, rangeAttrib)
+        setattr(self, rangeAttrib, None)
+        if dirty is None: return 0, self.nElements
+        return dirty
+    def _uploadVBO(self, bufferN, data, lo, hi):
+        """Send elements lo:hi of the float32 array data to VBO number bufferN.
+        If the buffer hasn't yet been allocated at that size the whole array
+        is sent, otherwise only the changed range goes (via glBufferSubData)
+        """
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboIDs[bufferN])
+        if self._vboSizes[bufferN]!=data.nbytes:
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data, GL.GL_DYNAMIC_DRAW)
+            self._vboSizes[bufferN]=data.nbytes
+        elif hi>lo:
+            elementBytes=data.nbytes/self.nElements
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, lo*elementBytes, (hi-lo)*elementBytes,
+                data[lo:hi].ctypes.data)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
     def setTex(self,value):
         """Change the texture (all elements have the same base texture). Avoid this
         during time-critical points in your script. Uploading new textures to the
@@ -3554,14 +4793,16 @@ class ElementArrayStim:
         createTexture(value, id=self.maskID, pixFormat=GL.GL_ALPHA, stim=self, res=self.texRes)
     def __del__(self):
         self.clearTextures()#remove textures from graphics card to prevent crash
+        if self._useVBO:
+            GL.glDeleteBuffers(4, self._vboIDs)
     def clearTextures(self):
         """
         Clear the textures associated with the given stimulus.
         As of v1.61.00 this is called automatically during garbage collection of
         your stimulus, so doesn't need calling explicitly by the user.
         """
-        GL.glDeleteTextures(1, self.texID)
-        GL.glDeleteTextures(1, self.maskID)
+        releaseTexture(self.texID)
+        releaseTexture(self.maskID)
 
 class MovieStim(_BaseVisualStim):
     """A stimulus class for playing movies (mpeg, avi, etc...) in
@@ -3660,7 +4901,7 @@ class MovieStim(_BaseVisualStim):
         self._calcSizeRendered()
 
         #check for pyglet
-        if win.winType!='pyglet':
+        if win.winType not in ['pyglet','offscreen']:
             logging.Error('Movie stimuli can only be used with a pyglet window')
             core.quit()
     def setOpacity(self,newOpacity,operation=''):
@@ -3743,7 +4984,7 @@ class MovieStim(_BaseVisualStim):
             self.play()
         #set the window to draw to
         if win==None: win=self.win
-        win.winHandle.switch_to()
+        win._setCurrent()
 
         #make sure that textures are on and GL_TEXTURE0 is active
         GL.glActiveTexture(GL.GL_TEXTURE0)
@@ -3878,7 +5119,6 @@ class TextStim(_BaseVisualStim):
         self.depth=depth
         self.ori=ori
         self.wrapWidth=wrapWidth
-        self._pygletTextObj=None
 
         self.pos= numpy.array(pos, float)
 
@@ -3886,11 +5126,11 @@ class TextStim(_BaseVisualStim):
         if self.units=='cm':
             if height==None: self.height = 1.0#default text height
             else: self.height = height
-            self.heightPix = psychopy.misc.cm2pix(self.height, win.monitor)
+            self.heightPix = win.unitConverter.sizeToPix(self.height, 'cm')
         elif self.units in ['deg', 'degs']:
             if height==None: self.height = 1.0
             else: self.height = height
-            self.heightPix = psychopy.misc.deg2pix(self.height, win.monitor)
+            self.heightPix = win.unitConverter.sizeToPix(self.height, 'deg')
         elif self.units=='norm':
             if height==None: self.height = 0.1
             else: self.height = height
@@ -3911,15 +5151,10 @@ class TextStim(_BaseVisualStim):
             elif self.units in ['pix', 'pixels']: self.wrapWidth=500
         if self.units=='norm': self._wrapWidthPix= self.wrapWidth*win.size[0]/2
         elif self.units=='height': self._wrapWidthPix= self.wrapWidth*win.size[0]
-        elif self.units in ['deg', 'degs']: self._wrapWidthPix= psychopy.misc.deg2pix(self.wrapWidth, win.monitor)
-        elif self.units=='cm': self._wrapWidthPix= psychopy.misc.cm2pix(self.wrapWidth, win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._wrapWidthPix= win.unitConverter.sizeToPix(self.wrapWidth, self.units)
         elif self.units in ['pix', 'pixels']: self._wrapWidthPix=self.wrapWidth
 
-        #generate the texture and list holders
-        self._listID = GL.glGenLists(1)
-        if not self.win.winType=="pyglet":#pygame text needs a surface to render to
-            self._texID=GL.GLuint()
-            GL.glGenTextures(1, ctypes.byref(self._texID))
+        self._layout=None#the glyph quads of the current text (see _GlyphAtlas)
 
         self.colorSpace=colorSpace
         if rgb!=None:
@@ -3942,11 +5177,11 @@ class TextStim(_BaseVisualStim):
         if self.units=='cm':
             if height==None: self.height = 1.0#default text height
             else: self.height = height
-            self.heightPix = psychopy.misc.cm2pix(self.height, self.win.monitor)
+            self.heightPix = self.win.unitConverter.sizeToPix(self.height, 'cm')
         elif self.units in ['deg', 'degs']:
             if height==None: self.height = 1.0
             else: self.height = height
-            self.heightPix = psychopy.misc.deg2pix(self.height, self.win.monitor)
+            self.heightPix = self.win.unitConverter.sizeToPix(self.height, 'deg')
         elif self.units=='norm':
             if height==None: self.height = 0.1
             else: self.height = height
@@ -3966,10 +5201,13 @@ class TextStim(_BaseVisualStim):
         font should be a string specifying the name of the font (in system resources)
         """
         self.fontname=None#until we find one
-        if self.win.winType=="pyglet":
+        if self.win.winType in ["pyglet","offscreen"]:
+            fontType = "pyglet"
             self._font = pyglet.font.load(font, int(self.heightPix), dpi=72, italic=self.italic, bold=self.bold)
             self.fontname=font
+            fontKey = str(font)
         else:
+            fontType = "pygame"
             if font==None or len(font)==0:
                 self.fontname = pygame.font.get_default_font()
             elif font in pygame.font.get_fonts():
@@ -4001,6 +5239,10 @@ class TextStim(_BaseVisualStim):
                               Font names should be written as concatenated names all in lower case.\n \
                               e.g. 'arial', 'monotypecorsiva', 'rockwellextra'..." %(font, self.fontname))
                     self._font = pygame.font.SysFont(self.fontname, int(self.heightPix), italic=self.italic, bold=self.bold)
+            fontKey = str(self.fontname)
+        #glyphs are shared by all TextStims using the same font
+        self._atlas = _getGlyphAtlas(self._font, [fontKey, int(self.heightPix), self.bold, self.italic],
+            fontType, self.win, antialias=self.antialias)
         #re-render text after a font change
         self._needSetText=True
 
@@ -4008,16 +5250,12 @@ class TextStim(_BaseVisualStim):
         """Set the text to be rendered using the current font
         """
         if value!=None:#make sure we have unicode object to render
-            value = unicode(value)
-        if self._useShaders:
-            self._setTextShaders(value)
-        else:
-            self._setTextNoShaders(value)
+            self.text = unicode(value)
+        #only new characters need rendering; a repeated string is simply looked up
+        self._layout = self._atlas.layout(self.text, self._wrapWidthPix,
+            self.alignHoriz, self.alignVert)
+        self.width, self.height = self._layout['width'], self._layout['height']
         self._needSetText=False
-    def setRGB(self,value, operation=''):
-        self._set('rgb', value, operation)
-        if not self._useShaders:
-            self._needSetText=True
     def setColor(self, color, colorSpace=None, operation=''):
         """Set the color of the stimulus. See :ref:`colorspaces` for further information
         about the various ways to specify colors and their various implications.
@@ -4068,213 +5306,6 @@ class TextStim(_BaseVisualStim):
         """
         #call setColor from super class
         _BaseVisualStim.setColor(self, color, colorSpace=colorSpace, operation=operation)
-        #but then update text objects if necess
-        if not self._useShaders:
-            self._needSetText=True
-    def _setTextShaders(self,value=None):
-        """Set the text to be rendered using the current font
-        """
-        if value!=None:
-            self.text = value
-
-        if self.win.winType=="pyglet":
-            self._pygletTextObj = pyglet.font.Text(self._font, self.text,
-                                                       halign=self.alignHoriz, valign=self.alignVert,
-                                                       color = (1.0,1.0,1.0, self.opacity),
-                                                       width=self._wrapWidthPix)#width of the frame
-#            self._pygletTextObj = pyglet.text.Label(self.text,self.fontname, int(self.heightPix),
-#                                                       anchor_x=self.alignHoriz, anchor_y=self.alignVert,#the point we rotate around
-#                                                       halign=self.alignHoriz,
-#                                                       color = (int(127.5*self.rgb[0]+127.5),
-#                                                            int(127.5*self.rgb[1]+127.5),
-#                                                            int(127.5*self.rgb[2]+127.5),
-#                                                            int(255*self.opacity)),
-#                                                       multiline=True, width=self._wrapWidthPix)#width of the frame
-            self.width, self.height = self._pygletTextObj.width, self._pygletTextObj.height
-        else:
-            self._surf = self._font.render(value, self.antialias, [255,255,255])
-            self.width, self.height = self._surf.get_size()
-
-            if self.antialias: smoothing = GL.GL_LINEAR
-            else: smoothing = GL.GL_NEAREST
-            #generate the textures from pygame surface
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)#bind that name to the target
-            GL.gluBuild2DMipmaps(GL.GL_TEXTURE_2D, 4, self.width,self.height,
-                                  GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, pygame.image.tostring( self._surf, "RGBA",1))
-            GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MAG_FILTER,smoothing)    #linear smoothing if texture is stretched?
-            GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MIN_FILTER,smoothing)    #but nearest pixel value if it's compressed?
-
-        self._needSetText=False
-        self.needUpdate = True
-
-    def _updateListShaders(self):
-        """
-        This is only used with pygame text - pyglet handles all from the draw()
-        """
-        if self._needSetText:
-            self.setText()
-        GL.glNewList(self._listID, GL.GL_COMPILE)
-        #GL.glPushMatrix()
-
-        #setup the shaderprogram
-        #no need to do texture maths so no need for programs?
-        #If we're using pyglet then this list won't be called, and for pygame shaders aren't enabled
-        GL.glUseProgram(0)#self.win._progSignedTex)
-        #GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTex, "texture"), 0) #set the texture to be texture unit 0
-
-        #coords:
-        if self.alignHoriz in ['center', 'centre']: left = -self.width/2.0;    right = self.width/2.0
-        elif self.alignHoriz =='right':    left = -self.width;    right = 0.0
-        else: left = 0.0; right = self.width
-        #how much to move bottom
-        if self.alignVert in ['center', 'centre']: bottom=-self.height/2.0; top=self.height/2.0
-        elif self.alignVert =='top': bottom=-self.height; top=0
-        else: bottom=0.0; top=self.height
-        Btex, Ttex, Ltex, Rtex = -0.01, 0.98, 0,1.0#there seems to be a rounding err in pygame font textures
-
-        #unbind the mask texture regardless
-        GL.glActiveTexture(GL.GL_TEXTURE1)
-        GL.glEnable(GL.GL_TEXTURE_2D)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        if self.win.winType=="pyglet":
-            #unbind the main texture
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-#            GL.glActiveTextureARB(GL.GL_TEXTURE0_ARB)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0) #the texture is specified by pyglet.font.GlyphString.draw()
-            GL.glEnable(GL.GL_TEXTURE_2D)
-        else:
-            #bind the appropriate main texture
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-
-        if self.win.winType=="pyglet":
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            self._pygletTextObj.draw()
-        else:
-            GL.glBegin(GL.GL_QUADS)                  # draw a 4 sided polygon
-            # right bottom
-            GL.glMultiTexCoord2f(GL.GL_TEXTURE0,Rtex, Btex)
-            GL.glVertex3f(right,bottom,0)
-            # left bottom
-            GL.glMultiTexCoord2f(GL.GL_TEXTURE0,Ltex,Btex)
-            GL.glVertex3f(left,bottom,0)
-            # left top
-            GL.glMultiTexCoord2f(GL.GL_TEXTURE0,Ltex,Ttex)
-            GL.glVertex3f(left,top,0)
-            # right top
-            GL.glMultiTexCoord2f(GL.GL_TEXTURE0,Rtex,Ttex)
-            GL.glVertex3f(right,top,0)
-            GL.glEnd()
-
-        GL.glDisable(GL.GL_TEXTURE_2D)
-        GL.glUseProgram(0)
-        #GL.glPopMatrix()
-
-        GL.glEndList()
-        self.needUpdate=0
-
-    def _setTextNoShaders(self,value=None):
-        """Set the text to be rendered using the current font
-        """
-        self.text = value
-
-        if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
-            desiredRGB = (self.rgb*self.contrast+1)/2.0#RGB in range 0:1 and scaled for contrast
-            if numpy.any(desiredRGB>1.0) or numpy.any(desiredRGB<0):
-                logging.warning('Desired color %s (in RGB 0->1 units) falls outside the monitor gamut. Drawing blue instead'%desiredRGB) #AOH
-                desiredRGB=[0.0,0.0,1.0]
-        else:
-            desiredRGB = (self.rgb*self.contrast)/255.0
-
-        if self.win.winType=="pyglet":
-            self._pygletTextObj = pyglet.font.Text(self._font, self.text,
-                                                       halign=self.alignHoriz, valign=self.alignVert,
-                                                       color = (desiredRGB[0],desiredRGB[1], desiredRGB[2], self.opacity),
-                                                       width=self._wrapWidthPix,#width of the frame
-                                                       )
-            self.width, self.height = self._pygletTextObj.width, self._pygletTextObj.height
-        else:
-            self._surf = self._font.render(value, self.antialias,
-                                           [desiredRGB[0]*255,
-                                            desiredRGB[1]*255,
-                                            desiredRGB[2]*255])
-            self.width, self.height = self._surf.get_size()
-            if self.antialias: smoothing = GL.GL_LINEAR
-            else: smoothing = GL.GL_NEAREST
-            #generate the textures from pygame surface
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)#bind that name to the target
-            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA,
-                            self.width,self.height,0,
-                            GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, pygame.image.tostring( self._surf, "RGBA",1))
-            GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MAG_FILTER,smoothing)    #linear smoothing if texture is stretched?
-            GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MIN_FILTER,smoothing)    #but nearest pixel value if it's compressed?
-        self.needUpdate = True
-
-    def _updateListNoShaders(self):
-        """
-        The user shouldn't need this method since it gets called
-        after every call to .set() Basically it updates the OpenGL
-        representation of your stimulus if some parameter of the
-        stimulus changes. Call it if you change a property manually
-        rather than using the .set() command
-        """
-        if self._needSetText:
-            self.setText()
-        GL.glNewList(self._listID, GL.GL_COMPILE)
-
-        #coords:
-        if self.alignHoriz in ['center', 'centre']: left = -self.width/2.0;    right = self.width/2.0
-        elif self.alignHoriz =='right':    left = -self.width;    right = 0.0
-        else: left = 0.0; right = self.width
-        #how much to move bottom
-        if self.alignVert in ['center', 'centre']: bottom=-self.height/2.0; top=self.height/2.0
-        elif self.alignVert =='top': bottom=-self.height; top=0
-        else: bottom=0.0; top=self.height
-        Btex, Ttex, Ltex, Rtex = -0.01, 0.98, 0,1.0#there seems to be a rounding err in pygame font textures
-        if self.win.winType=="pyglet":
-            #unbind the mask texture
-            GL.glActiveTexture(GL.GL_TEXTURE1)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-            #unbind the main texture
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-        else:
-            #bind the appropriate main texture
-            GL.glActiveTextureARB(GL.GL_TEXTURE0_ARB)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
-            #unbind the mask texture regardless
-            GL.glActiveTextureARB(GL.GL_TEXTURE1_ARB)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-
-        if self.win.winType=="pyglet":
-            self._pygletTextObj.draw()
-        else:
-            GL.glBegin(GL.GL_QUADS)                  # draw a 4 sided polygon
-            # right bottom
-            GL.glMultiTexCoord2fARB(GL.GL_TEXTURE0_ARB,Rtex, Btex)
-            GL.glVertex2f(right,bottom)
-            # left bottom
-            GL.glMultiTexCoord2fARB(GL.GL_TEXTURE0_ARB,Ltex,Btex)
-            GL.glVertex2f(left,bottom)
-            # left top
-            GL.glMultiTexCoord2fARB(GL.GL_TEXTURE0_ARB,Ltex,Ttex)
-            GL.glVertex2f(left,top)
-            # right top
-            GL.glMultiTexCoord2fARB(GL.GL_TEXTURE0_ARB,Rtex,Ttex)
-            GL.glVertex2f(right,top)
-            GL.glEnd()
-
-        GL.glDisable(GL.GL_TEXTURE_2D)
-        GL.glEndList()
-        self.needUpdate=0
-
     def draw(self, win=None):
         """
         Draw the stimulus in its relevant window. You must call
@@ -4286,7 +5317,7 @@ class TextStim(_BaseVisualStim):
         """
         #set the window to draw to
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
 
         GL.glPushMatrix()
         GL.glLoadIdentity()#for PyOpenGL this is necessary despite pop/PushMatrix, (not for pyglet)
@@ -4296,51 +5327,27 @@ class TextStim(_BaseVisualStim):
         GL.glRotatef(-self.ori,0.0,0.0,1.0)
         win.setScale('pix', None, prevScale)#back to pixels for drawing surface
 
-        if self._useShaders: #then rgb needs to be set as glColor
-            #setup color
-            if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
-                desiredRGB = (self.rgb*self.contrast+1)/2.0#RGB in range 0:1 and scaled for contrast
-                if numpy.any(desiredRGB>1.0) or numpy.any(desiredRGB<0):
-                    logging.warning('Desired color %s (in RGB 0->1 units) falls outside the monitor gamut. Drawing blue instead'%desiredRGB) #AOH
-                    desiredRGB=[0.0,0.0,1.0]
-                GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
-            else:
-                desiredRGB = (self.rgb*self.contrast)/255.0
-            GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
-
-            GL.glUseProgram(self.win._progSignedTexFont)#self.win._progSignedTex)
-#            GL.glUniform3iv(GL.glGetUniformLocation(self.win._progSignedTexFont, "rgb"), 1,
-#                desiredRGB.ctypes.data_as(ctypes.POINTER(ctypes.c_float))) #set the texture to be texture unit 0
-            GL.glUniform3f(GL.glGetUniformLocation(self.win._progSignedTexFont, "rgb"), desiredRGB[0],desiredRGB[1],desiredRGB[2])
-
-        else: #color is set in texture, so set glColor to white
-            GL.glColor4f(1,1,1,1)
+        #setup color (the glyph textures only provide the alpha)
+        if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
+            desiredRGB = (self.rgb*self.contrast+1)/2.0#RGB in range 0:1 and scaled for contrast
+            if numpy.any(desiredRGB>1.0) or numpy.any(desiredRGB<0):
+                logging.warning('Desired color %s (in RGB 0->1 units) falls outside the monitor gamut. Drawing blue instead'%desiredRGB) #AOH
+                desiredRGB=[0.0,0.0,1.0]
+        else:
+            desiredRGB = (self.rgb*self.contrast)/255.0
+        GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
+        if self._useShaders:
+            GL.glUseProgram(self.win._progSignedTexFont)
+            GL.glUniform3f(self.win._getUniformLocation(self.win._progSignedTexFont, "rgb"), desiredRGB[0],desiredRGB[1],desiredRGB[2])
 
         GL.glDisable(GL.GL_DEPTH_TEST) #should text have a depth or just on top?
-        #update list if necss and then call it
-        if win.winType=='pyglet':
-
-            #and align based on x anchor
-            if self.alignHoriz=='right':
-                GL.glTranslatef(-self.width,0,0)#NB depth is set already
-            if self.alignHoriz in ['center', 'centre']:
-                GL.glTranslatef(-self.width/2,0,0)#NB depth is set already
-
-            #unbind the mask texture regardless
-            GL.glActiveTexture(GL.GL_TEXTURE1)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-            #unbind the main texture
-            GL.glActiveTexture(GL.GL_TEXTURE0)
-            GL.glEnable(GL.GL_TEXTURE_2D)
-            #then allow pyglet to bind and use texture during drawing
-
-            self._pygletTextObj.draw()
-            GL.glDisable(GL.GL_TEXTURE_2D)
-        else:
-            #for pygame we should (and can) use a drawing list
-            if self.needUpdate: self._updateList()
-            GL.glCallList(self._listID)
+        if self._needSetText:
+            self.setText()
+        #unbind the mask texture regardless
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        #then draw the glyph quads (already aligned around the origin)
+        self._atlas.draw(self._layout)
         if self._useShaders: GL.glUseProgram(0)#disable shader (but command isn't available pre-OpenGL2.0)
 
         #GL.glEnable(GL.GL_DEPTH_TEST)                   # Enables Depth Testing
@@ -4556,7 +5563,7 @@ class ShapeStim(_BaseVisualStim):
         if self.needVertexUpdate: self._calcVerticesRendered()
 
         if win==None: win=self.win
-        if win.winType=='pyglet': win.winHandle.switch_to()
+        win._setCurrent()
 
         nVerts = self.vertices.shape[0]
 
@@ -4610,12 +5617,9 @@ class ShapeStim(_BaseVisualStim):
         if self.units in ['norm', 'pix', 'height']:
             self._verticesRendered=self.vertices
             self._posRendered=self.pos
-        elif self.units in ['deg', 'degs']:
-            self._verticesRendered=psychopy.misc.deg2pix(self.vertices, self.win.monitor)
-            self._posRendered=psychopy.misc.deg2pix(self.pos, self.win.monitor)
-        elif self.units=='cm':
-            self._verticesRendered=psychopy.misc.cm2pix(self.vertices, self.win.monitor)
-            self._posRendered=psychopy.misc.cm2pix(self.pos, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']:
+            self._verticesRendered=self.win.unitConverter.sizeToPix(self.vertices, self.units)
+            self._posRendered=self.win.unitConverter.toPix(self.pos, self.units)
         self._verticesRendered = self._verticesRendered * self.size
 
 class Polygon(ShapeStim):
@@ -4974,8 +5978,7 @@ class BufferImageStim(PatchStim):
         """
         # this is copy & pasted from PatchStim, then had stuff taken out for speed
 
-        if self.win.winType=='pyglet':
-            self.win.winHandle.switch_to()
+        self.win._setCurrent()
 
         GL.glPushMatrix() # preserve state
         #GL.glLoadIdentity()
@@ -4987,7 +5990,7 @@ class BufferImageStim(PatchStim):
         GL.glRotatef(-self.ori, 0.0, 0.0, 1.0)
         GL.glColor4f(self.desiredRGB[0], self.desiredRGB[1], self.desiredRGB[2], self.opacity)
 
-        GL.glCallList(self._listID) # make it happen
+        self._callList() # make it happen
         GL.glPopMatrix() #return the view to previous state
 
 class RatingScale:
@@ -5945,14 +6948,34 @@ class RatingScale:
         return self.decisionTime
 
 class Aperture:
-    """Restrict a stimulus visibility area to a basic shape (circle, square, triangle)
+    """Restrict a stimulus visibility area to a basic shape (circle, square,
+    triangle), a polygon or the opaque parts of an image
 
     When enabled, any drawing commands will only operate on pixels within the
     Aperture. Once disabled, subsequent draw operations affect the whole screen
     as usual.
 
+    The shape is built once (in a vertex buffer where possible) and
+    setPos(), setSize() and setOri() only change the transform, so moving the
+    aperture on every frame (e.g. for a gaze-contingent display) is cheap. Each
+    change erases just the area of the stencil that the aperture covered
+    before, rather than clearing the whole stencil buffer.
+
     See demos/stimuli/aperture.py for example usage
 
+    :Parameters:
+
+        size:
+            the diameter of the circle, square and triangle shapes or, for
+            vertices or images, the width (or [width, height]) that they are
+            scaled to
+        shape:
+            'circle', 'square', 'triangle', a list of [x,y] vertices (in
+            multiples of `size`, centred on 0; the polygon can be concave), or
+            an image (file name, PIL Image or numpy array with values -1:1)
+            whose opaque (alpha>0.5) or bright (>0 for arrays) parts are
+            the aperture
+
     :Author:
         2011, Yuri Spitsyn
         2011, Jon Peirce added units options, Jeremy Gray added shape & orientation
@@ -5969,40 +6992,155 @@ class Aperture:
         if self.units in ['norm','height']: self._winScale=self.units
         else: self._winScale='pix' #set the window to have pixels coords
 
-        if shape.lower() == 'square':
-            ori += 45
-            nVert = 4
-        elif shape.lower() == 'triangle':
-            nVert = 3
         self.ori = ori
         self.nVert = 120
         if type(nVert) == int:
             self.nVert = nVert
-        self.quad=GL.gluNewQuadric() #needed for gluDisk
+        self._vboID=None
+        self._maskID=None
+        self._written=None#the (pos, size, ori) that the stencil currently holds
+        self.setShape(shape, needReset=False)
         self.setSize(size, needReset=False)
         self.setPos(pos, needReset=False)
         self._reset()#implicitly runs an self.enable()
+    def setShape(self, shape, needReset=True):
+        """Set the shape of the Aperture ('circle', 'square', 'triangle',
+        vertices or an image; see :class:`Aperture`)
+        """
+        self.shape=shape
+        self._oriOffset=0
+        texCoords=None
+        if type(shape) in [str, unicode] and shape.lower() in ['circle', 'square', 'triangle']:
+            nVert=self.nVert
+            if shape.lower() == 'square':
+                self._oriOffset = 45
+                nVert = 4
+            elif shape.lower() == 'triangle':
+                nVert = 3
+            #as gluDisk makes them; the first vertex at the top
+            angles = numpy.arange(nVert)*2*pi/nVert
+            vertices = 0.5*numpy.array([numpy.sin(angles), numpy.cos(angles)]).transpose()
+        elif type(shape) in [str, unicode] or isinstance(shape, Image.Image) or \
+                (isinstance(shape, numpy.ndarray) and shape.ndim==2 and shape.shape[1]!=2):
+            self._setMaskImage(shape)
+            vertices = numpy.array([[-0.5,-0.5], [0.5,-0.5], [0.5,0.5], [-0.5,0.5]])
+            texCoords = numpy.array([[0,0], [1,0], [1,1], [0,1]])
+        else:#vertices of a polygon
+            vertices = numpy.asarray(shape, numpy.float32)
+        self._nVertices = len(vertices)
+        #the vertices then any texture coords, in one array (and one buffer)
+        if texCoords is None:
+            geometry = numpy.asarray(vertices, numpy.float32)
+        else:
+            geometry = numpy.concatenate([vertices, texCoords]).astype(numpy.float32)
+        self._geometry = numpy.ascontiguousarray(geometry)
+        self._hasTexCoords = texCoords is not None
+        if not self._hasTexCoords and self._maskID is not None:
+            GL.glDeleteTextures(1, ctypes.byref(self._maskID))
+            self._maskID=None
+        if GL.gl_info.have_version(1,5):
+            if self._vboID is None:
+                self._vboID = GL.GLuint()
+                GL.glGenBuffers(1, ctypes.byref(self._vboID))
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboID)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, self._geometry.nbytes,
+                self._geometry.ctypes.data_as(ctypes.POINTER(ctypes.c_float)), GL.GL_STATIC_DRAW)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self._written=None#the new shape needs a full clear
+        if needReset: self._reset()
+    def _setMaskImage(self, image):
+        """Load an image (file name, PIL Image or array -1:1) as an alpha texture
+        """
+        if isinstance(image, numpy.ndarray):
+            alpha = psychopy.misc.float_uint8(numpy.clip(image, -1, 1))#rows from the bottom, as for other stimuli
+            im = Image.fromarray(alpha[::-1])
+        else:
+            if not isinstance(image, Image.Image):
+                image = Image.open(image)
+            if image.mode in ['RGBA', 'LA']:
+                im = image.split()[-1]
+            else:
+                im = image.convert('L')
+        if _needPowerOf2Textures():
+            im = _resizeToPowerOf2(im, 'aperture')
+        im = im.transpose(Image.FLIP_TOP_BOTTOM)#GL rows start at the bottom
+        data = numpy.ascontiguousarray(numpy.asarray(im, numpy.uint8))
+        if self._maskID is None:
+            self._maskID = GL.GLuint()
+            GL.glGenTextures(1, ctypes.byref(self._maskID))
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._maskID)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_ALPHA, data.shape[1], data.shape[0], 0,
+            GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE, data.ctypes)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
     def _reset(self):
         self.enable()
-        GL.glClearStencil(0)
-        GL.glClear(GL.GL_STENCIL_BUFFER_BIT)
-
-        GL.glPushMatrix()
-        self.win.setScale(self._winScale)
-        GL.glTranslatef(self._posRendered[0], self._posRendered[1], 0)
-        GL.glRotatef(-self.ori, 0.0, 0.0, 1.0)
-
         GL.glDisable(GL.GL_LIGHTING)
         GL.glDisable(GL.GL_DEPTH_TEST)
         GL.glDepthMask(GL.GL_FALSE)
-
+        if self._written is None:
+            GL.glClearStencil(0)
+            GL.glClear(GL.GL_STENCIL_BUFFER_BIT)
+        #fragments never pass so nothing is drawn, but the stencil is updated;
+        #only the lowest bit is used
         GL.glStencilFunc(GL.GL_NEVER, 0, 0)
-        GL.glStencilOp(GL.GL_INCR, GL.GL_INCR, GL.GL_INCR)
-        GL.glColor3f(0,0,0)
-        GL.gluDisk(self.quad, 0, self._sizeRendered/2.0, self.nVert, 2)
+        GL.glStencilMask(1)
+        if self._written is not None:#erase the area we set last time
+            pos, size, ori = self._written
+            GL.glStencilOp(GL.GL_ZERO, GL.GL_ZERO, GL.GL_ZERO)
+            self._drawShape(pos, size, ori, alphaTest=False)
+        #inverting (rather than setting) the stencil for each triangle of the fan
+        #fills concave polygons correctly
+        GL.glStencilOp(GL.GL_INVERT, GL.GL_INVERT, GL.GL_INVERT)
+        pos = numpy.array(self._posRendered, float)
+        size = numpy.ones(2)*self._sizeRendered
+        ori = self.ori+self._oriOffset
+        self._drawShape(pos, size, ori, alphaTest=True)
+        self._written = (pos, size, ori)
+        GL.glStencilMask(0xFF)
         GL.glStencilFunc(GL.GL_EQUAL, 1, 1)
         GL.glStencilOp(GL.GL_KEEP, GL.GL_KEEP, GL.GL_KEEP)
-
+    def _drawShape(self, pos, size, ori, alphaTest=True):
+        GL.glPushMatrix()
+        self.win.setScale(self._winScale)
+        GL.glTranslatef(pos[0], pos[1], 0)
+        GL.glRotatef(-ori, 0.0, 0.0, 1.0)
+        GL.glScalef(size[0], size[1], 1.0)
+        if self._vboID is not None:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vboID)
+            vertexPtr = None
+            texCoordPtr = ctypes.c_void_p(self._nVertices*2*4)#after the vertices
+        else:
+            vertexPtr = self._geometry.ctypes
+            texCoordPtr = self._geometry[self._nVertices:].ctypes
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glVertexPointer(2, GL.GL_FLOAT, 0, vertexPtr)
+        if self._hasTexCoords:
+            if self.win._haveShaders:
+                GL.glUseProgram(0)
+            GL.glActiveTexture(GL.GL_TEXTURE0)
+            GL.glEnable(GL.GL_TEXTURE_2D)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, self._maskID)
+            GL.glClientActiveTexture(GL.GL_TEXTURE0)
+            GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+            GL.glTexCoordPointer(2, GL.GL_FLOAT, 0, texCoordPtr)
+            GL.glColor4f(1,1,1,1)#(with GL_MODULATE the current color would scale the alpha)
+            if alphaTest:#only the opaque parts of the image are in the aperture
+                GL.glEnable(GL.GL_ALPHA_TEST)
+                GL.glAlphaFunc(GL.GL_GREATER, 0.5)
+        GL.glDrawArrays(GL.GL_TRIANGLE_FAN, 0, self._nVertices)
+        if self._hasTexCoords:
+            GL.glDisable(GL.GL_ALPHA_TEST)
+            GL.glDisableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+            GL.glDisable(GL.GL_TEXTURE_2D)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        if self._vboID is not None:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
         GL.glPopMatrix()
 
     def setSize(self, size, needReset=True):
@@ -6017,18 +7155,21 @@ class Aperture:
         self.pos = numpy.array(pos)
         self._calcPosRendered()
         if needReset: self._reset()
+    def setOri(self, ori, needReset=True):
+        """Set the orientation (deg, clockwise) of the Aperture
+        """
+        self.ori = ori
+        if needReset: self._reset()
     def _calcSizeRendered(self):
         """Calculate the size of the stimulus in coords of the :class:`~psychopy.visual.Window` (normalised or pixels)"""
         if self.units in ['norm','pix', 'height']: self._sizeRendered=self.size
-        elif self.units in ['deg', 'degs']: self._sizeRendered=psychopy.misc.deg2pix(self.size, self.win.monitor)
-        elif self.units=='cm': self._sizeRendered=psychopy.misc.cm2pix(self.size, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._sizeRendered=self.win.unitConverter.sizeToPix(self.size, self.units)
         else:
             logging.ERROR("Stimulus units should be 'height', 'norm', 'deg', 'cm' or 'pix', not '%s'" %self.units)
     def _calcPosRendered(self):
         """Calculate the pos of the stimulus in coords of the :class:`~psychopy.visual.Window` (normalised or pixels)"""
         if self.units in ['norm','pix', 'height']: self._posRendered=self.pos
-        elif self.units in ['deg', 'degs']: self._posRendered=psychopy.misc.deg2pix(self.pos, self.win.monitor)
-        elif self.units=='cm': self._posRendered=psychopy.misc.cm2pix(self.pos, self.win.monitor)
+        elif self.units in ['deg', 'degs', 'cm']: self._posRendered=self.win.unitConverter.toPix(self.pos, self.units)
     def enable(self):
         """Enable the aperture so that it is used in future drawing operations
 
@@ -6236,6 +7377,224 @@ def makeRadialMatrix(matrixSize):
     rad = numpy.sqrt(xx**2 + yy**2)
     return rad
 
+def _renderStateKey(stim):
+    """The sort key used by Window.flip() when sortAutoDraw is True: stimuli of the
+    same type (and so shader program) and with the same textures are drawn together
+    """
+    texID = getattr(stim, 'texID', getattr(stim, '_texID', None))
+    maskID = getattr(stim, 'maskID', getattr(stim, '_maskID', None))
+    return (stim.__class__.__name__, getattr(texID, 'value', texID), getattr(maskID, 'value', maskID))
+
+class _GLCallCounter:
+    """Stands in for pyglet.gl (as visual.GL) while Window.setRecordGLCalls(True),
+    counting every gl/glu call made in this module in `nCalls`
+    """
+    def __init__(self, gl):
+        self._gl=gl
+        self.nCalls=0
+    def __getattr__(self, name):
+        attr = getattr(self._gl, name)
+        if not name.startswith('gl') or not callable(attr):
+            return attr#constants and current_context etc
+        def counted(*args):
+            self.nCalls+=1
+            return attr(*args)
+        setattr(self, name, counted)#so we only wrap each function once
+        return counted
+
+class _TextureCache:
+    """A process-wide store of the textures that createTexture() makes from
+    named textures ('sin', 'gauss', 'raisedCos'...) and from image files.
+
+    Stimuli asking for the same texture (same source, file modification time,
+    res, pixFormat, shader mode, interpolation and maskParams) are given the
+    same openGL texture, so 200 stimuli sharing a 'gauss' mask only create
+    (and upload) it once. Each texture is reference counted; stimuli return
+    theirs with releaseTexture() (called by their clearTextures() method).
+
+    Textures that no stimulus is using are kept, so that they can be reused
+    by later stimuli, until the total size exceeds `maxBytes` at which point
+    the least recently used are deleted. Use via the module instance
+    `visual.textureCache`, e.g.::
+
+        visual.textureCache.maxBytes = 512*1024**2 #allow 512MB of textures
+        print visual.textureCache.hits, visual.textureCache.misses
+
+    """
+    def __init__(self, maxBytes=256*1024**2):
+        self.maxBytes=maxBytes
+        self.nBytes=0#total size of the cached textures
+        self.hits=0
+        self.misses=0
+        self._entries={}#key:entry (a dict with id, refs, nBytes, lastUse...)
+        self._keys={}#GL texture name:key (to find the entry of a given stim texture)
+        self._useCount=0#a counter for keeping track of the least recently used
+    def getKey(self, tex, pixFormat, stim, res, maskParams):
+        """Returns a key for this texture request, or None if the texture can't
+        be cached (e.g. numpy arrays and images in memory)
+        """
+        if type(tex) not in [str, unicode, numpy.string_] and tex is not None:
+            return None
+        if tex in [None, "none", "None", "sin", "sqr", "saw", "tri", "sinXsin", "sqrXsqr",
+                "circle", "gauss", "radRamp", "raisedCos"]:
+            source = tex
+        elif os.path.isfile(tex):
+            #a file: if it gets changed then its mtime will too
+            source = (os.path.abspath(tex), os.path.getmtime(tex))
+            res = None#not used for images
+        else:
+            return None#createTexture will raise the error
+        if maskParams is not None:
+            maskParams = tuple(sorted(maskParams.items()))
+        key = [source, res, pixFormat, stim._useShaders, stim.interpolate, maskParams, id(stim.win)]
+        if not stim._useShaders:
+            #the stimulus color and opacity get built into the texture
+            for attrib in ['rgb', 'rgbPedestal', 'colorSpace', 'contrast', 'opacity']:
+                val = getattr(stim, attrib, None)
+                if isinstance(val, (numpy.ndarray, list)):
+                    val = tuple(numpy.asarray(val).ravel())
+                key.append(val)
+        return tuple(key)
+    def reuse(self, key, id, stim):
+        """If the texture for `key` exists then point `id` (a GL.GLuint) at it,
+        deleting the texture that `id` previously held, and return True
+        """
+        if key not in self._entries:
+            self.misses+=1
+            return False
+        entry = self._entries[key]
+        if id.value:#the stim's own texture is no longer needed
+            GL.glDeleteTextures(1, id)
+        id.value = entry['id']
+        entry['refs']+=1
+        self._useCount+=1
+        entry['lastUse']=self._useCount
+        if entry['origSize'] is not None:
+            stim.origSize = entry['origSize']
+        self.hits+=1
+        return True
+    def add(self, key, id, nBytes, stim):
+        """Store the texture just created in `id` (with one user) under `key`"""
+        self._useCount+=1
+        self._entries[key] = {'id':id.value, 'refs':1, 'nBytes':nBytes,
+            'lastUse':self._useCount, 'origSize':getattr(stim, 'origSize', None)}
+        self._keys[id.value] = key
+        self.nBytes+=nBytes
+        self._evict()
+    def release(self, id):
+        """Stop using the shared texture in `id` (if it is one), leaving `id`
+        at 0. Returns True if the texture was a shared one.
+        """
+        if id.value not in self._keys:
+            return False
+        self._entries[self._keys[id.value]]['refs']-=1
+        id.value = 0
+        self._evict()
+        return True
+    def _evict(self):
+        """Delete the least recently used textures that are no longer in use
+        until we are back under budget
+        """
+        if self.nBytes<=self.maxBytes:
+            return
+        unused = [(entry['lastUse'], key) for key, entry in self._entries.items() if entry['refs']<=0]
+        unused.sort()
+        for lastUse, key in unused:
+            if self.nBytes<=self.maxBytes:
+                break
+            entry = self._entries.pop(key)
+            del self._keys[entry['id']]
+            GL.glDeleteTextures(1, GL.GLuint(entry['id']))
+            self.nBytes-=entry['nBytes']
+    def clear(self, win=None):
+        """Forget the cached textures (for the given Window, or all). Textures
+        that aren't in use are deleted.
+        """
+        for key, entry in self._entries.items():
+            if win is not None and key[6]!=id(win):
+                continue
+            del self._entries[key]
+            del self._keys[entry['id']]
+            if entry['refs']<=0 and win is None:
+                GL.glDeleteTextures(1, GL.GLuint(entry['id']))
+            self.nBytes-=entry['nBytes']
+
+textureCache = _TextureCache()
+
+def releaseTexture(id):
+    """Release a texture made by :func:`createTexture` (e.g. when a stimulus is
+    finished with it). Textures shared through the `textureCache` are handed
+    back to the cache, others are deleted from the graphics card.
+    """
+    if not textureCache.release(id):
+        GL.glDeleteTextures(1, id)
+
+#the named textures and masks that PatchStim(procedural=True) computes in a shader
+#(codes as used by _shaders.fragProcedural)
+_proceduralTex = {'sin':1, 'sqr':2, 'sinXsin':3, 'sqrXsqr':4, 'noise':5, 'binaryNoise':6, 'gaussNoise':7}
+_proceduralMasks = {'circle':1, 'gauss':2, 'radRamp':3, 'raisedCos':4}
+
+#NoiseStim noiseTypes and the names of the matching (PatchStim procedural) textures
+_noiseTexNames = {'white':'noise', 'binary':'binaryNoise', 'gauss':'gaussNoise', 'filtered':None}
+
+def _makeNoise(noiseType, rng, shape):
+    """Random values (-1:1) from `rng` (numpy.random or a RandomState):
+    uniform for 'noise', -1 or 1 for 'binaryNoise' and normal (sd=1/3,
+    clipped) for 'gaussNoise'
+    """
+    if noiseType=='binaryNoise':
+        return rng.randint(0, 2, shape)*2.0-1.0
+    elif noiseType=='gaussNoise':
+        return numpy.clip(rng.normal(0, 1/3.0, shape), -1, 1)
+    return rng.uniform(-1.0, 1.0, shape)
+
+class _NoiseBank:
+    """Frames of noise for a NoiseStim, computed ahead by a background thread
+    into a fixed pool of `nFrames` arrays (so nothing is allocated per frame).
+    get() a frame and recycle() it once it has been uploaded.
+    """
+    def __init__(self, noiseType, res, sfRange=None, seed=None, nFrames=8):
+        self.noiseType=noiseType
+        self.res=res
+        self._rng = numpy.random.RandomState(seed)
+        if noiseType=='filtered':
+            #a band-pass filter (in cycles per stimulus) for the real fft of the noise
+            fy = numpy.fft.fftfreq(res)*res
+            fx = numpy.arange(res//2+1)
+            sf = numpy.sqrt(fy[:,numpy.newaxis]**2 + fx[numpy.newaxis,:]**2)
+            self._filter = (sf>=sfRange[0])&(sf<=sfRange[1])
+        self._stopping=False
+        self._free = Queue.Queue()
+        for n in range(max(1, nFrames)):
+            self._free.put(numpy.empty([res,res], numpy.float32))
+        self._ready = Queue.Queue()
+        self._thread = threading.Thread(target=self._fill, name='NoiseBank')
+        self._thread.daemon=True
+        self._thread.start()
+    def get(self):
+        """The next frame of noise (waits if the bank has run dry)"""
+        return self._ready.get()
+    def recycle(self, frame):
+        self._free.put(frame)
+    def stop(self):
+        self._stopping=True
+        self._free.put(None)
+    def _fill(self):
+        while True:
+            frame = self._free.get()
+            if frame is None or self._stopping:
+                break
+            if self.noiseType=='filtered':
+                noise = numpy.fft.irfft2(numpy.fft.rfft2(self._rng.normal(0, 1, frame.shape))*self._filter,
+                    s=frame.shape)
+                std = noise.std()
+                if std>0: noise *= 1/(3.0*std)#sd=1/3, as for gauss noise
+                frame[:] = numpy.clip(noise, -1, 1)
+            else:
+                frame[:] = _makeNoise(_noiseTexNames[self.noiseType], self._rng, frame.shape)
+            self._ready.put(frame)
+
+
 def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
     """
     id is the texture ID
@@ -6243,6 +7602,9 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
     useShaders is a bool
     interpolate is a bool (determines whether texture will use GL_LINEAR or GL_NEAREST
     res is the resolution of the texture (unless a bitmap image is used)
+
+    Named textures and image files are shared through the `textureCache`, in
+    which case `id` is changed to refer to the shared texture.
     """
 
     """
@@ -6251,6 +7613,16 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
     global _nImageResizes
     useShaders = stim._useShaders
     interpolate = stim.interpolate
+    resizeImages = not getattr(stim.win, '_haveNPOT', False)#otherwise use images at their own size
+    fromImage = False
+
+    #stop using any shared texture we had and see if the new one exists already
+    textureCache.release(id)
+    cacheKey = textureCache.getKey(tex, pixFormat, stim, res, maskParams)
+    if cacheKey is not None and textureCache.reuse(cacheKey, id, stim):
+        return
+    if not id.value:
+        GL.glGenTextures(1, ctypes.byref(id))
     if type(tex) == numpy.ndarray:
         #handle a numpy array
         #for now this needs to be an NxN intensity array
@@ -6269,11 +7641,11 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
             res=tex.shape[0]
         else:
             stim._tex1D=False
-            #check if it's a square power of two
+            #check if it's a square power of two (only needed for old cards)
             maxDim = max(tex.shape)
             powerOf2 = 2**numpy.ceil(numpy.log2(maxDim))
-            if tex.shape[0]!=powerOf2 or tex.shape[1]!=powerOf2:
-                logging.error("Numpy array textures must be square and must be power of two (e.g. 16x16, 256x256)")
+            if (tex.shape[0]!=powerOf2 or tex.shape[1]!=powerOf2) and not getattr(stim.win, '_haveNPOT', False):
+                logging.error("Numpy array textures must be square and must be power of two (e.g. 16x16, 256x256) on this graphics card")
                 core.quit()
             res=tex.shape[0]
     elif tex in [None,"none", "None"]:
@@ -6297,6 +7669,9 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
         intensity[int(res/2.0+1):] = 2.0-intensity[int(res/2.0+1):]#remove from 3 to get back down to -1
         intensity = intensity*numpy.ones([res,1])#make 2D
         wasLum = True
+    elif tex in ["noise", "binaryNoise", "gaussNoise"]:#random values (not cached, so each stim gets new noise)
+        intensity = _makeNoise(tex, numpy.random, [res,res])
+        wasLum = True
     elif tex == "sinXsin":
         onePeriodX, onePeriodY = numpy.mgrid[0:2*pi:1j*res, 0:2*pi:1j*res]# NB 1j*res is a special mgrid notation
         intensity = numpy.sin(onePeriodX-pi/2)*numpy.sin(onePeriodY-pi/2)
@@ -6374,13 +7749,20 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
                 logging.error("Couldn't find image file '%s'; check path?" %(tex)); logging.flush()
                 raise OSError, "Couldn't find image file '%s'; check path? (tried: %s)" \
                     % (tex, os.path.abspath(tex))#ensure we quit
-            try:
-                im = Image.open(tex)
-                im = im.transpose(Image.FLIP_TOP_BOTTOM)
-            except IOError:
-                logging.error("Found file '%s' but failed to load as an image" %(tex)); logging.flush()
-                raise IOError, "Found file '%s' [= %s] but it failed to load as an image" \
-                    % (tex, os.path.abspath(tex))#ensure we quit
+            preloaded = imagePreloader.fetch(tex, powerOf2=resizeImages)#already decoded in the background?
+            if preloaded is not None:
+                im, origSize = preloaded
+            else:
+                try:
+                    im = Image.open(tex)
+                    im = im.transpose(Image.FLIP_TOP_BOTTOM)
+                except IOError:
+                    logging.error("Found file '%s' but failed to load as an image" %(tex)); logging.flush()
+                    raise IOError, "Found file '%s' [= %s] but it failed to load as an image" \
+                        % (tex, os.path.abspath(tex))#ensure we quit
+                origSize=im.size
+                if resizeImages:
+                    im = _resizeToPowerOf2(im, tex)
         else:
             # can't be a file; maybe its an image already in memory?
             try:
@@ -6388,21 +7770,12 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
             except AttributeError: # nope, not an image in memory
                 logging.error("Couldn't make sense of requested PatchStim."); logging.flush()
                 raise AttributeError, "Couldn't make sense of requested PatchStim."#ensure we quit
+            origSize=im.size
+            if resizeImages:
+                im = _resizeToPowerOf2(im, tex)
         # at this point we have a valid im
-        stim.origSize=im.size
-        #is it 1D?
-        if im.size[0]==1 or im.size[1]==1:
-            logging.error("Only 2D textures are supported at the moment")
-        else:
-            maxDim = max(im.size)
-            powerOf2 = int(2**numpy.ceil(numpy.log2(maxDim)))
-            if im.size[0]!=powerOf2 or im.size[1]!=powerOf2:
-                if _nImageResizes<reportNImageResizes:
-                    logging.warning("Image '%s' was not a square power-of-two image. Linearly interpolating to be %ix%i" %(tex, powerOf2, powerOf2))
-                elif _nImageResizes==reportNImageResizes:
-                    logging.warning("Multiple images have needed resizing - I'll stop bothering you!")
-                _nImageResizes+=1
-                im=im.resize([powerOf2,powerOf2],Image.BILINEAR)
+        stim.origSize=origSize
+        fromImage = True
 
         #is it Luminance or RGB?
         if im.mode=='L':
@@ -6462,16 +7835,23 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
         dataType = GL.GL_UNSIGNED_BYTE
         #can't use float_uint8 - do it manually
         data = numpy.around(255*stim.opacity*(0.5+0.5*intensity)).astype(numpy.uint8)
+    if fromImage and dataType==GL.GL_FLOAT and getattr(stim.win, '_haveHalfFloat', False):
+        #8bit images lose nothing as 16bit floats, which halves upload and memory
+        data = data.astype(numpy.float16)
+        dataType = GL.GL_HALF_FLOAT_ARB
+        if internalFormat==GL.GL_RGB32F_ARB: internalFormat=GL.GL_RGB16F_ARB
     #check for RGBA textures
     if len(intensity.shape)>2 and intensity.shape[2] == 4:
         if pixFormat==GL.GL_RGB: pixFormat=GL.GL_RGBA
         if internalFormat==GL.GL_RGB: internalFormat=GL.GL_RGBA
         elif internalFormat==GL.GL_RGB32F_ARB: internalFormat=GL.GL_RGBA32F_ARB
+        elif internalFormat==GL.GL_RGB16F_ARB: internalFormat=GL.GL_RGBA16F_ARB
 
     texture = data.ctypes#serialise
 
     #bind the texture in openGL
     GL.glEnable(GL.GL_TEXTURE_2D)
+    GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)#rows of NPOT ubyte textures needn't be 4-byte aligned
     GL.glBindTexture(GL.GL_TEXTURE_2D, id)#bind that name to the target
     GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_WRAP_S,GL.GL_REPEAT) #makes the texture map wrap (this is actually default anyway)
     #important if using bits++ because GL_LINEAR
@@ -6497,6 +7877,391 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None):
 
     GL.glTexEnvi(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_MODULATE)#?? do we need this - think not!
 
+    if cacheKey is not None:
+        textureCache.add(cacheKey, id, data.nbytes, stim)
+
+def _resizeToPowerOf2(im, name):
+    """Returns the PIL image resized (if needed) to be a square power-of-two,
+    as needed by createTexture()
+    """
+    global _nImageResizes
+    #is it 1D?
+    if im.size[0]==1 or im.size[1]==1:
+        logging.error("Only 2D textures are supported at the moment")
+        return im
+    maxDim = max(im.size)
+    powerOf2 = int(2**numpy.ceil(numpy.log2(maxDim)))
+    if im.size[0]!=powerOf2 or im.size[1]!=powerOf2:
+        if _nImageResizes<reportNImageResizes:
+            logging.warning("Image '%s' was not a square power-of-two image. Linearly interpolating to be %ix%i" %(name, powerOf2, powerOf2))
+        elif _nImageResizes==reportNImageResizes:
+            logging.warning("Multiple images have needed resizing - I'll stop bothering you!")
+        _nImageResizes+=1
+        im=im.resize([powerOf2,powerOf2],Image.BILINEAR)
+    return im
+
+def _needPowerOf2Textures():
+    """True if any open Window can't use non-power-of-two textures"""
+    for win in openWindows:
+        if not getattr(win, '_haveNPOT', False):
+            return True
+    return len(openWindows)==0
+
+class ImagePreloader:
+    """Decodes (and resizes) image files on background threads so that they are
+    ready before they're needed. When a PatchStim (or similar) then calls
+    setTex(fileName), or a SimpleImageStim calls setImage(fileName), for a
+    preloaded file only the upload to the graphics card happens in your trial
+    loop. The upload itself always stays on the main thread (with the openGL
+    context).
+
+    Use the module instance, `visual.imagePreloader`, e.g.::
+
+        imagePreloader.preload(['face1.jpg','face2.jpg'])
+        #or, at the start of each trial, the images needed for the next 2 trials
+        imagePreloader.preloadTrials(trials, keys=['image'], nAhead=2)
+        ...
+        print imagePreloader.getStats()
+
+    Each preloaded image is used once (it is then discarded) and at most
+    `maxImages` are held in memory, the oldest being dropped first.
+    """
+    def __init__(self, nThreads=2, maxImages=20):
+        self.nThreads=nThreads
+        self.maxImages=maxImages
+        self.hits=0#image was ready
+        self.waits=0#image was still being decoded when needed
+        self.misses=0#image was never preloaded
+        self.decodeTimes=[]#secs taken to decode (and resize) each image that was used
+        self._images={}#key:entry (a dict with a threading.Event, 'done')
+        self._order=[]#keys in the order they were requested
+        self._lock=threading.Lock()
+        self._queue=Queue.Queue()
+        self._threads=[]
+    def _getKey(self, fileName):
+        return (os.path.abspath(fileName), os.path.getmtime(fileName))
+    def preload(self, fileNames):
+        """Start decoding a file (or list of files) in the background. Anything
+        that isn't an existing file (or is already preloading) is ignored.
+        """
+        if type(fileNames) not in [list, tuple]:
+            fileNames=[fileNames]
+        for fileName in fileNames:
+            if type(fileName) not in [str, unicode, numpy.string_] or not os.path.isfile(fileName):
+                continue
+            key = self._getKey(fileName)
+            self._lock.acquire()
+            try:
+                if key in self._images:
+                    continue
+                entry = {'done':threading.Event()}
+                self._images[key]=entry
+                self._order.append(key)
+                while len(self._order)>self.maxImages:
+                    del self._images[self._order.pop(0)]
+            finally:
+                self._lock.release()
+            self._startThreads()
+            self._queue.put((fileName, entry))
+    def preloadTrials(self, trials, keys=None, nAhead=2):
+        """Preload the image files for the upcoming trials of a
+        :class:`~psychopy.data.TrialHandler`, using trials.getFutureTrial()
+
+        :Parameters:
+            keys : a list of the condition names that hold image file names
+                (if None, all values of the conditions are checked for files)
+            nAhead : how many trials ahead to preload
+        """
+        for n in range(1, nAhead+1):
+            thisTrial = trials.getFutureTrial(n)
+            if thisTrial is None:
+                break
+            if keys is None:
+                self.preload(thisTrial.values())
+            else:
+                self.preload([thisTrial[key] for key in keys])
+    def fetch(self, fileName, powerOf2=True):
+        """Returns (image, origSize) for a preloaded file, or None if it wasn't
+        preloaded. If the file is still being decoded this waits for it.
+
+        The image is flipped ready for openGL and, if powerOf2, resized for
+        createTexture().
+        """
+        key = self._getKey(fileName)
+        self._lock.acquire()
+        try:
+            entry = self._images.pop(key, None)
+            if entry is not None:
+                self._order.remove(key)
+        finally:
+            self._lock.release()
+        if entry is None:
+            self.misses+=1
+            return None
+        if entry['done'].isSet():
+            self.hits+=1
+        else:
+            self.waits+=1
+            entry['done'].wait()
+        if 'error' in entry:
+            return None#let the caller load it and raise a helpful error
+        self.decodeTimes.append(entry['decodeTime'])
+        if powerOf2:
+            if 'pow2Image' not in entry:
+                entry['pow2Image'] = _resizeToPowerOf2(entry['image'], fileName)
+            return entry['pow2Image'], entry['origSize']
+        return entry['image'], entry['origSize']
+    def getStats(self):
+        """Returns a dict with the number of hits, waits and misses and the
+        mean and max time (secs) taken to decode the images that were used
+        """
+        stats = {'hits':self.hits, 'waits':self.waits, 'misses':self.misses,
+            'meanDecodeTime':None, 'maxDecodeTime':None}
+        if self.decodeTimes:
+            stats['meanDecodeTime'] = numpy.mean(self.decodeTimes)
+            stats['maxDecodeTime'] = max(self.decodeTimes)
+        return stats
+    def clear(self):
+        """Discard all preloaded images (and the stats)"""
+        self._lock.acquire()
+        self._images={}
+        self._order=[]
+        self._lock.release()
+        self.hits=self.waits=self.misses=0
+        self.decodeTimes=[]
+    def _startThreads(self):
+        while len(self._threads)<self.nThreads:
+            thread = threading.Thread(target=self._decodeImages, name='ImagePreloader')
+            thread.setDaemon(True)#don't stop python from quitting
+            thread.start()
+            self._threads.append(thread)
+    def _decodeImages(self):
+        while True:
+            fileName, entry = self._queue.get()
+            t0=core.getTime()
+            try:
+                im = Image.open(fileName)
+                im = im.transpose(Image.FLIP_TOP_BOTTOM)#this also forces the decoding
+                entry['image'] = im
+                entry['origSize'] = im.size
+                if _needPowerOf2Textures():
+                    entry['pow2Image'] = _resizeToPowerOf2(im, fileName)
+            except Exception, err:
+                entry['error'] = err
+            entry['decodeTime'] = core.getTime()-t0
+            entry['done'].set()
+
+imagePreloader = ImagePreloader()
+
+class _GlyphAtlas:
+    """Glyphs of one font (at one size) stored in a few large textures, with
+    the layout of recently used strings cached.
+
+    TextStim uses this so that setText() only has to look up (or lay out) the
+    quads of the new string; the glyph textures are only uploaded when a
+    character is used for the first time. With pyglet the glyphs are rendered
+    into pyglet's own per-font textures, with pygame they are rendered
+    one at a time into textures of our own. Get one with _getGlyphAtlas().
+    """
+    def __init__(self, font, winType, antialias=True, maxLayouts=256):
+        self.font=font
+        self.winType=winType
+        self.antialias=antialias
+        self.maxLayouts=maxLayouts
+        self._index={}#char:row in the glyph tables below
+        self._quads=[]#(left,bottom,right,top) of each glyph relative to its origin
+        self._texCoords=[]#(left,bottom,right,top) in its texture
+        self._advances=[]
+        self._texIDs=[]
+        self._arrays=None#numpy versions of the tables (made when needed)
+        self._layouts={}#(text,wrapWidth,alignHoriz,alignVert):layout
+        self._layoutOrder=[]#keys of _layouts, oldest first
+        self._textures=[]#GL textures that we made (pygame only)
+        if winType=="pyglet":
+            self.ascent, self.descent = font.ascent, font.descent
+        else:
+            self.ascent, self.descent = font.get_ascent(), font.get_descent()
+            #pack the glyphs in rows into textures big enough for ~100 glyphs
+            self._texSize = int(min(2048, max(256, 2**numpy.ceil(numpy.log2(font.get_height()*10)))))
+            self._x=self._y=self._rowHeight=0
+        self.lineHeight = self.ascent-self.descent#descent is negative
+    def _addGlyphs(self, chars):
+        """Render any of `chars` that we don't have yet (and add them to the atlas)
+        """
+        chars = [c for c in set(chars) if c not in self._index]
+        if not chars:
+            return
+        if self.winType=="pyglet":
+            for c, glyph in zip(chars, self.font.get_glyphs(u''.join(chars))):
+                tc = glyph.tex_coords#12 values; u,v,r for each corner from bottom left
+                self._storeGlyph(c, glyph.vertices, (tc[0],tc[1],tc[6],tc[7]),
+                    glyph.advance, glyph.owner.id)
+        else:
+            for c in chars:
+                self._renderPygameGlyph(c)
+        self._arrays=None
+    def _storeGlyph(self, char, quad, texCoords, advance, texID):
+        self._index[char]=len(self._advances)
+        self._quads.append(quad)
+        self._texCoords.append(texCoords)
+        self._advances.append(advance)
+        self._texIDs.append(texID)
+    def _renderPygameGlyph(self, char):
+        """Render one char with pygame (white on black) and put it in our texture
+        """
+        surf = self.font.render(char, self.antialias, (255,255,255), (0,0,0))
+        w, h = surf.get_size()
+        #the red channel becomes the alpha of the glyph (rows from the bottom up)
+        alpha = numpy.fromstring(pygame.image.tostring(surf, "RGB", 1), numpy.uint8)
+        alpha = numpy.ascontiguousarray(alpha.reshape(h, w, 3)[:,:,0])
+        size = self._texSize
+        if self._x+w > size:#start a new row
+            self._x=0; self._y+=self._rowHeight; self._rowHeight=0
+        if not self._textures or self._y+h > size:#start a new texture
+            texID = GL.GLuint()
+            GL.glGenTextures(1, ctypes.byref(texID))
+            self._textures.append(texID)
+            if self.antialias: smoothing = GL.GL_LINEAR
+            else: smoothing = GL.GL_NEAREST
+            GL.glBindTexture(GL.GL_TEXTURE_2D, texID)
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_ALPHA, size, size, 0,
+                GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE, numpy.zeros([size,size], numpy.uint8).ctypes)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MAG_FILTER,smoothing)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MIN_FILTER,smoothing)
+            self._x=self._y=self._rowHeight=0
+        texID = self._textures[-1]
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texID)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, self._x, self._y, w, h,
+            GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE, alpha.ctypes)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        size = float(size)
+        self._storeGlyph(char, (0, self.ascent-h, w, self.ascent),
+            (self._x/size, self._y/size, (self._x+w)/size, (self._y+h)/size),
+            w, texID.value)
+        self._x+=w
+        self._rowHeight=max(self._rowHeight, h)
+    def _getArrays(self):
+        if self._arrays is None:
+            self._arrays = (numpy.array(self._quads, numpy.float32).reshape([-1,4]),
+                numpy.array(self._texCoords, numpy.float32).reshape([-1,4]),
+                numpy.array(self._advances, numpy.float32),
+                numpy.array(self._texIDs, numpy.uint32))
+        return self._arrays
+    def _wrapLines(self, text, wrapWidth):
+        """Split text into lines (at newlines and, to fit in wrapWidth, at spaces)
+        """
+        lines=[]
+        advances = self._advances; index = self._index
+        spaceWidth = advances[index[u' ']]
+        for paragraph in text.split(u'\n'):
+            line=[]; lineWidth=0
+            for word in paragraph.split(u' '):
+                wordWidth = sum([advances[index[c]] for c in word])
+                if line and wrapWidth and lineWidth+spaceWidth+wordWidth > wrapWidth:
+                    lines.append(u' '.join(line))
+                    line=[]; lineWidth=0
+                if line: lineWidth+=spaceWidth
+                line.append(word); lineWidth+=wordWidth
+            lines.append(u' '.join(line))
+        return lines
+    def layout(self, text, wrapWidth=None, alignHoriz='center', alignVert='center'):
+        """Returns the quads for `text`, as a dict with
+        vertices and texCoords (float32 arrays of 4 rows per glyph), groups (a list
+        of [texID, firstVertex, nVertices] to draw), width and height (pixels).
+
+        Lines are aligned around x=0 according to alignHoriz, and the block of
+        lines around y=0 according to alignVert
+        """
+        key = (text, wrapWidth, alignHoriz, alignVert)
+        if key in self._layouts:
+            return self._layouts[key]
+        self._addGlyphs(text.replace(u'\n', u'')+u' ')
+        quads, texCoords, advances, texIDs = self._getArrays()
+        lines = self._wrapLines(text, wrapWidth)
+        #the glyphs of all lines, and the pen position (origin) of each
+        indices=[]; penX=[]; penY=[]; width=0
+        y = len(lines)*self.lineHeight#top of the block...
+        if alignVert in ['center', 'centre']: y = y/2.0
+        elif alignVert=='top': y = 0
+        y -= self.ascent#...to the baseline of the first line
+        for line in lines:
+            lineIndices = [self._index[c] for c in line]
+            lineAdvances = advances[lineIndices]
+            lineWidth = float(lineAdvances.sum())
+            if alignHoriz in ['center', 'centre']: x = -lineWidth/2.0
+            elif alignHoriz=='right': x = -lineWidth
+            else: x = 0.0
+            indices.extend(lineIndices)
+            penX.append(x+numpy.cumsum(lineAdvances)-lineAdvances)
+            penY.append(numpy.zeros(len(lineIndices))+y)
+            width = max(width, lineWidth)
+            y -= self.lineHeight
+        indices = numpy.array(indices, int)
+        #draw the glyphs grouped by texture
+        order = numpy.argsort(texIDs[indices], kind='mergesort')
+        indices = indices[order]
+        penX = numpy.concatenate(penX+[[]])[order]
+        penY = numpy.concatenate(penY+[[]])[order]
+        q = quads[indices]; t = texCoords[indices]
+        vertices = numpy.empty([len(indices),4,2], numpy.float32)
+        vertices[:,:,0] = q[:,[0,2,2,0]]+penX[:,None]#corners anticlockwise from bottom left
+        vertices[:,:,1] = q[:,[1,1,3,3]]+penY[:,None]
+        coords = numpy.empty([len(indices),4,2], numpy.float32)
+        coords[:,:,0] = t[:,[0,2,2,0]]
+        coords[:,:,1] = t[:,[1,1,3,3]]
+        groups=[]
+        for texID in numpy.unique(texIDs[indices]):
+            glyphNs = numpy.flatnonzero(texIDs[indices]==texID)
+            groups.append([int(texID), int(glyphNs[0])*4, len(glyphNs)*4])
+        layout = {'vertices':vertices.reshape([-1,2]), 'texCoords':coords.reshape([-1,2]),
+            'groups':groups, 'width':width, 'height':len(lines)*self.lineHeight}
+        self._layouts[key]=layout
+        self._layoutOrder.append(key)
+        if len(self._layoutOrder)>self.maxLayouts:
+            del self._layouts[self._layoutOrder.pop(0)]
+        return layout
+    def clear(self):
+        """Delete the textures we made (the current context must be the one
+        they were made in). Pyglet's glyph textures belong to its font object.
+        """
+        for texID in self._textures:
+            GL.glDeleteTextures(1, texID)
+        self._textures=[]
+    def draw(self, layout):
+        """Draw a layout (with the current matrix, color and shader program)
+        """
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+        GL.glVertexPointer(2, GL.GL_FLOAT, 0, layout['vertices'].ctypes)
+        GL.glTexCoordPointer(2, GL.GL_FLOAT, 0, layout['texCoords'].ctypes)
+        for texID, first, nVertices in layout['groups']:
+            GL.glBindTexture(GL.GL_TEXTURE_2D, texID)
+            GL.glDrawArrays(GL.GL_QUADS, first, nVertices)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_TEXTURE_COORD_ARRAY)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+
+_glyphAtlases={}
+def _getGlyphAtlas(font, key, winType, win, antialias=True):
+    """Returns the _GlyphAtlas for this font in this window, making it if
+    needed. `key` identifies the font (e.g. name, size, bold, italic)
+    """
+    key = (id(win), winType, antialias)+tuple(key)
+    if key not in _glyphAtlases:
+        _glyphAtlases[key] = _GlyphAtlas(font, winType, antialias=antialias)
+    return _glyphAtlases[key]
+
+def _clearGlyphAtlases(win):
+    """Delete the glyph atlases of a window (call while its context is current)
+    """
+    for key in _glyphAtlases.keys():
+        if key[0]==id(win):
+            _glyphAtlases.pop(key).clear()
+
 def _setTexIfNoShaders(obj):
     """Useful decorator for classes that need to update Texture after other properties
     """
@@ -6684,3 +8449,112 @@ def getMsPerFrame(myWin, nFrames=60, showVisual=False, msg='', msDelay=0.):
 
 
 
+
+_batchWin=None#the offscreen Window of a renderBatch() worker
+def _initBatchWorker(size, winKwargs):
+    global _batchWin
+    kwargs = dict(winKwargs)
+    kwargs.setdefault('winType', 'offscreen')
+    _batchWin = Window(size, **kwargs)
+def _renderBatchItem(task):
+    """Render one row of the parameter table of renderBatch() in the worker's window
+    """
+    stimFactory, params, fileName = task
+    stims = stimFactory(_batchWin, **params)
+    if type(stims) not in [list, tuple]:
+        stims = [stims]
+    for stim in stims:
+        stim.draw()
+    frame = _batchWin.getFrameArray(buffer='back')
+    _batchWin.flip()#clears the window (and sends any log messages)
+    if fileName is None:
+        return frame
+    Image.fromarray(frame).save(fileName)
+    return fileName
+def _logBatchProgress(nDone, nTotal):
+    if nDone==nTotal or nDone%max(1, nTotal//10)==0:
+        logging.info('renderBatch: rendered %i of %i' %(nDone, nTotal))
+def renderBatch(stimFactory, conditions, size=(256,256), fileNames=None,
+        nProcesses=None, progress=True, winKwargs={}):
+    """Render an image of a stimulus for each row of a parameter table, using
+    a pool of processes that each draw into their own offscreen :class:`Window`.
+
+    :Parameters:
+
+        stimFactory:
+            a function called as stimFactory(win, **params) for each row of
+            `conditions`, returning the stimulus (or a list of stimuli, drawn in
+            order) for that row. So that the worker processes can find it, it
+            must be defined at the top level of a module (not a lambda)
+        conditions:
+            a list of dicts (e.g. from data.importConditions)
+        size:
+            the size (pixels) of the images
+        fileNames:
+            None to have the images returned as numpy arrays ([height, width, 3]
+            uint8), a name with a number format (e.g. 'patch%05i.png', numbered
+            from 1) or a list of names (any format that PIL can write)
+        nProcesses:
+            the number of worker processes (None for one per CPU). With 1 the
+            images are rendered in this process
+        progress:
+            a function called as progress(nDone, nTotal) as the images arrive,
+            True to log progress (at the info level) or False
+        winKwargs:
+            other arguments for the Windows (e.g. units, color, monitor)
+
+    Returns the arrays (or file names) in the order of `conditions`.
+
+    e.g.::
+
+        def makePatch(win, ori, sf):
+            return visual.PatchStim(win, tex='sin', mask='gauss', ori=ori, sf=sf, autoLog=False)
+
+        if __name__=='__main__':#needed where processes can't fork (windows)
+            conds = [{'ori':ori, 'sf':sf} for ori in range(0,180,10) for sf in [0.02,0.04]]
+            visual.renderBatch(makePatch, conds, fileNames='patch%03i.png', winKwargs={'units':'pix'})
+
+    On linux the workers are forked from this process, so call this before
+    opening any windows of your own.
+    """
+    global _batchWin
+    import multiprocessing, itertools
+    conditions = list(conditions)
+    nItems = len(conditions)
+    if fileNames is None:
+        fileNames = [None]*nItems
+    elif type(fileNames) in [str, unicode]:
+        fileNames = [fileNames %(n+1) for n in range(nItems)]
+    elif len(fileNames)!=nItems:
+        raise ValueError, "renderBatch needs one file name for each of the %i conditions" %nItems
+    tasks = [(stimFactory, params, fileName) for params, fileName in zip(conditions, fileNames)]
+    if nProcesses is None:
+        nProcesses = multiprocessing.cpu_count()
+    nProcesses = max(1, min(nProcesses, nItems))
+    if progress is True:
+        progress = _logBatchProgress
+
+    results = []
+    if nProcesses==1:
+        _initBatchWorker(size, winKwargs)
+        try:
+            for result in itertools.imap(_renderBatchItem, tasks):
+                results.append(result)
+                if progress: progress(len(results), nItems)
+        finally:
+            _batchWin.close()
+            _batchWin = None
+        return results
+    #send several tasks at a time (fewer messages) but not so many that workers sit idle at the end
+    chunkSize = max(1, min(16, nItems//(nProcesses*4)))
+    pool = multiprocessing.Pool(nProcesses, initializer=_initBatchWorker, initargs=(size, winKwargs))
+    try:
+        for result in pool.imap(_renderBatchItem, tasks, chunkSize):
+            results.append(result)
+            if progress: progress(len(results), nItems)
+    except:
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+    return results